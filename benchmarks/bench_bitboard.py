@@ -0,0 +1,86 @@
+"""
+Benchmark random playouts and starting board generation: c4utils' GameState
+against the bitboard engine (scalar and batched).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_bitboard --playouts 2000 --boards 10000
+"""
+import argparse
+import time
+
+import numpy as np
+from c4utils.c4_types import Move, NO_PLAYER
+from c4utils.match import GameState
+
+from c4league.bitboard import BOARD_MASK, apply_move, is_win, legal_moves, generate_starting_boards, \
+    _random_openings
+
+TRUNCATE_PROB = 0.2
+TRUNCATE_MAX = 10
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--playouts', type=int, default=2000)
+    parser.add_argument('--boards', type=int, default=10000)
+    return parser.parse_args()
+
+
+def game_state_playout(rng: np.random.Generator) -> None:
+    game_state = GameState()
+    while not game_state.is_game_over:
+        game_state.update(Move(rng.choice(np.flatnonzero(game_state.board[-1, :] == NO_PLAYER))))
+
+
+def bitboard_playout(rng: np.random.Generator) -> None:
+    bits = [0, 0]
+    occupied = 0
+    player = 0
+    while True:
+        moves = legal_moves(occupied)
+        bits[player], occupied = apply_move(bits[player], occupied, int(moves[rng.integers(len(moves))]))
+        if is_win(bits[player]) or occupied == BOARD_MASK:
+            return
+        player = 1 - player
+
+
+def batch_playouts(n: int, rng: np.random.Generator) -> None:
+    # Full games: no truncation, at most 42 moves
+    _random_openings(n, 0., 41, rng)
+
+
+def game_state_starting_board(rng: np.random.Generator) -> np.ndarray:
+    """The previous TournamentManager._generate_starting_board"""
+    while True:
+        game_state = GameState()
+        truncate = False
+        while not truncate:
+            game_state.update(Move(rng.choice(np.flatnonzero(game_state.board[-1, :] == NO_PLAYER))))
+            if game_state.is_game_over:
+                break
+            truncate = (rng.random() < TRUNCATE_PROB or
+                        np.count_nonzero(game_state.board == NO_PLAYER) < game_state.board.size - TRUNCATE_MAX)
+        else:
+            return game_state.board
+
+
+def _rate(n: int, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(0)
+    print(f'{"":<34} {"per second":>12}')
+    print(f'{"playouts, GameState":<34} {_rate(args.playouts, lambda: [game_state_playout(rng) for _ in range(args.playouts)]):>12.0f}')
+    print(f'{"playouts, bitboard":<34} {_rate(args.playouts, lambda: [bitboard_playout(rng) for _ in range(args.playouts)]):>12.0f}')
+    print(f'{"playouts, bitboard batch":<34} {_rate(args.playouts * 10, lambda: batch_playouts(args.playouts * 10, rng)):>12.0f}')
+    print(f'{"starting boards, GameState":<34} {_rate(args.boards, lambda: [game_state_starting_board(rng) for _ in range(args.boards)]):>12.0f}')
+    print(f'{"starting boards, bitboard batch":<34} {_rate(args.boards, lambda: generate_starting_boards(args.boards, TRUNCATE_PROB, TRUNCATE_MAX, rng, distinct=False)):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark serial vs. batched agent container builds against a fake Slurm, and
+batched builds with a cold vs. warm base image cache.
+
+Builds are simulated by a fake `apptainer` that sleeps for a fixed time, and
+agents are downloaded from a local directory standing in for the bucket
+(`STORAGE_BACKEND="local"`), so only the orchestration in
+`containerize_agents` is measured.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_container_builds --agents 8 --build-seconds 1
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from tests.fake_slurm import FakeSlurm
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=8)
+    parser.add_argument('--build-seconds', type=float, default=1.0)
+    parser.add_argument('--queue-delay', type=float, default=0.5)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    return parser.parse_args()
+
+
+def setup_environment(work_dir: Path, n_agents: int) -> None:
+    (work_dir / 'agents').mkdir()
+    (work_dir / 'c4utils').mkdir()
+    (work_dir / 'c4utils' / '__init__.py').touch()
+    for def_file in ['build_agent.def', 'build_agent_base.def', 'build_agent_layer.def']:
+        shutil.copy(REPO_ROOT / def_file, work_dir)
+    for i in range(n_agents):
+        write_fake_submission(work_dir / 'bucket', {'team_name': f'team{i}', 'agent_name': 'agent', 'version': '1'})
+    os.environ['C4LEAGUE_ROOT_DIR'] = str(work_dir)
+    os.environ['AGENT_CONTAINER_DIRECTORY'] = str(work_dir / 'agents')
+    os.environ['C4UTILS_DIR'] = str(work_dir / 'c4utils')
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['LOCAL_STORAGE_ROOT'] = str(work_dir / 'bucket')
+
+
+def write_fake_submission(bucket_dir: Path, agent: dict[str, str]) -> None:
+    submission_dir = bucket_dir / 'submissions' / agent['team_name'] / agent['agent_name']
+    submission_dir.mkdir(parents=True)
+    with zipfile.ZipFile(submission_dir / f"{agent['agent_name']}_v{agent['version']}.zip", 'w') as archive:
+        archive.writestr('agent/__init__.py', 'def generate_move(board, player, saved_state):\n    return 0, saved_state\n')
+        archive.writestr('requirements.txt', 'numpy\n')
+
+
+def main():
+    args = parse_args()
+    work_dir = Path(tempfile.mkdtemp(prefix='bench_builds_'))
+    setup_environment(work_dir, args.agents)
+
+    from c4league import container_utils
+    from c4league.utils import TournamentPlayer
+
+    agents = [TournamentPlayer(f'team{i}', 'agent', '1') for i in range(args.agents)]
+    timings = {}
+    old_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        with FakeSlurm(queue_delay=args.queue_delay) as slurm:
+            slurm.add_command('apptainer', f'#!/bin/bash\nsleep {args.build_seconds}\ntouch "$2"\n')
+
+            start = time.perf_counter()
+            for agent in agents:
+                container_utils.containerize_agents([agent], poll_interval=args.poll_interval, use_cache=False)
+            timings['serial'] = time.perf_counter() - start
+            container_utils.remove_old_agents(agents)
+
+            start = time.perf_counter()
+            results = container_utils.containerize_agents(agents, poll_interval=args.poll_interval, use_cache=False)
+            timings['parallel'] = time.perf_counter() - start
+            assert all(results.values()), 'Some fake builds failed'
+            container_utils.remove_old_agents(agents)
+
+            for mode in ['cold cache', 'warm cache']:
+                start = time.perf_counter()
+                results = container_utils.containerize_agents(agents, poll_interval=args.poll_interval)
+                timings[mode] = time.perf_counter() - start
+                assert all(results.values()), 'Some fake builds failed'
+                container_utils.remove_old_agents(agents)
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f'\nBuilt {args.agents} agents (build {args.build_seconds}s, queue delay {args.queue_delay}s, '
+          f'poll interval {args.poll_interval}s)')
+    for mode, seconds in timings.items():
+        print(f'{mode:>10}: {seconds:7.2f}s')
+    print(f'   speedup: {timings["serial"] / timings["parallel"]:7.2f}x (parallel vs. serial)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark results ingestion with 1 to N workers on a synthetic results tree.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ingestion --matches 5000 --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from c4league.utils import TournamentPlayer
+from c4league.storage.stats import GameStats
+from c4league.storage.aggregation import TournamentAggregator
+
+TOURNAMENT_ID = 'tbench'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--matches', type=int, default=5000)
+    parser.add_argument('--agents', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--results-dir', type=str, default=None,
+                        help='Where to generate the tree (e.g. on the shared file system), defaults to a temp dir')
+    return parser.parse_args()
+
+
+def generate_results_tree(results_dir: Path, n_matches: int, n_agents: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    agents = [TournamentPlayer(f'team{i}', 'agent', '1') for i in range(n_agents)]
+    board = np.zeros((6, 7), dtype=np.int8)
+    match_ids = []
+    for m in range(n_matches):
+        match_id = f'{TOURNAMENT_ID}_m{m:05d}'
+        match_dir = results_dir / match_id
+        match_dir.mkdir(parents=True)
+        player_a, player_b = rng.sample(agents, 2)
+        for g in range(4):
+            player1, player2 = (player_a, player_b) if g % 2 == 0 else (player_b, player_a)
+            moves = [rng.randrange(7) for _ in range(rng.randrange(7, 42))]
+            game = GameStats(
+                game_id=f'{match_id}_g{g:05d}',
+                match_id=match_id,
+                tournament_id=TOURNAMENT_ID,
+                timestamp=f'2024-01-01-12:{m % 60:02d}:{g:02d}',
+                player1=player1,
+                player2=player2,
+                initial_board=board,
+                moves=moves,
+                winner=rng.choice([player1, player2, None]),
+                reason='Connect 4',
+                traceback=None
+            )
+            with open(match_dir / f'{game.game_id}.json', 'w', encoding='utf-8') as f:
+                json.dump(game.generate_json(), f, ensure_ascii=False, indent=4)
+        match_ids.append(match_id)
+    return match_ids
+
+
+def main():
+    args = parse_args()
+    root = Path(tempfile.mkdtemp(prefix='bench_ingestion_', dir=args.results_dir))
+    try:
+        print(f'Generating {args.matches} matches in {root}...')
+        match_ids = generate_results_tree(root, args.matches, args.agents)
+
+        baseline = None
+        reference_output = None
+        print(f'{"workers":>8} {"seconds":>8} {"matches/s":>10} {"speedup":>8}')
+        for workers in args.workers:
+            for match_id in match_ids:
+                (root / match_id / f'{match_id}.json').unlink(missing_ok=True)
+            os.sync()
+            aggregator = TournamentAggregator(TOURNAMENT_ID, root)
+            start = time.perf_counter()
+            aggregator.ingest_matches(match_ids, workers=workers)
+            output = json.dumps(aggregator.get_tournament_stats(match_order=match_ids).generate_json())
+            seconds = time.perf_counter() - start
+
+            baseline = baseline or seconds
+            reference_output = reference_output or output
+            assert output == reference_output, f'Output with {workers} workers differs'
+            print(f'{workers:>8} {seconds:>8.2f} {len(match_ids) / seconds:>10.0f} {baseline / seconds:>7.2f}x')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
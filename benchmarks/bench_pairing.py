@@ -0,0 +1,90 @@
+"""
+Simulate tournaments between synthetic agents of known strength and compare
+pairing strategies: ranking accuracy (Spearman correlation between true
+strength and final table, and how often the strongest agent wins) against the
+number of matches played.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pairing --agents 100 --rounds 5 7 9 12
+"""
+import argparse
+import itertools
+import math
+
+import numpy as np
+
+from c4league.utils import TournamentPlayer
+from c4league.params import MINI_MATCH_GAMES
+from c4league.pairing import PairingStrategy, RoundRobinPairing, SwissPairing, played_pairs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=100)
+    parser.add_argument('--rounds', type=int, nargs='+', default=None,
+                        help='Numbers of Swiss rounds to compare, defaults to log2(N) + 0, 2, 4, 8')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--draw-prob', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def simulate_match(strength1: float, strength2: float, draw_prob: float, rng: np.random.Generator) -> float:
+    """Score of the first agent over a mini match, Elo-style win probability per game"""
+    win_prob = (1 - draw_prob) / (1 + 10 ** ((strength2 - strength1) / 400))
+    outcomes = rng.random(MINI_MATCH_GAMES)
+    return float(np.sum(outcomes < win_prob) + 0.5 * np.sum((outcomes >= win_prob) & (outcomes < win_prob + draw_prob)))
+
+
+def run_tournament(strategy: PairingStrategy, strengths: dict[TournamentPlayer, float], draw_prob: float,
+                   rng: np.random.Generator) -> tuple[dict[TournamentPlayer, float], int]:
+    participants = list(strengths)
+    scores = {player: 0. for player in participants}
+    played = set()
+    n_matches = 0
+    for round_number in itertools.count(1):
+        pairings = strategy.next_round(round_number, participants, scores, played)
+        if len(pairings) == 0:
+            return scores, n_matches
+        for player1, player2 in pairings:
+            score = simulate_match(strengths[player1], strengths[player2], draw_prob, rng)
+            scores[player1] += score
+            scores[player2] += MINI_MATCH_GAMES - score
+        played |= played_pairs(pairings)
+        n_matches += len(pairings)
+
+
+def spearman(x: np.ndarray, y: np.ndarray) -> float:
+    rank_x = np.argsort(np.argsort(x))
+    rank_y = np.argsort(np.argsort(y + 1e-9 * np.random.default_rng(0).random(len(y))))    # random tie break
+    return float(np.corrcoef(rank_x, rank_y)[0, 1])
+
+
+def evaluate(name: str, make_strategy, args) -> None:
+    rng = np.random.default_rng(args.seed)
+    correlations, top_found, n_matches = [], [], []
+    for _ in range(args.repeats):
+        strengths = {TournamentPlayer(f'team{i}', 'agent', '1'): strength
+                     for i, strength in enumerate(rng.normal(0, 200, args.agents))}
+        scores, _n_matches = run_tournament(make_strategy(), strengths, args.draw_prob, rng)
+        players = list(strengths)
+        correlations.append(spearman(np.array([strengths[p] for p in players]), np.array([scores[p] for p in players])))
+        top_found.append(max(players, key=scores.get) == max(players, key=strengths.get))
+        n_matches.append(_n_matches)
+    print(f'{name:<18} {np.mean(n_matches):>8.0f} {np.mean(correlations):>10.3f} {np.mean(top_found):>10.2f}')
+
+
+def main():
+    args = parse_args()
+    log_n = math.ceil(math.log2(args.agents))
+    rounds = args.rounds or [log_n, log_n + 2, log_n + 4, log_n + 8]
+    print(f'{args.agents} agents, {args.repeats} simulated tournaments per strategy')
+    print(f'{"strategy":<18} {"matches":>8} {"spearman":>10} {"top found":>10}')
+    evaluate('round robin', RoundRobinPairing, args)
+    for n_rounds in rounds:
+        evaluate(f'swiss ({n_rounds} rounds)', lambda: SwissPairing(n_rounds, seed=args.seed), args)
+
+
+if __name__ == '__main__':
+    main()
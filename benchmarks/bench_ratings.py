@@ -0,0 +1,62 @@
+"""
+Benchmark the Bradley-Terry rating fit on synthetic results.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ratings --agents 1000 --games 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from c4league.storage.ratings import RatingState
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=1000)
+    parser.add_argument('--games', type=int, default=1000000)
+    parser.add_argument('--batches', type=int, default=10,
+                        help='The games are added in this many batches, refitting after each one')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    true_ratings = rng.normal(0, 200, args.agents)
+    players = np.array([f'team{i}_agent_v1' for i in range(args.agents)])
+    players1 = rng.integers(0, args.agents, args.games)
+    players2 = (players1 + rng.integers(1, args.agents, args.games)) % args.agents
+    # Draws are split evenly from wins and losses, keeping the expected score of the Bradley-Terry model
+    expected_score = 1 / (1 + 10 ** ((true_ratings[players2] - true_ratings[players1]) / 400))
+    draw_prob = np.minimum(0.1, 2 * np.minimum(expected_score, 1 - expected_score))
+    outcomes = rng.random(args.games)
+    scores = (outcomes < expected_score - draw_prob / 2) + 0.5 * (np.abs(outcomes - expected_score) < draw_prob / 2)
+
+    state = RatingState()
+    batches = np.array_split(np.arange(args.games), args.batches)
+    for k, batch in enumerate(batches):
+        start = time.perf_counter()
+        state.add_games(players[players1[batch]], players[players2[batch]], scores[batch])
+        added = time.perf_counter()
+        n_iterations = state.fit()
+        fitted = time.perf_counter()
+        ratings = state.get_ratings()
+        reported = time.perf_counter()
+        print(f'batch {k + 1}/{len(batches)}: add {added - start:.2f}s, fit {fitted - added:.2f}s '
+              f'({n_iterations} iterations), ratings + CIs {reported - fitted:.2f}s')
+
+    fitted_ratings = {row['player']: row['rating'] for row in ratings}
+    estimates = np.array([fitted_ratings[player] for player in players])
+    error = estimates - estimates.mean() - (true_ratings - true_ratings.mean())
+    coverage = np.mean([row['ci_low'] - 1500 <= true_ratings[int(row['player'][4:].split('_')[0])]
+                        - true_ratings.mean() <= row['ci_high'] - 1500 for row in ratings])
+    print(f'{args.agents} agents, {args.games} games: rating RMSE {np.sqrt(np.mean(error ** 2)):.1f} Elo, '
+          f'95% CI coverage {coverage:.2f}')
+
+
+if __name__ == '__main__':
+    main()
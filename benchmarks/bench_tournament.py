@@ -0,0 +1,267 @@
+"""
+End-to-end tournament benchmark: drives `TournamentManager` through a whole
+tournament between N synthetic agents, against the fake Slurm from
+`tests/fake_slurm.py` (or the local executor) and a fake `apptainer`.
+
+Agents are directories named like SIF files, holding an `agent.py` that plays
+random legal moves after an exponentially distributed think time (mean
+`--move-ms`) and raises with probability `--failure-rate` per move, or on
+every move for the first `--broken-agents` agents (quarantined by the
+circuit breaker after `--quarantine-failures` failed games, see
+`c4league.quarantine`). The fake
+`apptainer exec <image> <command>` runs the command inside that directory, so
+matches are played by the real `run_match.py` with warm agent sessions
+(`WARM_AGENTS="1"`; `c4utils.match.play_match` cannot be pointed at fake
+containers).
+
+Measured: pairing generation, manager setup (pairing and config file) and job
+script generation, job tracking overhead (CPU time of the manager while
+waiting, excluding ingestion), online and offline ingestion throughput, results
+processing and peak memory. Every run is appended as one JSON line to
+`--output` together with its configuration and the git commit, and compared
+with the previous run of the same configuration.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_tournament --agents 16 --move-ms 1 --matches-per-task 4
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from tests.fake_slurm import FakeSlurm
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_OUTPUT = REPO_ROOT / 'benchmarks' / 'bench_tournament.jsonl'
+
+FAKE_APPTAINER = '''#!/bin/bash
+# apptainer exec [--options] <image> <command...>: run the command inside the image directory
+shift
+while [[ "$1" == --* ]]; do shift; done
+cd "$1" || exit 255
+shift
+exec "$@"
+'''
+
+FAKE_AGENT = '''import random
+import time
+import numpy as np
+
+MOVE_SECONDS = {move_seconds}
+FAILURE_RATE = {failure_rate}
+
+def generate_move(board, player, saved_state):
+    if MOVE_SECONDS > 0:
+        time.sleep(random.expovariate(1 / MOVE_SECONDS))
+    if random.random() < FAILURE_RATE:
+        raise RuntimeError('Synthetic agent failure')
+    return int(random.choice(np.flatnonzero(board[-1] == 0))), saved_state
+'''
+
+# Metrics compared with the previous run of the same configuration
+TRACKED_METRICS = ['pairing_s', 'setup_s', 'job_script_s', 'tracking_cpu_s', 'ingest_matches_per_s',
+                   'process_results_s', 'total_s', 'peak_rss_mb']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=16)
+    parser.add_argument('--move-ms', type=float, default=1.0, help='Mean think time of the fake agents')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Probability of an agent error per move')
+    parser.add_argument('--broken-agents', type=int, default=0, help='Agents failing on every move')
+    parser.add_argument('--quarantine-failures', type=int, default=8, help='Circuit breaker threshold, 0 disables it')
+    parser.add_argument('--matches-per-task', type=int, default=4)
+    parser.add_argument('--pairing', choices=['round_robin', 'swiss'], default='round_robin')
+    parser.add_argument('--executor', choices=['slurm', 'local'], default='slurm',
+                        help='Fake Slurm (sbatch/sacct shims) or the local process pool')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Concurrently running array tasks')
+    parser.add_argument('--node-workers', type=int, default=0,
+                        help='Run the tasks through this many node workers instead of as array tasks')
+    parser.add_argument('--queue-delay', type=float, default=0.2, help='Fake Slurm queueing delay per task')
+    parser.add_argument('--ingest-workers', type=int, default=1)
+    parser.add_argument('--output', type=str, default=str(DEFAULT_OUTPUT), help='JSONL file results are appended to')
+    parser.add_argument('--verbose', action='store_true', help='Show the tournament manager output')
+    return parser.parse_args()
+
+
+def setup_environment(work_dir: Path, args) -> None:
+    agents_dir = work_dir / 'agents'
+    agents_dir.mkdir()
+    for i in range(args.agents):
+        agent_dir = agents_dir / f'team{i}_agent_1.sif'
+        agent_dir.mkdir()
+        failure_rate = 1.0 if i < args.broken_agents else args.failure_rate
+        (agent_dir / 'agent.py').write_text(FAKE_AGENT.format(move_seconds=args.move_ms / 1000,
+                                                              failure_rate=failure_rate))
+    for script in ['run_match.py', 'node_worker.py']:
+        (work_dir / script).symlink_to(REPO_ROOT / script)
+    (work_dir / 'run_match.sif').touch()
+    for name in ['results', 'logs', 'scripts', 'configs']:
+        (work_dir / name).mkdir()
+    os.environ.update({
+        'C4LEAGUE_ROOT_DIR': str(work_dir),
+        'AGENT_CONTAINER_DIRECTORY': str(agents_dir),
+        'TOURNAMENT_RESULTS_DIRECTORY': str(work_dir / 'results'),
+        'TOURNAMENT_LOGS_DIRECTORY': str(work_dir / 'logs'),
+        'TOURNAMENT_JOB_SCRIPT_DIRECTORY': str(work_dir / 'scripts'),
+        'TOURNAMENT_CONFIG_DIRECTORY': str(work_dir / 'configs'),
+        'EXECUTOR': args.executor,
+        'LOCAL_WORKERS': str(args.workers),
+        'PYTHONPATH': os.pathsep.join([str(REPO_ROOT)] + [p for p in [os.getenv('PYTHONPATH')] if p]),
+    })
+
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_tournament(args, timings: dict[str, float]) -> dict:
+    """Run one tournament with timing hooks around the manager's phases"""
+    from c4league.tournament_manager import TournamentManager
+    from c4league.pairing import get_pairing_strategy
+    from c4league.container_utils import get_containerized_agents
+    from c4league.storage.aggregation import TournamentAggregator
+
+    class BenchTournamentManager(TournamentManager):
+        matches_per_task = args.matches_per_task
+        warm_agents = True
+        pairing = args.pairing
+        ingest_workers = args.ingest_workers
+        completion_poll_interval = 0.1
+        scheduler_check_interval = 2.0
+        retry_backoff_seconds = 0.0
+        node_workers = args.node_workers
+        quarantine_failures = args.quarantine_failures
+
+        def _create_job_script(self):
+            start = time.perf_counter()
+            try:
+                return super()._create_job_script()
+            finally:
+                timings['job_script_s'] += time.perf_counter() - start
+
+        def wait_for_all_jobs(self, tournament_job_id, task_ids=None):
+            start, start_cpu = time.perf_counter(), time.process_time()
+            try:
+                return super().wait_for_all_jobs(tournament_job_id, task_ids)
+            finally:
+                timings['tracking_s'] += time.perf_counter() - start
+                timings['tracking_cpu_s'] += time.process_time() - start_cpu
+
+        def _ingest_finished_tasks(self, task_ids):
+            start, start_cpu = time.perf_counter(), time.process_time()
+            try:
+                super()._ingest_finished_tasks(task_ids)
+            finally:
+                timings['online_ingest_s'] += time.perf_counter() - start
+                # Ingestion runs inside the tracking loop, keep it out of the tracking overhead
+                timings['tracking_cpu_s'] -= time.process_time() - start_cpu
+
+        def process_results(self):
+            start = time.perf_counter()
+            try:
+                super().process_results()
+            finally:
+                timings['process_results_s'] += time.perf_counter() - start
+
+    participants = get_containerized_agents()
+    start = time.perf_counter()
+    get_pairing_strategy(args.pairing).next_round(1, participants, {}, set())
+    timings['pairing_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    manager = BenchTournamentManager()
+    timings['setup_s'] = time.perf_counter() - start
+    manager.run_tournament()
+    timings['total_s'] = time.perf_counter() - start
+
+    # Offline ingestion of the finished tournament, as when reprocessing results
+    match_ids = [match_id for match_id in manager.matches if manager.aggregator.has_match(match_id)]
+    for match_id in match_ids:
+        (manager.results_dir / match_id / f'{match_id}.json').unlink(missing_ok=True)
+    aggregator = TournamentAggregator(manager.tournament_id, manager.results_dir, manager.match_format)
+    start = time.perf_counter()
+    aggregator.ingest_matches(match_ids, workers=args.ingest_workers)
+    ingest_seconds = time.perf_counter() - start
+    return {
+        'matches': len(manager.matches),
+        'tasks': manager._get_n_tasks(),
+        'incomplete_matches': len(manager.incomplete_matches),
+        'forfeited_matches': sum(match_stats.forfeited_by is not None
+                                 for match_stats in manager.aggregator.match_stats.values()),
+        'ingest_matches_per_s': len(match_ids) / ingest_seconds if ingest_seconds > 0 else None,
+    }
+
+
+def compare_with_previous(output_path: Path, result: dict) -> None:
+    previous = None
+    if output_path.exists():
+        with open(output_path, 'r') as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry['config'] == result['config']:
+                    previous = entry
+    if previous is None:
+        print('No earlier run with this configuration to compare with')
+        return
+    print(f"Change vs. {previous['timestamp']} (commit {previous['commit']}):")
+    for metric in TRACKED_METRICS:
+        old, new = previous['metrics'].get(metric), result['metrics'].get(metric)
+        if old and new is not None:
+            print(f'{metric:>22}: {old:10.3f} -> {new:10.3f} ({100 * (new - old) / old:+6.1f}%)')
+
+
+def main():
+    args = parse_args()
+    work_dir = Path(tempfile.mkdtemp(prefix='bench_tournament_'))
+    setup_environment(work_dir, args)
+    timings = dict.fromkeys(['job_script_s', 'tracking_s', 'tracking_cpu_s', 'online_ingest_s',
+                             'process_results_s'], 0.)
+    old_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        with FakeSlurm(queue_delay=args.queue_delay, max_running=args.workers) as slurm:
+            slurm.add_command('apptainer', FAKE_APPTAINER)
+            slurm.add_command('python3', f'#!/bin/sh\nexec "{sys.executable}" "$@"\n')
+            print(f'Running a {args.pairing} tournament of {args.agents} agents ({args.executor} executor)...')
+            with open(work_dir / 'manager.log', 'w') as log, \
+                    contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log):
+                counts = run_tournament(args, timings)
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    metrics = dict(timings, **counts)
+    metrics['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    metrics['peak_task_rss_mb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    result = {
+        'benchmark': 'tournament',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': get_git_commit(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'verbose')},
+        'metrics': metrics,
+    }
+    for key, value in metrics.items():
+        print(f'{key:>22}: {value:10.3f}' if isinstance(value, float) else f'{key:>22}: {value}')
+    output_path = Path(args.output)
+    compare_with_previous(output_path, result)
+    with open(output_path, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+    print(f'Results appended to {output_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""
+Persistent agent processes for playing several games without container cold starts.
+
+An `AgentSession` starts an agent container once and keeps a small server
+running inside it, which answers move requests over stdin/stdout with one JSON
+object per line:
+
+    -> {"cmd": "move", "board": [...], "dtype": "int8", "player": 1}
+    <- {"move": 3}  or  {"error": "<traceback>"}
+    -> {"cmd": "reset"}    (new game: drops the agent's saved state)
+    <- {"ok": true}
+
+Imports and loaded models stay warm between games. The per-move timeout is
+enforced on the host side, and an agent that times out or crashes is killed
+and restarted cleanly before its next game.
+
+Sessions also measure their startup time, and read the peak RSS and CPU time
+of the container's processes from /proc (Linux only) after every move.
+"""
+import json
+import os
+import selectors
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+from c4utils.c4_types import Board, Move, Player, PLAYER1, PLAYER2
+
+from c4league.bitboard import BOARD_MASK, FIRST_PLAYER, apply_move, from_board, is_win, to_board
+from c4league.storage.stats import GameMetrics
+
+STARTUP_TIMEOUT = 300.0
+# Extra time on top of the move timeout for the round trip through the pipe
+MOVE_TIMEOUT_GRACE = 0.5
+
+AGENT_SERVER_SOURCE = '''
+import json, sys, traceback
+import numpy as np
+protocol_out = sys.stdout
+sys.stdout = sys.stderr
+from agent import generate_move
+saved_state = None
+protocol_out.write(json.dumps({"ready": True}) + "\\n")
+protocol_out.flush()
+for line in sys.stdin:
+    request = json.loads(line)
+    if request["cmd"] == "stop":
+        break
+    if request["cmd"] == "reset":
+        saved_state = None
+        reply = {"ok": True}
+    else:
+        dtype = np.dtype(request["dtype"])
+        board = np.array(request["board"], dtype=dtype).reshape(6, 7)
+        try:
+            move = generate_move(board, dtype.type(request["player"]), saved_state)
+            if isinstance(move, tuple):
+                move, saved_state = move
+            reply = {"move": int(move)}
+        except Exception as e:
+            reply = {"error": "".join(traceback.format_exception(e))}
+    protocol_out.write(json.dumps(reply) + "\\n")
+    protocol_out.flush()
+'''
+
+
+class MoveTimeoutError(Exception):
+    pass
+
+
+class AgentRuntimeError(Exception):
+    pass
+
+
+class InvalidMoveError(Exception):
+    pass
+
+
+def _session_pids(session_id: int) -> list[int]:
+    """Processes of a session, i.e. the container started with `start_new_session`"""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[3]) == session_id:
+            pids.append(int(entry))
+    return pids
+
+
+def _process_usage(pids: list[int]) -> tuple[int, float] | None:
+    """Peak RSS (kB, of the largest process) and total CPU time (s) of running processes"""
+    peak_rss_kb, cpu_ticks, found = 0, 0, False
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{pid}/status', 'r') as f:
+                status = f.read()
+        except (OSError, IndexError):
+            continue
+        found = True
+        # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+        cpu_ticks += int(fields[11]) + int(fields[12])
+        for line in status.splitlines():
+            if line.startswith('VmHWM:'):
+                peak_rss_kb = max(peak_rss_kb, int(line.split()[1]))
+    return (peak_rss_kb, cpu_ticks / os.sysconf('SC_CLK_TCK')) if found else None
+
+
+class AgentSession:
+    """A long-lived agent container answering move requests"""
+
+    def __init__(self, sif_path: Path, startup_timeout: float = STARTUP_TIMEOUT):
+        self.sif_path = Path(sif_path)
+        self.startup_timeout = startup_timeout
+        self.process: subprocess.Popen | None = None
+        self._buffer = b''
+        self._pids: list[int] = []
+        self.startup_seconds: float | None = None
+        # (peak RSS in kB, CPU seconds) at the start of the current game and at the latest sample
+        self.usage_at_reset: tuple[int, float] | None = None
+        self.last_usage: tuple[int, float] | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def _command(self) -> list[str]:
+        return ['apptainer', 'exec', '--containall', '--cleanenv', str(self.sif_path),
+                'python3', '-u', '-c', AGENT_SERVER_SOURCE]
+
+    def start(self) -> None:
+        """Start the container and wait until the agent has been imported"""
+        self._buffer = b''
+        self.startup_seconds = None
+        start = time.perf_counter()
+        self.process = subprocess.Popen(
+            self._command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None,
+            start_new_session=True
+        )
+        try:
+            reply = self._read_reply(time.monotonic() + self.startup_timeout)
+        except MoveTimeoutError:
+            self.stop()
+            raise AgentRuntimeError(f'Agent {self.sif_path.name} did not start within {self.startup_timeout}s')
+        if not reply.get('ready'):
+            self.stop()
+            raise AgentRuntimeError(f'Agent {self.sif_path.name} failed to start: {reply}')
+        self.startup_seconds = time.perf_counter() - start
+        self._pids = _session_pids(self.process.pid) if os.path.isdir('/proc') else []
+
+    def ensure_started(self) -> None:
+        if not self.is_running:
+            self.start()
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.write(b'{"cmd": "stop"}\n')
+                self.process.stdin.flush()
+                self.process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self._kill()
+        self.process = None
+
+    def _kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, 9)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+    def _send(self, request: dict) -> None:
+        try:
+            self.process.stdin.write(json.dumps(request).encode() + b'\n')
+            self.process.stdin.flush()
+        except OSError as e:
+            raise AgentRuntimeError(f'Agent {self.sif_path.name} exited unexpectedly') from e
+
+    def _read_reply(self, deadline: float) -> dict:
+        stdout = self.process.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(stdout, selectors.EVENT_READ)
+            while b'\n' not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(timeout=remaining):
+                    raise MoveTimeoutError(f'Agent {self.sif_path.name} did not reply in time')
+                chunk = os.read(stdout, 65536)
+                if not chunk:
+                    raise AgentRuntimeError(f'Agent {self.sif_path.name} exited unexpectedly')
+                self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError as e:
+            # e.g. output of a subprocess of the agent, the agent loses the game instead of the task failing
+            raise AgentRuntimeError(f'Agent {self.sif_path.name} sent an invalid reply: {line[:200]!r}') from e
+
+    def reset(self) -> None:
+        """Start a new game: keep the process, drop the agent's saved state"""
+        self.ensure_started()
+        self._send({'cmd': 'reset'})
+        self._read_reply(time.monotonic() + self.startup_timeout)
+        self.usage_at_reset = self.last_usage = self.sample_usage()
+
+    def sample_usage(self) -> tuple[int, float] | None:
+        """Peak RSS (kB) and CPU seconds of the container so far, None if unavailable"""
+        usage = _process_usage(self._pids) if self.is_running else None
+        if usage is not None:
+            self.last_usage = usage
+        return usage
+
+    def generate_move(self, board: Board, player: Player, move_timeout: float) -> Move:
+        self._send({'cmd': 'move', 'board': board.flatten().tolist(), 'dtype': str(board.dtype), 'player': int(player)})
+        try:
+            reply = self._read_reply(time.monotonic() + move_timeout + MOVE_TIMEOUT_GRACE)
+        except MoveTimeoutError:
+            # The agent may still be thinking, it is restarted before its next game
+            self.sample_usage()
+            self._kill()
+            self.process = None
+            raise
+        if 'error' in reply:
+            if 'MoveTimeoutError' in reply['error']:
+                raise MoveTimeoutError(reply['error'])
+            raise AgentRuntimeError(reply['error'])
+        return Move(reply['move'])
+
+
+class AgentPool:
+    """
+    Keeps agent sessions around so that consecutive matches of an array task
+    reuse already started containers of the same agent. Matches are played one
+    after another, so sessions are handed out without being checked out.
+    """
+
+    def __init__(self, max_sessions: int = 4):
+        self.max_sessions = max(max_sessions, 2)
+        self._sessions: dict[tuple[Path, int], AgentSession] = {}
+
+    def get_sessions(self, sif_paths: list[Path]) -> list[AgentSession]:
+        """One session per path, distinct sessions if an agent plays itself"""
+        sessions = []
+        for sif_path in sif_paths:
+            key = (Path(sif_path), sum(session.sif_path == Path(sif_path) for session in sessions))
+            session = self._sessions.pop(key, None) or AgentSession(sif_path)
+            # Re-inserting keeps the dict ordered from least to most recently used
+            self._sessions[key] = session
+            sessions.append(session)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.pop(next(iter(self._sessions))).stop()
+        return sessions
+
+    def close(self) -> None:
+        for session in self._sessions.values():
+            session.stop()
+        self._sessions = {}
+
+
+def _get_game_metrics(sessions: dict[Player, AgentSession], was_running: dict[Player, bool],
+                      move_seconds: list[float]) -> GameMetrics:
+    startup_ms, peak_rss_kb, cpu_ms = [], [], []
+    for player in [PLAYER1, PLAYER2]:
+        session = sessions[player]
+        started = not was_running[player] and session.startup_seconds is not None
+        startup_ms.append(round(1000 * session.startup_seconds) if started else None)
+        peak_rss_kb.append(session.last_usage[0] if session.last_usage is not None else None)
+        cpu_ms.append(round(1000 * (session.last_usage[1] - session.usage_at_reset[1]))
+                      if session.last_usage is not None and session.usage_at_reset is not None else None)
+    return GameMetrics(move_ms=[round(1000 * seconds) for seconds in move_seconds], startup_ms=startup_ms,
+                       peak_rss_kb=peak_rss_kb, cpu_ms=cpu_ms)
+
+
+def play_game(session1: AgentSession, session2: AgentSession, move_timeout: float,
+              initial_board: Board, metrics: list[GameMetrics] | None = None
+              ) -> tuple[Player | None, list[Move], Exception | None]:
+    """
+    Play one game between two running sessions, `session1` moves first as PLAYER1
+    (`FIRST_PLAYER`).
+
+    Mirrors the return value of `c4utils.match.play_match`: the winning player
+    (None for a draw), the moves played, and the error that ended the game, if
+    any. An agent that fails loses the game. If a `metrics` list is given, the
+    game's `GameMetrics` are appended to it.
+    """
+    sessions = {PLAYER1: session1, PLAYER2: session2}
+    was_running = {player: session.is_running for player, session in sessions.items()}
+    for session in sessions.values():
+        session.usage_at_reset = session.last_usage = None
+    moves, move_seconds = [], []
+    winner, error = _play(sessions, move_timeout, initial_board.copy(), moves, move_seconds)
+    if metrics is not None:
+        metrics.append(_get_game_metrics(sessions, was_running, move_seconds))
+    return winner, moves, error
+
+
+def _play(sessions: dict[Player, AgentSession], move_timeout: float, board: Board, moves: list[Move],
+          move_seconds: list[float]) -> tuple[Player | None, Exception | None]:
+    for player, session in sessions.items():
+        try:
+            session.reset()
+        except (MoveTimeoutError, AgentRuntimeError) as e:
+            session.stop()
+            return (PLAYER2 if player == PLAYER1 else PLAYER1), e
+
+    # Same rules as `replay_moves` in validation: FIRST_PLAYER starts whatever the board
+    bits = list(from_board(board))
+    occupied = bits[0] | bits[1]
+    player = FIRST_PLAYER
+    while occupied != BOARD_MASK:
+        opponent = PLAYER2 if player == PLAYER1 else PLAYER1
+        i = 0 if player == PLAYER1 else 1
+        try:
+            start = time.perf_counter()
+            move = sessions[player].generate_move(to_board(bits[0], bits[1]).astype(board.dtype), player,
+                                                  move_timeout)
+            move_time = time.perf_counter() - start
+            try:
+                bits[i], occupied = apply_move(bits[i], occupied, int(move))
+            except ValueError as e:
+                raise InvalidMoveError(f'Invalid move: {move}') from e
+        except (MoveTimeoutError, AgentRuntimeError, InvalidMoveError) as e:
+            if isinstance(e, AgentRuntimeError):
+                sessions[player].stop()
+            return opponent, e
+        moves.append(move)
+        move_seconds.append(move_time)
+        sessions[player].sample_usage()
+        if is_win(bits[i]):
+            return player, None
+        player = opponent
+    return None, None
@@ -0,0 +1,185 @@
+"""
+Bitboard Connect 4 engine.
+
+A position is stored as two integers, one bit mask of stones per player. Each
+column takes 7 bits (6 rows plus an always empty sentinel bit, so that shifts
+never carry a line over into the next column): the cell in row `r` (0 is the
+bottom row, as in the numpy `Board` layout) and column `c` is bit `7 * c + r`.
+
+Scalar functions work on Python ints; the `batch_*` functions and
+`generate_starting_boards` work on numpy uint64 arrays of many positions at
+once. PLAYER1 always moves first (`FIRST_PLAYER`), whatever the starting
+board, as in `c4utils.match.play_match`.
+"""
+import numpy as np
+from c4utils.c4_types import Board, Move, Player, PLAYER1, PLAYER2, NO_PLAYER
+
+N_ROWS = 6
+N_COLS = 7
+HEIGHT = N_ROWS + 1
+N_CELLS = N_ROWS * N_COLS
+
+BOTTOM_MASK = sum(1 << (HEIGHT * col) for col in range(N_COLS))
+BOARD_MASK = BOTTOM_MASK * ((1 << N_ROWS) - 1)
+FIRST_PLAYER = PLAYER1
+# Shifts to the neighbour in a line: vertical, horizontal and both diagonals
+_LINE_SHIFTS = (1, HEIGHT, HEIGHT - 1, HEIGHT + 1)
+
+
+def _cell_bit(row: int, col: int) -> int:
+    return 1 << (HEIGHT * col + row)
+
+
+def column_mask(col: int) -> int:
+    return ((1 << N_ROWS) - 1) << (HEIGHT * col)
+
+
+def legal_move_mask(occupied: int) -> int:
+    """The lowest free cell of every column that is not full"""
+    return (occupied + BOTTOM_MASK) & BOARD_MASK
+
+
+def legal_moves(occupied: int) -> list[Move]:
+    free_cells = legal_move_mask(occupied)
+    return [Move(col) for col in range(N_COLS) if free_cells & column_mask(col)]
+
+
+def apply_move(player_bits: int, occupied: int, col: int) -> tuple[int, int]:
+    """Drop a stone of the player to move into `col`, returns its new bits and the new occupied mask"""
+    move_bit = legal_move_mask(occupied) & column_mask(col)
+    if move_bit == 0:
+        raise ValueError(f'Invalid move: {col}')
+    return player_bits | move_bit, occupied | move_bit
+
+
+def is_win(player_bits: int) -> bool:
+    """Whether the stones contain four in a line"""
+    for shift in _LINE_SHIFTS:
+        pairs = player_bits & (player_bits >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+def from_board(board: Board) -> tuple[int, int]:
+    """Bits of PLAYER1 and PLAYER2 for a numpy board"""
+    bits = [0, 0]
+    for row, col in zip(*np.nonzero(board != NO_PLAYER)):
+        bits[0 if board[row, col] == PLAYER1 else 1] |= _cell_bit(int(row), int(col))
+    return bits[0], bits[1]
+
+
+def to_board(player1_bits: int, player2_bits: int) -> Board:
+    return to_boards(np.array([player1_bits], dtype=np.uint64), np.array([player2_bits], dtype=np.uint64))[0]
+
+
+def player_to_move(player1_bits: int, player2_bits: int) -> Player:
+    return PLAYER1 if bin(player1_bits).count('1') == bin(player2_bits).count('1') else PLAYER2
+
+
+def replay_moves(board: Board, moves: list[Move], first_player: Player = FIRST_PLAYER) -> tuple[Player | None, int]:
+    """
+    Play `moves` from `board`, alternating players starting with `first_player`
+    (in tournament games PLAYER1 moves first whatever the starting board).
+    Returns the winner (None if there is none) and the number of moves played
+    until the game ended; raises ValueError on an invalid move.
+    """
+    bits = list(from_board(board))
+    occupied = bits[0] | bits[1]
+    player = 0 if first_player == PLAYER1 else 1
+    for n_played, move in enumerate(moves, start=1):
+        bits[player], occupied = apply_move(bits[player], occupied, int(move))
+        if is_win(bits[player]):
+            return (PLAYER1 if player == 0 else PLAYER2), n_played
+        if occupied == BOARD_MASK:
+            return None, n_played
+        player = 1 - player
+    return None, len(moves)
+
+
+# --- Batched positions (numpy uint64 arrays) ---
+
+def batch_is_win(player_bits: np.ndarray) -> np.ndarray:
+    wins = np.zeros(player_bits.shape, dtype=bool)
+    for shift in _LINE_SHIFTS:
+        pairs = player_bits & (player_bits >> np.uint64(shift))
+        wins |= (pairs & (pairs >> np.uint64(2 * shift))) != 0
+    return wins
+
+
+def from_boards(boards: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Bits of PLAYER1 and PLAYER2 for (n, 6, 7) numpy boards"""
+    shifts = np.array([[HEIGHT * col + row for col in range(N_COLS)] for row in range(N_ROWS)], dtype=np.uint64)
+    player1_bits = np.where(boards == PLAYER1, np.uint64(1) << shifts, np.uint64(0)).reshape(len(boards), -1)
+    player2_bits = np.where(boards == PLAYER2, np.uint64(1) << shifts, np.uint64(0)).reshape(len(boards), -1)
+    return np.bitwise_or.reduce(player1_bits, axis=1), np.bitwise_or.reduce(player2_bits, axis=1)
+
+
+def to_boards(player1_bits: np.ndarray, player2_bits: np.ndarray) -> np.ndarray:
+    """(n, 6, 7) numpy boards for n positions"""
+    shifts = np.array([[HEIGHT * col + row for col in range(N_COLS)] for row in range(N_ROWS)], dtype=np.uint64)
+    player1_cells = (player1_bits[:, None, None] >> shifts) & np.uint64(1)
+    player2_cells = (player2_bits[:, None, None] >> shifts) & np.uint64(1)
+    boards = np.full((len(player1_bits), N_ROWS, N_COLS), NO_PLAYER, dtype=Player)
+    boards[player1_cells == 1] = PLAYER1
+    boards[player2_cells == 1] = PLAYER2
+    return boards
+
+
+def _random_openings(n: int, truncate_prob: float, truncate_max: int,
+                     rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Play random moves in n games at once. After every move a game stops with
+    probability `truncate_prob`, and after `truncate_max + 1` moves at the
+    latest. Returns the positions of the games that did not end on the way.
+    """
+    bits = np.zeros((2, n), dtype=np.uint64)
+    heights = np.zeros((n, N_COLS), dtype=np.int64)
+    active = np.ones(n, dtype=bool)
+    ended = np.zeros(n, dtype=bool)
+    for move_number in range(min(truncate_max + 1, N_CELLS)):
+        games = np.flatnonzero(active)
+        if len(games) == 0:
+            break
+        # Uniformly random legal column: highest random key among the columns that are not full
+        keys = rng.random((len(games), N_COLS))
+        keys[heights[games] >= N_ROWS] = -1.
+        cols = np.argmax(keys, axis=1)
+        player = move_number % 2
+        bits[player, games] |= np.uint64(1) << (HEIGHT * cols + heights[games, cols]).astype(np.uint64)
+        heights[games, cols] += 1
+
+        game_over = batch_is_win(bits[player, games]) | np.all(heights[games] >= N_ROWS, axis=1)
+        ended[games[game_over]] = True
+        active[games[game_over | (rng.random(len(games)) < truncate_prob)]] = False
+    return bits[0, ~ended], bits[1, ~ended]
+
+
+def generate_starting_boards(n: int, truncate_prob: float = 0.2, truncate_max: int = 10,
+                             rng: np.random.Generator | None = None, distinct: bool = True,
+                             max_attempts: int = 100) -> np.ndarray:
+    """
+    n random non-terminal starting boards as an (n, 6, 7) array, played with
+    random moves (see `_random_openings`), all different if `distinct`.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    positions: dict[tuple[int, int], None] = {}
+    player1_bits, player2_bits = [], []
+    for _ in range(max_attempts):
+        n_missing = n - (len(positions) if distinct else len(player1_bits))
+        if n_missing <= 0:
+            break
+        # Some games end early or are duplicates, oversample
+        for position in zip(*(bits.tolist() for bits in _random_openings(2 * n_missing + 8, truncate_prob,
+                                                                         truncate_max, rng))):
+            if distinct:
+                positions.setdefault(position)
+            else:
+                player1_bits.append(position[0])
+                player2_bits.append(position[1])
+    if distinct:
+        player1_bits = [position[0] for position in positions]
+        player2_bits = [position[1] for position in positions]
+    if len(player1_bits) < n:
+        raise RuntimeError(f'Could only generate {len(player1_bits)} of {n} starting boards')
+    return to_boards(np.array(player1_bits[:n], dtype=np.uint64), np.array(player2_bits[:n], dtype=np.uint64))
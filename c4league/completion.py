@@ -0,0 +1,179 @@
+"""
+Tracks completion of tournament array tasks through "done" markers.
+
+Every array task atomically drops a marker file named after its task id into
+a shared directory when it finishes (the file contains the exit code). The
+tracker watches that directory - with inotify where available, falling back to
+cheap directory scans - and only asks the executor (sacct under Slurm) at a
+low frequency for tasks that died without writing a marker.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+from pathlib import Path
+from typing import Callable
+
+from c4league.slurm import TERMINAL_STATES
+from c4league.executors import Executor, get_executor
+
+DONE_DIR_NAME = '.done'
+
+_IN_CLOSE_WRITE = 0x08
+_IN_MOVED_TO = 0x80
+
+
+def write_done_marker(done_dir: Path, task_id: int, exit_code: int | str) -> None:
+    """
+    Atomically mark a task as done (shell equivalent: see `done_marker_shell`),
+    with its exit code or, for tasks that never ran to the end, a state such as CANCELLED
+    """
+    tmp_path = done_dir / f'.{task_id}.tmp'
+    tmp_path.write_text(str(exit_code))
+    os.replace(tmp_path, done_dir / str(task_id))
+
+
+def done_marker_shell(done_dir: Path, task_id: str = '$SLURM_ARRAY_TASK_ID', status: str = '$status') -> str:
+    """Shell snippet writing a done marker, for use in job scripts"""
+    return (f'echo {status} > "{done_dir}/.{task_id}.tmp" && '
+            f'mv "{done_dir}/.{task_id}.tmp" "{done_dir}/{task_id}"')
+
+
+class _InotifyWatch:
+    """Minimal inotify binding, wakes up when a file is written or moved into a directory"""
+
+    def __init__(self, path: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, str(path).encode(), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+
+    def wait(self, timeout: float) -> None:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _create_watch(path: Path) -> _InotifyWatch | None:
+    try:
+        return _InotifyWatch(path)
+    except (OSError, AttributeError, TypeError):
+        # Not on Linux, or no inotify support for this file system
+        return None
+
+
+class CompletionTracker:
+    """
+    Waits for a set of array tasks to finish.
+
+    `results` maps each finished task to its exit code (from the marker), or to
+    the scheduler state if the task ended without writing a marker.
+
+    With `worker_job`, the job's array elements are node workers running the
+    tasks (see c4league.node_worker) rather than the tasks themselves: once
+    all workers have ended, tasks without a marker are finished as
+    `WORKERS_ENDED`.
+    """
+
+    def __init__(self, done_dir: Path, task_ids: list[int], job_id: str,
+                 poll_interval: float = 5.0, scheduler_check_interval: float = 300.0,
+                 use_inotify: bool = True, executor: Executor | None = None, worker_job: bool = False):
+        self.done_dir = Path(done_dir)
+        self.done_dir.mkdir(parents=True, exist_ok=True)
+        self.task_ids = set(task_ids)
+        self.job_id = job_id
+        self.poll_interval = poll_interval
+        self.scheduler_check_interval = scheduler_check_interval
+        self.use_inotify = use_inotify
+        self.executor = executor if executor is not None else get_executor()
+        self.worker_job = worker_job
+        self.results: dict[int, int | str] = {}
+
+    @property
+    def remaining(self) -> set[int]:
+        return self.task_ids - set(self.results)
+
+    @property
+    def is_done(self) -> bool:
+        return len(self.remaining) == 0
+
+    def scan(self) -> list[int]:
+        """Pick up new markers, returns the newly finished tasks"""
+        new_tasks = []
+        for entry in os.scandir(self.done_dir):
+            if entry.name.startswith('.') or not entry.name.isdigit():
+                continue
+            task_id = int(entry.name)
+            if task_id in self.task_ids and task_id not in self.results:
+                try:
+                    with open(entry.path, 'r') as f:
+                        content = f.read().strip()
+                    self.results[task_id] = content if content.isalpha() else int(content or -1)
+                except (OSError, ValueError):
+                    self.results[task_id] = -1
+                new_tasks.append(task_id)
+        return new_tasks
+
+    def check_scheduler(self) -> list[int]:
+        """Safety net: finish tasks the scheduler reports as ended but that left no marker"""
+        try:
+            states = self.executor.get_job_states([self.job_id])
+        except RuntimeError as e:
+            print(f'Warning: {e}')
+            return []
+        ended = {}
+        if self.worker_job:
+            if len(states) > 0 and all(state in TERMINAL_STATES for state in states.values()):
+                ended = {task_id: 'WORKERS_ENDED' for task_id in self.remaining}
+        else:
+            for name, state in states.items():
+                _, _, task = name.partition('_')
+                if task.isdigit() and int(task) in self.remaining and state in TERMINAL_STATES:
+                    ended[int(task)] = state
+        if len(ended) == 0:
+            return []
+        # A marker may have been written just before the task ended
+        new_tasks = self.scan()
+        for task_id, state in ended.items():
+            if task_id not in self.results:
+                print(f'Task {task_id} ended with state {state} without a done marker')
+                self.results[task_id] = state
+                new_tasks.append(task_id)
+        return new_tasks
+
+    def wait(self, on_tasks_done: Callable[[list[int]], None] | None = None) -> dict[int, int | str]:
+        """Block until all tasks are done, calling `on_tasks_done` for each batch of finished tasks"""
+        watch = _create_watch(self.done_dir) if self.use_inotify else None
+        print(f'Tracking {len(self.task_ids)} tasks via {"inotify" if watch else "directory polling"} '
+              f'of {self.done_dir}')
+        last_scheduler_check = time.monotonic()
+        try:
+            while True:
+                new_tasks = self.scan()
+                if time.monotonic() - last_scheduler_check >= self.scheduler_check_interval:
+                    new_tasks += self.check_scheduler()
+                    last_scheduler_check = time.monotonic()
+                if len(new_tasks) > 0:
+                    print(f'Progress: {len(self.results)}/{len(self.task_ids)} tasks done')
+                    if on_tasks_done is not None:
+                        on_tasks_done(sorted(new_tasks))
+                if self.is_done:
+                    return self.results
+                if watch is not None:
+                    watch.wait(self.poll_interval)
+                else:
+                    time.sleep(self.poll_interval)
+        finally:
+            if watch is not None:
+                watch.close()
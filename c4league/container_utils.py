@@ -1,18 +1,26 @@
 import os
 import shutil
 import tempfile
+import hashlib
 from dotenv import load_dotenv
-from c4league.storage.cloud_storage import download_agent
+from c4league.storage.cloud_storage import download_agents
 from c4league.utils import TournamentPlayer, get_tournament_player_from_sif, get_sif_file_name_from_tournament_player
-import subprocess
+from c4league.slurm import TERMINAL_STATES
+from c4league.executors import Executor, get_executor
+from c4league.params import BUILD_CACHE_MAX_GB
 import time
 
 load_dotenv()
 
+BUILD_POLL_INTERVAL = 10
+
 
 def get_containerized_agents() -> list[TournamentPlayer]:
     containerized_agents = []
     for file in os.listdir(os.getenv("AGENT_CONTAINER_DIRECTORY")):
+        if file.startswith("."):
+            # e.g. the build cache
+            continue
         if file.endswith(".sif"):
             containerized_agents.append(get_tournament_player_from_sif(file))
         else:
@@ -22,39 +30,144 @@ def get_containerized_agents() -> list[TournamentPlayer]:
 def get_sif_file_path_from_tournament_player(tournament_player: TournamentPlayer) -> str:
     return os.path.join(os.getenv("AGENT_CONTAINER_DIRECTORY"), get_sif_file_name_from_tournament_player(tournament_player))
 
+def get_sif_identity(tournament_player: TournamentPlayer) -> str:
+    """Identifies a built agent container: a rebuilt agent gets a new identity even if its version is unchanged"""
+    stat = os.stat(get_sif_file_path_from_tournament_player(tournament_player))
+    return f'{get_sif_file_name_from_tournament_player(tournament_player)}:{stat.st_size}:{stat.st_mtime_ns}'
+
 def remove_old_agents(agents: list[TournamentPlayer]) -> None:
     for agent in agents:
         os.remove(get_sif_file_path_from_tournament_player(agent))
 
-def containerize_agents(agents: list[TournamentPlayer]) -> None:
-    for agent in agents:
-        temp_dir = None
+# --- Build cache ---
+# Agent images are built in two layers: a base image containing python, the
+# agent's requirements and c4utils, and a thin layer with the agent code on
+# top. Base images are content-addressed by their dependency set, so a
+# resubmission with unchanged requirements only rebuilds the thin layer.
+
+def get_build_cache_dir() -> str:
+    default_dir = os.path.join(os.getenv("AGENT_CONTAINER_DIRECTORY", ""), ".build_cache")
+    return os.getenv("AGENT_BUILD_CACHE_DIRECTORY", default_dir)
+
+def _normalize_requirements(requirements: str) -> str:
+    lines = [line.split('#')[0].strip() for line in requirements.splitlines()]
+    return '\n'.join(sorted(line for line in lines if line))
+
+def _hash_tree(root: str, hasher) -> None:
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(name for name in dir_names if name != '__pycache__')
+        for file_name in sorted(file_names):
+            if file_name.endswith('.pyc'):
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            hasher.update(os.path.relpath(file_path, root).encode())
+            with open(file_path, 'rb') as f:
+                hasher.update(hashlib.sha256(f.read()).digest())
+
+def get_dependency_hash(requirements_path: str, c4utils_dir: str, def_file_path: str) -> str:
+    """Hash identifying the base image for a dependency set"""
+    hasher = hashlib.sha256()
+    with open(def_file_path, 'rb') as f:
+        hasher.update(f.read())
+    requirements = ''
+    if os.path.exists(requirements_path):
+        with open(requirements_path, 'r') as f:
+            requirements = f.read()
+    hasher.update(_normalize_requirements(requirements).encode())
+    _hash_tree(c4utils_dir, hasher)
+    return hasher.hexdigest()[:16]
+
+def get_base_image_path(dependency_hash: str) -> str:
+    return os.path.join(get_build_cache_dir(), f"base_{dependency_hash}.sif")
+
+def _mark_base_image_used(base_image_path: str) -> None:
+    # The modification time doubles as the last-use time for LRU eviction
+    os.utime(base_image_path)
+
+def evict_build_cache(max_bytes: int, keep: set[str] | None = None) -> list[str]:
+    """Remove least recently used base images (except those in `keep`) until the cache fits into max_bytes"""
+    keep = keep if keep is not None else set()
+    cache_dir = get_build_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for file in os.listdir(cache_dir):
+        if file.startswith("base_") and file.endswith(".sif"):
+            path = os.path.join(cache_dir, file)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in entries)
+    evicted = []
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        if path in keep:
+            continue
+        os.remove(path)
+        total_size -= size
+        evicted.append(path)
+        print(f"Evicted base image {path} from build cache")
+    return evicted
+
+def _get_build_cache_max_bytes() -> int:
+    return int(float(os.getenv("AGENT_BUILD_CACHE_MAX_GB", BUILD_CACHE_MAX_GB)) * 1024**3)
+
+# --- Builds ---
+
+def _unpack_agent(temp_dir: str) -> None:
+    """Unpack a downloaded agent in its temp directory, ready to be built"""
+    # Unzip agent code
+    filename = os.listdir(temp_dir)[0]
+    shutil.unpack_archive(temp_dir + '/' + filename, temp_dir)
+
+    # Clean up files except agent code and requirements
+    for item in os.listdir(temp_dir):
+        full_path = os.path.join(temp_dir, item)
+        if os.path.isfile(full_path) and item != 'requirements.txt':
+            os.remove(full_path)
+        elif os.path.isdir(full_path) and item != 'agent':
+            shutil.rmtree(full_path)
+
+    # Copy c4utils package and def files
+    shutil.copytree(os.getenv("C4UTILS_DIR"), f'{temp_dir}/c4utils')
+    for def_file in ['build_agent.def', 'build_agent_base.def']:
+        shutil.copy(os.path.join(os.getenv("C4LEAGUE_ROOT_DIR"), def_file), temp_dir)
+
+def _stage_agents(agents: list[TournamentPlayer]) -> tuple[dict[TournamentPlayer, str], list[TournamentPlayer]]:
+    """
+    Download all agents concurrently into shared temp directories and unpack
+    them. Returns the temp directory per staged agent and the agents that failed.
+    """
+    # Create temp directories in shared location
+    temp_dirs = [tempfile.mkdtemp(dir=os.getenv("C4LEAGUE_ROOT_DIR")) for _ in agents]
+    print(f'Downloading {len(agents)} agents...')
+    errors = download_agents([agent.get_dict() for agent in agents], temp_dirs)
+    staged, failed = {}, []
+    for agent, temp_dir, error in zip(agents, temp_dirs, errors):
         try:
-            # Create temp directory in shared location
-            temp_dir = tempfile.mkdtemp(dir=os.getenv("C4LEAGUE_ROOT_DIR"))
-            print(f'Downloading agent {agent.team_name} {agent.agent_name} {agent.version} to {temp_dir}')
-            download_agent(agent.get_dict(), temp_dir)
-            
-            # Unzip agent code
-            filename = os.listdir(temp_dir)[0]
-            shutil.unpack_archive(temp_dir + '/' + filename, temp_dir)
-            
-            # Clean up files except agent code and requirements
-            for item in os.listdir(temp_dir):
-                full_path = os.path.join(temp_dir, item)
-                if os.path.isfile(full_path) and item != 'requirements.txt':
-                    os.remove(full_path)
-                elif os.path.isdir(full_path) and item != 'agent':
-                    shutil.rmtree(full_path)
-            
-            # Copy c4utils package and def file
-            shutil.copytree(os.getenv("C4UTILS_DIR"), f'{temp_dir}/c4utils')
-            def_file_path = os.path.join(os.getenv("C4LEAGUE_ROOT_DIR"), 'build_agent.def')
-            shutil.copy(def_file_path, temp_dir)
-            
-            # Create build script
-            build_script = f"""#!/bin/bash
-#SBATCH --job-name=build_{agent.team_name}_{agent.agent_name}
+            if error is not None:
+                raise error
+            _unpack_agent(temp_dir)
+            staged[agent] = temp_dir
+        except Exception as e:
+            print(f"Error staging agent {agent.team_name} {agent.agent_name}: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            failed.append(agent)
+    return staged, failed
+
+def _write_layer_def_file(temp_dir: str, base_image_path: str) -> None:
+    """Write the def file building the agent code on top of a cached base image"""
+    with open(os.path.join(os.getenv("C4LEAGUE_ROOT_DIR"), 'build_agent_layer.def'), 'r') as f:
+        def_file = f.read()
+    def_file = def_file.replace('From: BASE_IMAGE', f'From: {os.path.abspath(base_image_path)}')
+    with open(os.path.join(temp_dir, 'build_agent_layer.def'), 'w') as f:
+        f.write(def_file)
+
+def _create_build_script(job_name: str, temp_dir: str, def_file: str, output_path: str) -> str:
+    """Write a Slurm script building `def_file` from a staged directory and return its path"""
+    output_path = os.path.abspath(output_path)
+    build_script = f"""#!/bin/bash
+#SBATCH --job-name=build_{job_name}
 #SBATCH --output=build_%j.out
 #SBATCH --error=build_%j.err
 #SBATCH --partition=cpu-2h
@@ -67,58 +180,158 @@ SHARED_DIR="{os.path.abspath(temp_dir)}"
 # Set up build environment
 mkdir -p "$TEMP_DIR/agent"
 [ -d "$SHARED_DIR/agent" ] && cp -r "$SHARED_DIR/agent/"* "$TEMP_DIR/agent/"
-[ -f "$SHARED_DIR/build_agent.def" ] && cp "$SHARED_DIR/build_agent.def" "$TEMP_DIR/"
+[ -f "$SHARED_DIR/{def_file}" ] && cp "$SHARED_DIR/{def_file}" "$TEMP_DIR/"
 [ -d "$SHARED_DIR/c4utils" ] && cp -r "$SHARED_DIR/c4utils" "$TEMP_DIR/"
 [ -f "$SHARED_DIR/requirements.txt" ] && cp "$SHARED_DIR/requirements.txt" "$TEMP_DIR/"
 
+# Build next to the target and move into place, so readers never see a partial image
 cd "$TEMP_DIR"
-apptainer build "{os.path.abspath(os.path.join(os.getenv('AGENT_CONTAINER_DIRECTORY', ''), get_sif_file_name_from_tournament_player(agent)))}" build_agent.def
+apptainer build "{output_path}.partial" {def_file}
+status=$?
+[ $status -eq 0 ] && mv "{output_path}.partial" "{output_path}"
+rm -f "{output_path}.partial"
 
 rm -rf "$TEMP_DIR"
+exit $status
 """
-            # Submit and monitor build job
-            script_path = os.path.join(temp_dir, "build.sh")
-            with open(script_path, "w") as f:
-                f.write(build_script)
-            os.chmod(script_path, 0o755)
-            
+    script_path = os.path.join(temp_dir, f"build_{def_file.removesuffix('.def')}.sh")
+    with open(script_path, "w") as f:
+        f.write(build_script)
+    os.chmod(script_path, 0o755)
+    return script_path
+
+def _print_build_errors(job_id: str) -> None:
+    error_file = f"build_{job_id}.err"
+    if os.path.exists(error_file):
+        with open(error_file, 'r') as f:
+            error_content = f.read().strip()
+            if error_content:
+                print(f"Build error output for job {job_id}:\n{error_content}")
+
+def _wait_for_build_jobs(executor: Executor, job_ids: list[str], poll_interval: float) -> dict[str, str]:
+    """Poll all build jobs with one sacct call per interval until every job has finished"""
+    final_states = {}
+    while len(final_states) < len(job_ids):
+        pending_ids = [job_id for job_id in job_ids if job_id not in final_states]
+        try:
+            states = executor.get_job_states(pending_ids)
+        except RuntimeError as e:
+            print(f"Warning: {e}")
+            states = {}
+        for job_id in pending_ids:
+            if states.get(job_id) in TERMINAL_STATES:
+                final_states[job_id] = states[job_id]
+        if len(final_states) < len(job_ids):
+            time.sleep(poll_interval)
+    return final_states
+
+def _build_base_images(executor: Executor, staged: dict[TournamentPlayer, str],
+                       poll_interval: float) -> dict[TournamentPlayer, str | None]:
+    """
+    Make sure a base image exists for every staged agent, building missing ones
+    concurrently. Returns the base image path per agent, None if its build failed.
+    """
+    dependency_hashes = {
+        agent: get_dependency_hash(os.path.join(temp_dir, 'requirements.txt'),
+                                   os.path.join(temp_dir, 'c4utils'),
+                                   os.path.join(temp_dir, 'build_agent_base.def'))
+        for agent, temp_dir in staged.items()
+    }
+    os.makedirs(get_build_cache_dir(), exist_ok=True)
+    build_jobs = {}
+    for agent, dependency_hash in dependency_hashes.items():
+        base_image_path = get_base_image_path(dependency_hash)
+        if os.path.exists(base_image_path):
+            print(f'Build cache hit for {agent.team_name} {agent.agent_name} (dependencies {dependency_hash})')
+            continue
+        if dependency_hash in build_jobs.values():
+            continue
+        print(f'Build cache miss for {agent.team_name} {agent.agent_name}, building base image {dependency_hash}')
+        script_path = _create_build_script(f'base_{dependency_hash}', staged[agent],
+                                           'build_agent_base.def', base_image_path)
+        try:
+            build_jobs[executor.submit(script_path)] = dependency_hash
+        except RuntimeError as e:
+            print(f'Error submitting base image build {dependency_hash}: {e}')
+
+    final_states = _wait_for_build_jobs(executor, list(build_jobs), poll_interval)
+    for job_id, state in final_states.items():
+        if state != "COMPLETED":
+            print(f'Base image build {build_jobs[job_id]} failed with status: {state}')
+            _print_build_errors(job_id)
+
+    base_images = {}
+    for agent, dependency_hash in dependency_hashes.items():
+        base_image_path = get_base_image_path(dependency_hash)
+        base_images[agent] = base_image_path if os.path.exists(base_image_path) else None
+    return base_images
+
+def containerize_agents(agents: list[TournamentPlayer], poll_interval: float = BUILD_POLL_INTERVAL,
+                        use_cache: bool = True, executor: Executor | None = None) -> dict[TournamentPlayer, bool]:
+    """
+    Build containers for all agents concurrently.
+
+    All agents are staged first, then every build job is submitted at once and
+    the whole batch is tracked with a single sacct call per poll. A failing
+    agent does not abort the others; the returned dict maps each agent to
+    whether its container was built.
+
+    With `use_cache`, missing base images are built first and each agent is
+    then built as a thin layer on top of the cached base image. Builds run on
+    `executor` (default: see `c4league.executors.get_executor`).
+    """
+    executor = executor if executor is not None else get_executor()
+    results = {}
+    staged = {}
+    build_jobs = {}
+    try:
+        staged, failed = _stage_agents(agents)
+        for agent in failed:
+            results[agent] = False
+
+        base_images = {}
+        if use_cache:
+            base_images = _build_base_images(executor, staged, poll_interval)
+
+        for agent, temp_dir in staged.items():
+            def_file = 'build_agent.def'
+            if use_cache:
+                if base_images[agent] is None:
+                    results[agent] = False
+                    continue
+                _write_layer_def_file(temp_dir, base_images[agent])
+                def_file = 'build_agent_layer.def'
+            script_path = _create_build_script(f'{agent.team_name}_{agent.agent_name}', temp_dir, def_file,
+                                               get_sif_file_path_from_tournament_player(agent))
             print(f'Submitting build job for {agent.team_name} {agent.agent_name}')
-            result = subprocess.run(["sbatch", script_path], capture_output=True, text=True)
-            if result.returncode != 0:
-                raise Exception(f"Failed to submit job: {result.stderr}")
-            
-            job_id = result.stdout.strip().split()[-1]
-            
-            # Wait for job completion
-            while True:
-                status_result = subprocess.run(
-                    ["sacct", "-j", job_id, "--format=JobID,State", "--parsable2", "--noheader"], 
-                    capture_output=True, text=True
-                )
-                if status_result.returncode != 0:
-                    raise Exception(f"Failed to check job status: {status_result.stderr}")
-                
-                for line in status_result.stdout.strip().split('\n'):
-                    if line.strip():
-                        job_id_str, status = line.split('|')
-                        if job_id_str == str(job_id) and status in ["COMPLETED", "FAILED", "CANCELLED"]:
-                            if status != "COMPLETED":
-                                error_file = f"build_{job_id}.err"
-                                if os.path.exists(error_file):
-                                    with open(error_file, 'r') as f:
-                                        error_content = f.read().strip()
-                                        if error_content:
-                                            print(f"Build error output:\n{error_content}")
-                                raise Exception(f"Build job failed with status: {status}")
-                            return
-                
-                time.sleep(10)
-            
-        except Exception as e:
-            print(f"Error building container for {agent.team_name} {agent.agent_name}: {e}")
-            raise e
-        finally:
-            if temp_dir and os.path.exists(temp_dir):
+            try:
+                build_jobs[executor.submit(script_path)] = agent
+            except RuntimeError as e:
+                print(f"Error building container for {agent.team_name} {agent.agent_name}: {e}")
+                results[agent] = False
+
+        print(f'Waiting for {len(build_jobs)} build jobs...')
+        final_states = _wait_for_build_jobs(executor, list(build_jobs), poll_interval)
+        for job_id, agent in build_jobs.items():
+            state = final_states[job_id]
+            results[agent] = state == "COMPLETED"
+            if results[agent]:
+                print(f"Containerized {agent.team_name} {agent.agent_name}.")
+            else:
+                print(f"Build job for {agent.team_name} {agent.agent_name} failed with status: {state}")
+                _print_build_errors(job_id)
+    finally:
+        for temp_dir in staged.values():
+            if os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir)
                 print(f"Removed temp directory {temp_dir}")
-                print(f"Containerized {agent.team_name} {agent.agent_name}.")
+
+    if use_cache:
+        used_base_images = set(path for path in base_images.values() if path is not None)
+        for base_image_path in used_base_images:
+            _mark_base_image_used(base_image_path)
+        evict_build_cache(_get_build_cache_max_bytes(), keep=used_base_images)
+
+    n_built = sum(results.values())
+    print(f'Built {n_built} of {len(agents)} agent containers.')
+    return results
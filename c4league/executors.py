@@ -0,0 +1,161 @@
+"""
+Executors run job scripts (array jobs of tournament tasks, container builds)
+and report their states, with the same job ids and state names as Slurm.
+
+- `SlurmExecutor` (default): submits to the cluster with sbatch, states from sacct.
+- `LocalExecutor`: runs the scripts on this machine, up to `max_workers`
+  tasks at a time (default: all available cores). Array tasks get
+  `SLURM_ARRAY_TASK_ID` etc. set like under Slurm, and `#SBATCH --output` and
+  `--error` directives are honoured, so job scripts, config files, results and
+  logs look the same on a single workstation as on the cluster.
+
+Select with `EXECUTOR="slurm"` or `EXECUTOR="local"` (and `LOCAL_WORKERS`).
+"""
+import itertools
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from c4league.slurm import submit_job, get_job_states, cancel_jobs
+
+EXECUTORS = ['slurm', 'local']
+
+
+class Executor:
+    def submit(self, script_path: str, task_ids: list[int] | None = None) -> str:
+        """Submit a job script, as an array job if `task_ids` (a contiguous range) are given; returns the job id"""
+        raise NotImplementedError
+
+    def get_job_states(self, job_ids: list[str]) -> dict[str, str]:
+        """States of jobs and their array tasks (as `<job_id>_<task_id>`), keyed like sacct"""
+        raise NotImplementedError
+
+    def cancel(self, job_id: str, task_ids: list[int]) -> None:
+        """Cancel array tasks of a job, they end as CANCELLED"""
+        raise NotImplementedError
+
+
+class SlurmExecutor(Executor):
+    def submit(self, script_path, task_ids=None):
+        if task_ids is None:
+            return submit_job(script_path)
+        return submit_job(script_path, f"--array={task_ids[0]}-{task_ids[-1]}")
+
+    def get_job_states(self, job_ids):
+        return get_job_states(job_ids)
+
+    def cancel(self, job_id, task_ids):
+        cancel_jobs([f'{job_id}_{task_id}' for task_id in task_ids])
+
+
+def get_output_paths(script_path: str) -> tuple[str | None, str | None]:
+    """`#SBATCH --output` and `--error` patterns of a job script"""
+    patterns = {}
+    with open(script_path, 'r') as f:
+        for line in f:
+            match = re.match(r'#SBATCH\s+--(output|error)=(\S+)', line)
+            if match:
+                patterns[match.group(1)] = match.group(2)
+    return patterns.get('output'), patterns.get('error')
+
+
+def expand_output_path(pattern: str, job_id: str, task_id: int | None) -> str:
+    path = pattern.replace('%A', job_id).replace('%j', job_id if task_id is None else f'{job_id}_{task_id}')
+    return path.replace('%a', str(task_id) if task_id is not None else '4294967294')
+
+
+class LocalExecutor(Executor):
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers or len(os.sched_getaffinity(0))
+        # Every task is a separate bash process, the pool only limits how many run at once
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='local-executor')
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._tasks: dict[str, Future] = {}
+        self._running: set[str] = set()
+
+    def _run(self, name: str, script_path: str, env: dict[str, str], output_path: str | None,
+             error_path: str | None) -> int:
+        with self._lock:
+            self._running.add(name)
+        try:
+            stdout = open(output_path, 'w') if output_path is not None else subprocess.DEVNULL
+            stderr = open(error_path, 'w') if error_path is not None else stdout
+            try:
+                return subprocess.run(['bash', script_path], env=env, stdout=stdout, stderr=stderr).returncode
+            finally:
+                for f in {stdout, stderr}:
+                    if f is not subprocess.DEVNULL:
+                        f.close()
+        finally:
+            with self._lock:
+                self._running.discard(name)
+
+    def submit(self, script_path, task_ids=None):
+        job_id = str(next(self._job_ids))
+        output_pattern, error_pattern = get_output_paths(script_path)
+        for task_id in (task_ids if task_ids is not None else [None]):
+            env = dict(os.environ, SLURM_JOB_ID=job_id, SLURM_SUBMIT_DIR=os.getcwd())
+            name = job_id
+            if task_id is not None:
+                name = f'{job_id}_{task_id}'
+                env.update(SLURM_ARRAY_JOB_ID=job_id, SLURM_ARRAY_TASK_ID=str(task_id),
+                           SLURM_ARRAY_TASK_MIN=str(task_ids[0]), SLURM_ARRAY_TASK_MAX=str(task_ids[-1]))
+            output_path = expand_output_path(output_pattern, job_id, task_id) if output_pattern else None
+            error_path = expand_output_path(error_pattern, job_id, task_id) if error_pattern else None
+            future = self._pool.submit(self._run, name, os.path.abspath(script_path), env, output_path, error_path)
+            with self._lock:
+                self._tasks[name] = future
+        print(f'Running job {job_id} locally ({len(task_ids) if task_ids else 1} tasks, '
+              f'{self.max_workers} workers)')
+        return job_id
+
+    def _get_state(self, name: str) -> str:
+        future = self._tasks[name]
+        if future.cancelled():
+            return 'CANCELLED'
+        if not future.done():
+            return 'RUNNING' if name in self._running else 'PENDING'
+        if future.exception() is not None:
+            return 'FAILED'
+        # Like Slurm, a task killed by a signal is reported as failed
+        return 'COMPLETED' if future.result() == 0 else 'FAILED'
+
+    def get_job_states(self, job_ids):
+        states = {}
+        with self._lock:
+            names = list(self._tasks)
+        for name in names:
+            if name.partition('_')[0] in job_ids:
+                states[name] = self._get_state(name)
+        return states
+
+    def cancel(self, job_id, task_ids):
+        # Only tasks still waiting for a worker, running ones finish
+        with self._lock:
+            futures = [self._tasks[f'{job_id}_{task_id}'] for task_id in task_ids
+                       if f'{job_id}_{task_id}' in self._tasks]
+        for future in futures:
+            future.cancel()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+_executors: dict[str, Executor] = {}
+
+
+def get_executor(name: str | None = None) -> Executor:
+    """The executor named `name` (default: `EXECUTOR`, else slurm), shared within the process"""
+    name = name or os.getenv("EXECUTOR", "slurm")
+    if name not in EXECUTORS:
+        raise ValueError(f'Unknown executor {name}, expected one of {EXECUTORS}')
+    if name not in _executors:
+        if name == 'slurm':
+            _executors[name] = SlurmExecutor()
+        else:
+            workers = os.getenv("LOCAL_WORKERS")
+            _executors[name] = LocalExecutor(int(workers) if workers else None)
+    return _executors[name]
@@ -0,0 +1,124 @@
+"""
+Node worker mode: instead of one Slurm array task per range of matches, a
+handful of whole nodes are allocated and a worker on each node runs the
+tournament's tasks from a shared queue.
+
+The queue is the task file itself: a worker claims a task by atomically
+creating `<claims_dir>/<task_id>` (O_CREAT | O_EXCL, atomic on the shared file
+system), so every task runs exactly once across all workers. Each claimed task
+runs the normal array job script with `SLURM_ARRAY_TASK_ID` set, which writes
+the usual done marker, so completion tracking, ingestion and retries work as
+with plain array tasks.
+
+A worker runs as many tasks at once as the node's cores and memory allow for
+the per-match needs (`cpus_per_match`, `mem_per_match_mb`), and pins each
+running task to its own set of cores so agents never compete for CPU time
+within their move timeout.
+"""
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from c4league.executors import get_output_paths, expand_output_path
+
+CLAIMS_DIR_NAME = '.claims'
+
+
+def claim_task(claims_dir: Path, task_id: int) -> bool:
+    """Claim a task for this worker, False if another worker already has it"""
+    try:
+        fd = os.open(Path(claims_dir) / str(task_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(f'{os.uname().nodename} {os.getpid()}\n')
+    return True
+
+
+def _get_memory_mb() -> int:
+    """Memory of this allocation: Slurm's per-node limit if set, else the node's available memory"""
+    if os.getenv("SLURM_MEM_PER_NODE"):
+        return int(os.environ["SLURM_MEM_PER_NODE"])
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) // 1024
+    raise RuntimeError('Could not determine available memory')
+
+
+def get_slots(cpus_per_match: int, mem_per_match_mb: int | None = None) -> list[list[int]]:
+    """Disjoint sets of cores, one per concurrently running task (at least one)"""
+    cpus = sorted(os.sched_getaffinity(0))
+    n_slots = len(cpus) // cpus_per_match
+    if mem_per_match_mb:
+        n_slots = min(n_slots, _get_memory_mb() // mem_per_match_mb)
+    n_slots = max(n_slots, 1)
+    return [cpus[i * cpus_per_match:(i + 1) * cpus_per_match] for i in range(n_slots)]
+
+
+class NodeWorker:
+    """Claims and runs tasks until none are left, one per slot at a time"""
+
+    def __init__(self, job_script: Path, claims_dir: Path, task_ids: list[int], slots: list[list[int]],
+                 stop_claiming_after: float | None = None):
+        self.job_script = Path(job_script)
+        self.claims_dir = Path(claims_dir)
+        self.claims_dir.mkdir(parents=True, exist_ok=True)
+        self.task_ids = task_ids
+        self.slots = slots
+        # No new tasks after this many seconds, so running ones can finish within the allocation
+        self.deadline = time.monotonic() + stop_claiming_after if stop_claiming_after is not None else None
+        self.output_pattern, self.error_pattern = get_output_paths(str(self.job_script))
+        self._lock = threading.Lock()
+        self._next = 0
+        self.completed: dict[int, int] = {}
+
+    def _claim_next(self) -> int | None:
+        with self._lock:
+            while self._next < len(self.task_ids):
+                if self.deadline is not None and time.monotonic() > self.deadline:
+                    print('Claiming deadline reached, leaving the remaining tasks to other workers')
+                    return None
+                task_id = self.task_ids[self._next]
+                self._next += 1
+                if claim_task(self.claims_dir, task_id):
+                    return task_id
+        return None
+
+    def _run_task(self, task_id: int, cpus: list[int]) -> int:
+        job_id = os.getenv("SLURM_JOB_ID", "0")
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(task_id))
+        output_path = expand_output_path(self.output_pattern, job_id, task_id) if self.output_pattern else None
+        error_path = expand_output_path(self.error_pattern, job_id, task_id) if self.error_pattern else None
+        stdout = open(output_path, 'w') if output_path is not None else subprocess.DEVNULL
+        stderr = open(error_path, 'w') if error_path is not None else stdout
+        try:
+            # Pinned before exec, the agent containers started by the task inherit the affinity
+            return subprocess.run(['bash', str(self.job_script)], env=env, stdout=stdout, stderr=stderr,
+                                  preexec_fn=lambda: os.sched_setaffinity(0, cpus)).returncode
+        finally:
+            for f in {stdout, stderr}:
+                if f is not subprocess.DEVNULL:
+                    f.close()
+
+    def _run_slot(self, cpus: list[int]) -> None:
+        while (task_id := self._claim_next()) is not None:
+            print(f'Running task {task_id} on cores {cpus}')
+            start = time.perf_counter()
+            returncode = self._run_task(task_id, cpus)
+            with self._lock:
+                self.completed[task_id] = returncode
+            print(f'Task {task_id} finished with exit code {returncode} in {time.perf_counter() - start:.0f}s')
+
+    def run(self) -> dict[int, int]:
+        """Run tasks in all slots until the queue is drained, returns the exit codes of the tasks run here"""
+        print(f'Node worker on {os.uname().nodename}: {len(self.slots)} slots of {len(self.slots[0])} cores, '
+              f'{len(self.task_ids)} tasks in the queue')
+        with ThreadPoolExecutor(max_workers=len(self.slots)) as pool:
+            for future in [pool.submit(self._run_slot, cpus) for cpus in self.slots]:
+                future.result()
+        print(f'Node worker done, ran {len(self.completed)} tasks')
+        return self.completed
@@ -0,0 +1,91 @@
+"""
+Pairing strategies, deciding which agents play each other in a tournament.
+
+A tournament is played in rounds: the tournament manager asks its strategy
+for the pairings of the next round, plays them, and asks again with the
+updated scores until the strategy returns no more pairings.
+
+- `RoundRobinPairing` (default): every agent plays every other agent, in a
+  single round. N * (N - 1) / 2 matches.
+- `SwissPairing`: a fixed number of rounds (default ceil(log2 N) + 2) in
+  which agents are paired with opponents of similar score that they have not
+  played yet. N / 2 matches per round, O(N log N) in total. With an odd number
+  of agents the lowest ranked agent that has not had a bye yet sits the round
+  out (and scores nothing for it).
+"""
+import itertools
+import math
+import random
+
+from c4league.utils import TournamentPlayer
+
+Pairing = tuple[TournamentPlayer, TournamentPlayer]
+
+PAIRING_STRATEGIES = ['round_robin', 'swiss']
+
+
+def _pair_key(player1: TournamentPlayer, player2: TournamentPlayer) -> frozenset:
+    return frozenset([str(player1), str(player2)])
+
+
+class PairingStrategy:
+    def next_round(self, round_number: int, participants: list[TournamentPlayer],
+                   scores: dict[TournamentPlayer, float], played: set[frozenset]) -> list[Pairing]:
+        """
+        Pairings of round `round_number` (starting at 1) given the scores so far
+        and the pairs that already played (see `played_pairs`). An empty list
+        ends the tournament.
+        """
+        raise NotImplementedError
+
+
+class RoundRobinPairing(PairingStrategy):
+    def next_round(self, round_number, participants, scores, played):
+        if round_number > 1:
+            return []
+        return list(itertools.combinations(participants, 2))
+
+
+class SwissPairing(PairingStrategy):
+    def __init__(self, n_rounds: int | None = None, seed: int | None = None):
+        self.n_rounds = n_rounds
+        self.rng = random.Random(seed)
+        self.byes: set[str] = set()
+
+    def get_n_rounds(self, n_participants: int) -> int:
+        if self.n_rounds is not None:
+            return self.n_rounds
+        return math.ceil(math.log2(max(n_participants, 2))) + 2
+
+    def next_round(self, round_number, participants, scores, played):
+        if round_number > self.get_n_rounds(len(participants)) or len(participants) < 2:
+            return []
+        # Random order among equal scores, in particular in the first round
+        ranking = sorted(self.rng.sample(participants, len(participants)),
+                         key=lambda player: scores.get(player, 0.), reverse=True)
+        if len(ranking) % 2 == 1:
+            bye = next((player for player in reversed(ranking) if str(player) not in self.byes), ranking[-1])
+            self.byes.add(str(bye))
+            ranking.remove(bye)
+
+        pairings = []
+        unpaired = ranking
+        while len(unpaired) > 0:
+            player = unpaired[0]
+            # Closest ranked opponent not played yet, a rematch only if there is none
+            opponent = next((other for other in unpaired[1:] if _pair_key(player, other) not in played), unpaired[1])
+            pairings.append((player, opponent))
+            unpaired = [other for other in unpaired[1:] if other != opponent]
+        return pairings
+
+
+def played_pairs(pairings: list[Pairing]) -> set[frozenset]:
+    return set(_pair_key(player1, player2) for player1, player2 in pairings)
+
+
+def get_pairing_strategy(name: str, n_rounds: int | None = None) -> PairingStrategy:
+    if name == 'round_robin':
+        return RoundRobinPairing()
+    if name == 'swiss':
+        return SwissPairing(n_rounds)
+    raise ValueError(f'Unknown pairing strategy {name}, expected one of {PAIRING_STRATEGIES}')
@@ -1,2 +1,5 @@
 MINI_MATCH_GAMES = 4
-TIMEOUT = 5.0
\ No newline at end of file
+# Points shared by the agents of a match, whatever its number of games (see c4league.sequential)
+MATCH_POINTS = 4.0
+TIMEOUT = 5.0
+BUILD_CACHE_MAX_GB = 50.0
@@ -0,0 +1,91 @@
+"""
+Circuit breaker for agents that keep failing during a tournament.
+
+A broken agent (one that hangs, crashes or makes invalid moves) loses every
+game it plays by the failure reason `run_match.py` records. A hanging agent
+still takes up to `TIMEOUT` per move, in every game of every match. The
+`CircuitBreaker` counts each agent's failures by reason as the games of
+finished tasks come in. Once an agent has lost `max_failures` games by
+failure, and failures are at least `min_failure_rate` of its games, it is
+quarantined.
+
+The tournament manager then forfeits the agent's matches that are not in the
+standings yet (`forfeit_match_stats`: all games count as won by the
+opponent) and cancels tasks that only run forfeited matches. `run_match.py`
+skips forfeited matches in tasks that still run.
+"""
+from c4league.params import MATCH_POINTS
+from c4league.utils import TournamentPlayer
+from c4league.storage.stats import GameStats, MatchStats
+from c4league.storage.index import REGULAR_REASONS
+
+
+def get_failed_player(game: GameStats) -> TournamentPlayer | None:
+    """The agent that lost a game by failing (timeout, crash, invalid move), None for regular games"""
+    if game.reason in REGULAR_REASONS or game.winner is None:
+        return None
+    return game.player2 if game.winner == game.player1 else game.player1
+
+
+class CircuitBreaker:
+    """Per-agent failure counts, quarantining agents over the threshold"""
+
+    def __init__(self, max_failures: int, min_failure_rate: float = 0.):
+        self.max_failures = max_failures
+        self.min_failure_rate = min_failure_rate
+        self.games: dict[TournamentPlayer, int] = {}
+        self.failures: dict[TournamentPlayer, dict[str, int]] = {}
+        self.quarantined: list[TournamentPlayer] = []
+        # Games are seen again when the partial games of a retried match are read
+        self._seen_game_ids: set[str] = set()
+
+    def is_quarantined(self, player: TournamentPlayer) -> bool:
+        return player in self.quarantined
+
+    def record(self, games: list[GameStats]) -> list[TournamentPlayer]:
+        """Count the failures of new games, returns the agents quarantined because of them"""
+        for game in games:
+            if game.game_id in self._seen_game_ids:
+                continue
+            self._seen_game_ids.add(game.game_id)
+            for player in [game.player1, game.player2]:
+                self.games[player] = self.games.get(player, 0) + 1
+            failed_player = get_failed_player(game)
+            if failed_player is not None:
+                reasons = self.failures.setdefault(failed_player, {})
+                reasons[game.reason] = reasons.get(game.reason, 0) + 1
+        tripped = []
+        for player, reasons in self.failures.items():
+            n_failures = sum(reasons.values())
+            if (not self.is_quarantined(player) and n_failures >= self.max_failures
+                    and n_failures >= self.min_failure_rate * self.games[player]):
+                print(f'Quarantining {player}: {n_failures} of {self.games[player]} games failed {reasons}')
+                self.quarantined.append(player)
+                tripped.append(player)
+        return tripped
+
+    def get_report(self) -> dict[str, dict]:
+        """Games and failures by reason of every agent that failed at least once"""
+        return {
+            str(player): {
+                'games': self.games[player],
+                'failures': reasons,
+                'quarantined': self.is_quarantined(player),
+            }
+            for player, reasons in sorted(self.failures.items(), key=lambda item: -sum(item[1].values()))
+        }
+
+
+def forfeit_match_stats(match_id: str, tournament_id: str, players: tuple[TournamentPlayer, TournamentPlayer],
+                        quarantined: list[TournamentPlayer], timestamp: str) -> MatchStats:
+    """Result of a match forfeited by its quarantined player(s): every game is lost by them"""
+    forfeited_by = [player for player in players if player in quarantined]
+    return MatchStats(
+        match_id=match_id,
+        game_ids=[],
+        tournament_id=tournament_id,
+        timestamp=timestamp,
+        players=list(players),
+        result={player: 0. if player in forfeited_by else MATCH_POINTS for player in players},
+        forfeited_by=forfeited_by
+    )
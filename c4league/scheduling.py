@@ -0,0 +1,169 @@
+"""
+Duration-aware packing of matches into array tasks.
+
+A `DurationModel` predicts how long a match takes from per-agent history:
+the mean think time per move, the number of moves the agent makes per game
+and its container startup time, learned from the `GameMetrics` of earlier
+tournaments (`GAME_METRICS="1"`) as exponential moving averages. Agents
+without history are optionally probed (a container start and a few moves on
+the empty board), otherwise they get the median of the known agents.
+
+`pack_matches` spreads matches over a fixed number of tasks with the longest
+processing time first rule: the longest match goes to the least loaded task
+that still has room, and tasks are returned longest first, so the slowest
+work starts first and tasks end up of similar length.
+
+Both are opt-in (`DURATION_AWARE_SCHEDULING="1"`): without game metrics the
+model never gets any history and packs every match on `DEFAULT_COSTS`.
+"""
+import heapq
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+from c4utils.c4_types import Player, PLAYER1, BOARD_SIZE
+
+from c4league.params import MINI_MATCH_GAMES
+from c4league.utils import TournamentPlayer
+from c4league.storage.stats import GameStats
+
+# Used for agents without history or probe while no agent is known at all
+DEFAULT_COSTS = {'move_seconds': 0.1, 'moves_per_game': 15.0, 'startup_seconds': 5.0}
+# Weight of the latest tournament in the moving averages
+HISTORY_WEIGHT = 0.3
+
+
+def _agent_key(player: TournamentPlayer) -> str:
+    """History is kept per agent name, so it carries over to new versions"""
+    return f'{player.team_name}_{player.agent_name}'
+
+
+class DurationModel:
+    """Per-agent cost history, stored in a single JSON file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.agents: dict[str, dict[str, float]] = {}
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.agents = json.load(f)
+        # Costs for agents without history, e.g. from a probe, not saved
+        self.estimates: dict[str, dict[str, float]] = {}
+
+    def has_history(self, player: TournamentPlayer) -> bool:
+        return _agent_key(player) in self.agents
+
+    def get_costs(self, player: TournamentPlayer) -> dict[str, float]:
+        return self._get_costs(_agent_key(player))
+
+    def _get_costs(self, key: str) -> dict[str, float]:
+        if key in self.agents:
+            return self.agents[key]
+        if key in self.estimates:
+            return self.estimates[key]
+        if len(self.agents) == 0:
+            return DEFAULT_COSTS
+        return {name: float(np.median([costs[name] for costs in self.agents.values()])) for name in DEFAULT_COSTS}
+
+    def predict_match_seconds(self, player1: TournamentPlayer, player2: TournamentPlayer,
+                              warm_agents: bool = False, n_games: int = MINI_MATCH_GAMES) -> float:
+        """Predicted run time of a match of `n_games`: think time of both agents plus their container startups"""
+        startups = 1 if warm_agents else n_games
+        seconds = 0.
+        for player in [player1, player2]:
+            costs = self.get_costs(player)
+            seconds += n_games * costs['moves_per_game'] * costs['move_seconds']
+            seconds += startups * costs['startup_seconds']
+        return seconds
+
+    def update(self, games: list[GameStats]) -> int:
+        """Fold the metrics of a tournament's games into the history, returns the number of agents updated"""
+        observed: dict[str, dict[str, list[float]]] = {}
+        for game in games:
+            if game.metrics is None:
+                continue
+            for i, player in enumerate([game.player1, game.player2]):
+                agent = observed.setdefault(_agent_key(player), {'move_ms': [], 'moves': [], 'startup_ms': []})
+                # PLAYER1 makes the even numbered moves
+                move_ms = game.metrics.move_ms[i::2]
+                agent['move_ms'].extend(move_ms)
+                agent['moves'].append(len(move_ms))
+                if game.metrics.startup_ms[i] is not None:
+                    agent['startup_ms'].append(game.metrics.startup_ms[i])
+        for key, agent in observed.items():
+            if len(agent['move_ms']) == 0:
+                continue
+            costs = {'move_seconds': float(np.mean(agent['move_ms'])) / 1000,
+                     'moves_per_game': float(np.mean(agent['moves']))}
+            if len(agent['startup_ms']) > 0:
+                costs['startup_seconds'] = float(np.mean(agent['startup_ms'])) / 1000
+            previous = self.agents.get(key)
+            if previous is None:
+                # e.g. no startup time with warm agents: start from the estimate
+                self.agents[key] = dict(self._get_costs(key), **costs)
+            else:
+                for name, value in costs.items():
+                    previous[name] = (1 - HISTORY_WEIGHT) * previous[name] + HISTORY_WEIGHT * value
+        return len(observed)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.agents, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+def probe_agent(sif_path: Path, n_moves: int = 3, move_timeout: float = 10.0) -> dict[str, float] | None:
+    """Start an agent container and time a few moves on the empty board, None if the agent fails"""
+    from c4league.agent_session import AgentSession
+    session = AgentSession(sif_path)
+    try:
+        session.start()
+        move_seconds = []
+        for _ in range(n_moves):
+            session.reset()
+            board = np.zeros(BOARD_SIZE, dtype=Player)
+            start = time.perf_counter()
+            session.generate_move(board, PLAYER1, move_timeout)
+            move_seconds.append(time.perf_counter() - start)
+        return {'move_seconds': float(np.mean(move_seconds)), 'moves_per_game': DEFAULT_COSTS['moves_per_game'],
+                'startup_seconds': session.startup_seconds}
+    except Exception as e:
+        print(f'Probing {sif_path.name} failed: {e}')
+        return None
+    finally:
+        session.stop()
+
+
+def pack_matches(match_seconds: dict[str, float], n_tasks: int, max_matches_per_task: int) -> list[list[str]]:
+    """
+    Assign matches to `n_tasks` tasks of at most `max_matches_per_task`
+    matches each, longest match first onto the least loaded task with room.
+    Tasks are returned longest first, their matches longest first.
+    """
+    tasks: list[list[str]] = [[] for _ in range(n_tasks)]
+    loads = [0.] * n_tasks
+    heap = [(0., i) for i in range(n_tasks)]
+    for match_id in sorted(match_seconds, key=lambda match_id: match_seconds[match_id], reverse=True):
+        load, i = heapq.heappop(heap)
+        tasks[i].append(match_id)
+        loads[i] = load + match_seconds[match_id]
+        if len(tasks[i]) < max_matches_per_task:
+            heapq.heappush(heap, (loads[i], i))
+    order = sorted(range(n_tasks), key=lambda i: loads[i], reverse=True)
+    return [tasks[i] for i in order if len(tasks[i]) > 0]
+
+
+def predict_makespan(task_seconds: list[float], slots: int | None = None) -> float:
+    """Time until the last task ends when tasks start in order as soon as one of `slots` is free (default: all at once)"""
+    if len(task_seconds) == 0:
+        return 0.
+    if slots is None or slots >= len(task_seconds):
+        return max(task_seconds)
+    free_at = [0.] * slots
+    for seconds in task_seconds:
+        heapq.heappush(free_at, heapq.heappop(free_at) + seconds)
+    return max(free_at)
@@ -0,0 +1,86 @@
+"""
+Matches of a variable number of games, stopped early once the result is decided.
+
+A `MatchFormat` plays games in pairs (the same starting board with each
+agent first once) and checks a sequential probability ratio test after each
+pair, from `min_games` on. The test compares the hypotheses "the first agent
+scores 0.5 + delta per game" and "... 0.5 - delta". Draws count as half a
+point. For these symmetric hypotheses the log likelihood ratio is
+log((0.5 + delta) / (0.5 - delta)) times the score difference. So a match
+stops as soon as one agent leads by `decisive_lead` points. The lead is set
+by `alpha`, the error rate for both wrong decisions. Lopsided pairings
+therefore stop at `min_games`, and close ones play up to `max_games`.
+
+Every match is worth `MATCH_POINTS` whatever its length: the result is the
+agents' share of the games' points (see
+`generate_match_stats_from_game_stats`).
+
+With `min_games == max_games` (default `MINI_MATCH_GAMES`) matches have a
+fixed length, as before.
+"""
+import math
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+
+from c4league.params import MINI_MATCH_GAMES
+from c4league.utils import TournamentPlayer
+from c4league.bitboard import generate_starting_boards
+from c4league.storage.stats import GameStats
+
+
+@dataclass(frozen=True)
+class MatchFormat:
+    min_games: int = MINI_MATCH_GAMES
+    max_games: int = MINI_MATCH_GAMES
+    alpha: float = 0.05
+    delta: float = 0.25
+
+    def __post_init__(self):
+        if self.min_games < 2 or self.min_games % 2 or self.max_games % 2 or self.max_games < self.min_games:
+            raise ValueError(f'Invalid match format: {self.min_games} to {self.max_games} games '
+                             f'(even numbers, at least 2)')
+
+    @property
+    def is_sequential(self) -> bool:
+        return self.max_games > self.min_games
+
+    @property
+    def decisive_lead(self) -> float:
+        """Score difference at which the test decides"""
+        return math.log((1 - self.alpha) / self.alpha) / math.log((0.5 + self.delta) / (0.5 - self.delta))
+
+    def should_stop(self, games: list[GameStats], players: list[TournamentPlayer]) -> bool:
+        """Whether a match is over after these games (in the order played, between the two `players`)"""
+        n_games = len(games)
+        if n_games >= self.max_games:
+            return True
+        if n_games < self.min_games or n_games % 2:
+            return False
+        return abs(get_score_difference(games, players)) >= self.decisive_lead
+
+    def is_complete(self, games: list[GameStats]) -> bool:
+        """Whether the recorded games of a match are all it needed"""
+        if len(games) == 0 or len(games) % 2 or len(games) > self.max_games:
+            return False
+        return self.should_stop(games, [games[0].player1, games[0].player2])
+
+
+def get_score_difference(games: list[GameStats], players: list[TournamentPlayer]) -> float:
+    """Points of the first player minus points of the second (1 per win)"""
+    return float(sum((game.winner == players[0]) - (game.winner == players[1])
+                     for game in games if game.winner is not None))
+
+
+def get_extra_starting_boards(starting_board: np.ndarray, n_boards: int) -> list[np.ndarray]:
+    """
+    Random starting boards for game pairs beyond the empty and the tournament's
+    starting board, derived from the latter: the same for every match of the
+    tournament and every attempt of a match
+    """
+    if n_boards <= 0:
+        return []
+    seed = zlib.crc32(np.ascontiguousarray(starting_board, dtype=np.int8).tobytes())
+    boards = generate_starting_boards(n_boards, rng=np.random.default_rng(seed))
+    return [board.astype(starting_board.dtype) for board in boards]
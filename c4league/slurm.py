@@ -0,0 +1,58 @@
+"""Thin wrappers around the Slurm command line tools (sbatch, sacct, scancel)."""
+
+import subprocess
+
+TERMINAL_STATES = {
+    "COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY",
+    "NODE_FAIL", "PREEMPTED", "BOOT_FAIL", "DEADLINE",
+}
+
+
+def submit_job(script_path: str, *sbatch_args: str) -> str:
+    """Submit a job script and return its job id"""
+    result = subprocess.run(
+        ["sbatch", *sbatch_args, script_path],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to submit job: {result.stderr}")
+    return result.stdout.strip().split()[-1]
+
+
+def get_job_states(job_ids: list[str]) -> dict[str, str]:
+    """
+    Get the states of several jobs with a single sacct call.
+
+    Keys are the job ids as reported by sacct (array tasks appear as
+    `<job_id>_<task_id>`), job steps such as `.batch` are skipped.
+    """
+    if len(job_ids) == 0:
+        return {}
+    result = subprocess.run(
+        ["sacct", "-j", ",".join(job_ids), "--format=JobID,State", "--parsable2", "--noheader"],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to check job status: {result.stderr}")
+
+    states = {}
+    for line in result.stdout.strip().split('\n'):
+        if not line.strip():
+            continue
+        job_id, state = line.split('|')[:2]
+        if '.' in job_id:
+            continue
+        # sacct reports e.g. "CANCELLED by 1234"
+        states[job_id] = state.split()[0]
+    return states
+
+
+def cancel_jobs(job_ids: list[str]) -> None:
+    """Cancel jobs or single array tasks (as `<job_id>_<task_id>`) with a single scancel call"""
+    if len(job_ids) == 0:
+        return
+    result = subprocess.run(["scancel", *job_ids], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to cancel jobs: {result.stderr}")
@@ -0,0 +1,162 @@
+"""
+Staging of agent SIF images to node-local storage.
+
+At the start of a tournament hundreds of tasks open the same images on the
+shared file system at once. With staging enabled (`STAGE_AGENTS="1"`, see
+`run_match.py --stage-agents`), the first task on a node that needs an image
+copies it to a node-local directory (`AGENT_STAGE_DIR`, default
+`$TMPDIR/c4league_agents`, else `/dev/shm/c4league_agents`) under a file lock,
+and every task on that node then starts the agent from the local copy.
+
+- Copies are verified: the SHA-256 of the data read from the shared file
+  system must match the SHA-256 of the local copy.
+- Staged images are keyed by size and modification time of the source, so a
+  rebuilt agent is staged again.
+- Processes using the stage register themselves; the last one to leave
+  removes the staged images.
+- Every use is logged with an estimate of the time saved: the time reading
+  the image from the shared file system took, minus reading the local copy.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+CHUNK_SIZE = 8 * 1024 * 1024
+# Free space to keep on the staging file system, relative to the image size
+FREE_SPACE_MARGIN = 1.1
+
+
+def get_stage_dir() -> Path:
+    if os.getenv("AGENT_STAGE_DIR"):
+        return Path(os.environ["AGENT_STAGE_DIR"])
+    return Path(os.getenv("TMPDIR") or "/dev/shm") / 'c4league_agents'
+
+
+@contextmanager
+def _locked(lock_path: Path):
+    """Exclusive lock between the processes of a node"""
+    with open(lock_path, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _copy_with_hash(source: Path, destination: Path) -> str:
+    """Copy a file, returns the SHA-256 of the data read"""
+    hasher = hashlib.sha256()
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            hasher.update(chunk)
+            dst.write(chunk)
+    return hasher.hexdigest()
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AgentStage:
+    """Node-local copies of agent images, shared by the processes of a node while any of them uses it"""
+
+    def __init__(self, stage_dir: Path):
+        self.stage_dir = Path(stage_dir)
+        self.users_dir = self.stage_dir / '.users'
+        self.lock_path = self.stage_dir / '.lock'
+        self.uses = 0
+        self.saved_seconds = 0.
+        self.staging_seconds = 0.
+
+    def __enter__(self) -> 'AgentStage':
+        self.stage_dir.mkdir(parents=True, exist_ok=True)
+        with _locked(self.lock_path):
+            self.users_dir.mkdir(exist_ok=True)
+            (self.users_dir / str(os.getpid())).touch()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        print(f'Agent staging: {self.uses} images used from {self.stage_dir}, {self.staging_seconds:.1f}s spent '
+              f'staging, an estimated {self.saved_seconds - self.staging_seconds:.1f}s saved (net) over reading '
+              f'the shared file system')
+        with _locked(self.lock_path):
+            (self.users_dir / str(os.getpid())).unlink(missing_ok=True)
+            users = [user for user in self.users_dir.iterdir() if user.name.isdigit() and _is_alive(int(user.name))]
+            if len(users) == 0:
+                self.cleanup()
+
+    def cleanup(self) -> None:
+        """Remove all staged images (call with the stage lock held)"""
+        for entry in self.stage_dir.iterdir():
+            if entry.is_dir() and not entry.name.startswith('.'):
+                shutil.rmtree(entry, ignore_errors=True)
+            elif entry.name.endswith('.lock') and entry != self.lock_path:
+                entry.unlink(missing_ok=True)
+        shutil.rmtree(self.users_dir, ignore_errors=True)
+        print(f'Removed staged agents from {self.stage_dir}')
+
+    def _get_staged_dir(self, sif_path: Path) -> Path:
+        stat = os.stat(sif_path)
+        return self.stage_dir / f'{sif_path.stem}.{stat.st_size}.{stat.st_mtime_ns}'
+
+    def _stage(self, sif_path: Path, staged_dir: Path) -> dict:
+        """Copy and verify an image, returns its staging info"""
+        if shutil.disk_usage(self.stage_dir).free < FREE_SPACE_MARGIN * os.path.getsize(sif_path):
+            raise OSError(f'Not enough space in {self.stage_dir} to stage {sif_path.name}')
+        staged_dir.mkdir(exist_ok=True)
+        tmp_path = staged_dir / f'.{sif_path.name}.tmp'
+        start = time.perf_counter()
+        source_hash = _copy_with_hash(sif_path, tmp_path)
+        copy_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        staged_hash = _hash_file(tmp_path)
+        local_read_seconds = time.perf_counter() - start
+        if staged_hash != source_hash:
+            tmp_path.unlink()
+            raise ValueError(f'Staged copy of {sif_path.name} does not match the source')
+        os.replace(tmp_path, staged_dir / sif_path.name)
+        info = {'sha256': source_hash, 'copy_seconds': copy_seconds, 'local_read_seconds': local_read_seconds}
+        with open(staged_dir / 'info.json', 'w') as f:
+            json.dump(info, f)
+        return info
+
+    def stage(self, sif_path: Path) -> Path:
+        """Path of a node-local copy of an agent image, staging it first if needed; the original path on failure"""
+        sif_path = Path(sif_path)
+        try:
+            staged_dir = self._get_staged_dir(sif_path)
+            start = time.perf_counter()
+            with _locked(self.stage_dir / f'.{staged_dir.name}.lock'):
+                info_path = staged_dir / 'info.json'
+                if info_path.exists():
+                    with open(info_path, 'r') as f:
+                        info = json.load(f)
+                else:
+                    info = self._stage(sif_path, staged_dir)
+                    self.staging_seconds += time.perf_counter() - start
+                    print(f'Staged {sif_path.name} to {staged_dir} in {info["copy_seconds"]:.2f}s')
+        except (OSError, ValueError) as e:
+            print(f'Warning: could not stage {sif_path.name}, using the shared copy: {e}')
+            return sif_path
+        self.uses += 1
+        self.saved_seconds += info['copy_seconds'] - info['local_read_seconds']
+        return staged_dir / sif_path.name
@@ -0,0 +1,97 @@
+'''
+Incremental aggregation of tournament results.
+
+Matches are consumed as soon as their array task finishes, so partial standings
+are available while the tournament is still running and the final table only
+needs the matches that have not been consumed yet.
+'''
+
+import json
+import time
+from pathlib import Path
+
+from ..utils import TournamentPlayer
+from .stats import MatchStats, TournamentStats, TIMESTAMP_FORMAT
+from .ingestion import load_match_stats, write_match_stats
+from ..sequential import MatchFormat
+
+
+class TournamentAggregator:
+    """Keeps a running tournament table, updated match by match"""
+
+    def __init__(self, tournament_id: str, results_dir: Path, match_format: MatchFormat | None = None):
+        self.tournament_id = tournament_id
+        self.results_dir = Path(results_dir)
+        # Number of games that make a match complete
+        self.match_format = match_format or MatchFormat()
+        self.match_stats: dict[str, MatchStats] = {}
+        self.scores: dict[TournamentPlayer, float] = {}
+        self._earliest_timestamp: time.struct_time | None = None
+
+    def has_match(self, match_id: str) -> bool:
+        return match_id in self.match_stats
+
+    def ingest_match(self, match_id: str) -> MatchStats | None:
+        """Read the games of a finished match, write its match stats and add it to the table"""
+        return self.ingest_matches([match_id])[0]
+
+    def ingest_matches(self, match_ids: list[str], workers: int = 1) -> list[MatchStats | None]:
+        """
+        Ingest several finished matches, reading and parsing them with up to
+        `workers` processes. Matches are added to the table in the given order.
+        Returns the match stats per match id, None for incomplete matches.
+        """
+        pending_match_ids = [match_id for match_id in match_ids if not self.has_match(match_id)]
+        loaded_match_stats = [match_stats for match_stats in load_match_stats(self.results_dir, pending_match_ids, workers,
+                                                                             match_format=self.match_format)
+                              if match_stats is not None]
+        write_match_stats(self.results_dir, loaded_match_stats, workers)
+        for match_stats in loaded_match_stats:
+            self.add_match_stats(match_stats)
+        return [self.match_stats.get(match_id) for match_id in match_ids]
+
+    def add_match_stats(self, match_stats: MatchStats) -> None:
+        if match_stats.tournament_id != self.tournament_id:
+            raise ValueError(f'Match {match_stats.match_id} belongs to tournament {match_stats.tournament_id}')
+        self.match_stats[match_stats.match_id] = match_stats
+        for player, score in match_stats.result.items():
+            self.scores[player] = self.scores.get(player, 0.) + score
+        match_timestamp = time.strptime(match_stats.timestamp, TIMESTAMP_FORMAT)
+        if self._earliest_timestamp is None or match_timestamp < self._earliest_timestamp:
+            self._earliest_timestamp = match_timestamp
+
+    def remove_match(self, match_id: str) -> MatchStats:
+        """Take a match back out of the table, e.g. after it failed validation"""
+        match_stats = self.match_stats.pop(match_id)
+        for player, score in match_stats.result.items():
+            self.scores[player] -= score
+        timestamps = [time.strptime(_match_stats.timestamp, TIMESTAMP_FORMAT) for _match_stats in self.match_stats.values()]
+        self._earliest_timestamp = min(timestamps) if len(timestamps) > 0 else None
+        return match_stats
+
+    def get_tournament_stats(self, match_order: list[str] | None = None) -> TournamentStats:
+        """
+        Tournament stats over the matches ingested so far. `match_order` fixes
+        the order of `match_ids`, defaults to the order of ingestion.
+        """
+        if len(self.match_stats) == 0:
+            raise ValueError("No matches ingested yet")
+        match_ids = list(self.match_stats)
+        if match_order is not None:
+            match_ids = [match_id for match_id in match_order if match_id in self.match_stats]
+        return TournamentStats(
+            tournament_id=self.tournament_id,
+            timestamp=time.strftime(TIMESTAMP_FORMAT, self._earliest_timestamp),
+            match_ids=match_ids,
+            players=list(self.scores),
+            table=sorted(self.scores.items(), key=lambda x: x[1], reverse=True)
+        )
+
+    def write_standings(self, path: Path) -> None:
+        """Write the current (possibly partial) standings"""
+        if len(self.match_stats) == 0:
+            return
+        tmp_path = path.with_name(f'.{path.name}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.get_tournament_stats().generate_json(), f, ensure_ascii=False, indent=4)
+        tmp_path.replace(path)
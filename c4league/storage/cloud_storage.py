@@ -1,39 +1,222 @@
-"""Handles interface with Google Cloud Storage."""
+"""
+Handles interface with Google Cloud Storage.
+
+Submissions are accessed through a `StorageBackend`. The default `GCSBackend`
+creates its client once per process and shares one HTTP connection pool
+between all threads; `LocalBackend` serves a directory laid out like the
+bucket, for tests and for running a league without GCS
+(`STORAGE_BACKEND="local"`, `LOCAL_STORAGE_ROOT`).
+
+`download_blobs` downloads many files concurrently. Every file is written to a
+`.partial` file first: a failed attempt is retried (with exponential backoff)
+from where it stopped instead of from the first byte, and readers never see
+incomplete files.
+"""
+
+import base64
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO
 
-import json
-from typing import Any, Dict, List, Optional
 from google.cloud import storage
 from google.cloud.storage.client import Client
-from google.cloud.storage.bucket import Bucket
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_storage_client() -> Client:
-    return storage.Client.from_service_account_json(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
+SUBMISSIONS_PREFIX = "submissions"
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+RETRY_BACKOFF = 1.0
+
+
+@dataclass
+class BlobInfo:
+    name: str
+    size: int
+    generation: str | None = None
+    md5_hash: str | None = None
+
+
+class StorageBackend:
+    def list_blobs(self, prefix: str) -> list[BlobInfo]:
+        raise NotImplementedError
+
+    def get_blob(self, name: str) -> BlobInfo:
+        """Metadata of a single file, raises FileNotFoundError if it does not exist"""
+        raise NotImplementedError
+
+    def read_into(self, name: str, file_obj: BinaryIO, start: int = 0) -> None:
+        """Write the content of `name` from byte `start` on into `file_obj`"""
+        raise NotImplementedError
+
+
+class GCSBackend(StorageBackend):
+    def __init__(self, bucket_name: str, credentials_path: str | None, pool_size: int = DOWNLOAD_WORKERS):
+        self.client = _create_client(credentials_path, pool_size)
+        self.bucket = self.client.bucket(bucket_name)
+
+    def list_blobs(self, prefix):
+        # Only the fields needed to detect changes, keeps the listing pages small
+        blobs = self.client.list_blobs(self.bucket, prefix=prefix,
+                                       fields='items(name,size,generation,md5Hash),nextPageToken')
+        return [BlobInfo(blob.name, blob.size, str(blob.generation), blob.md5_hash) for blob in blobs]
+
+    def get_blob(self, name):
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(f'gs://{self.bucket.name}/{name}')
+        return BlobInfo(blob.name, blob.size, str(blob.generation), blob.md5_hash)
+
+    def read_into(self, name, file_obj, start=0):
+        # Checksums can only be verified on complete downloads ('auto' needs a newer google-resumable-media)
+        self.bucket.blob(name).download_to_file(file_obj, start=start if start > 0 else None,
+                                                checksum='md5' if start == 0 else None)
+
+
+class LocalBackend(StorageBackend):
+    """A directory with the same layout as the bucket"""
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def list_blobs(self, prefix):
+        blobs = []
+        for path in sorted(self.root.rglob('*')):
+            name = path.relative_to(self.root).as_posix()
+            if path.is_file() and name.startswith(prefix):
+                blobs.append(self.get_blob(name))
+        return blobs
 
-def get_bucket() -> Bucket:
-    return get_storage_client().bucket(os.getenv("GCS_BUCKET_NAME"))
+    def get_blob(self, name):
+        path = self.root / name
+        stat = path.stat()
+        # Same md5 encoding as GCS (base64 of the digest)
+        with open(path, 'rb') as f:
+            md5_hash = base64.b64encode(hashlib.md5(f.read()).digest()).decode()
+        return BlobInfo(name, stat.st_size, str(stat.st_mtime_ns), md5_hash)
+
+    def read_into(self, name, file_obj, start=0):
+        with open(self.root / name, 'rb') as f:
+            f.seek(start)
+            shutil.copyfileobj(f, file_obj)
+
+
+def _create_client(credentials_path: str | None, pool_size: int) -> Client:
+    """A client whose HTTP session keeps up to `pool_size` connections open, one per download thread"""
+    from google.auth.transport.requests import AuthorizedSession
+    from google.oauth2 import service_account
+    from requests.adapters import HTTPAdapter
+
+    if credentials_path is None:
+        return storage.Client()
+    credentials = service_account.Credentials.from_service_account_file(
+        credentials_path, scopes=["https://www.googleapis.com/auth/devstorage.read_write"])
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return storage.Client(project=credentials.project_id, credentials=credentials, _http=session)
+
+
+@lru_cache(maxsize=None)
+def get_storage_backend() -> StorageBackend:
+    backend = os.getenv("STORAGE_BACKEND", "gcs")
+    if backend == "gcs":
+        return GCSBackend(os.getenv("GCS_BUCKET_NAME"), os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
+    if backend == "local":
+        return LocalBackend(os.getenv("LOCAL_STORAGE_ROOT"))
+    raise ValueError(f'Unknown storage backend {backend}, expected gcs or local')
+
+
+def download_blob(backend: StorageBackend, name: str, destination_path: str | Path,
+                  retries: int = DOWNLOAD_RETRIES) -> None:
+    """Download a single file, resuming from the partial file after a failed attempt"""
+    destination_path = Path(destination_path)
+    destination_path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = destination_path.with_name(f'{destination_path.name}.partial')
+    size = backend.get_blob(name).size
+    for attempt in range(retries + 1):
+        try:
+            offset = partial_path.stat().st_size if partial_path.exists() else 0
+            if offset > size:
+                # Changed in storage since the last attempt
+                partial_path.unlink()
+                offset = 0
+            if offset < size:
+                with open(partial_path, 'ab') as f:
+                    backend.read_into(name, f, start=offset)
+            else:
+                partial_path.touch()
+            if partial_path.stat().st_size != size:
+                raise IOError(f'Incomplete download of {name}: {partial_path.stat().st_size} of {size} bytes')
+            os.replace(partial_path, destination_path)
+            return
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = RETRY_BACKOFF * 2 ** attempt
+            print(f'Download of {name} failed ({e}), retrying in {delay:.0f}s')
+            time.sleep(delay)
+
+
+def download_blobs(downloads: dict[str, str | Path], backend: StorageBackend | None = None,
+                   workers: int = DOWNLOAD_WORKERS, retries: int = DOWNLOAD_RETRIES) -> dict[str, Exception | None]:
+    """
+    Download files concurrently, `downloads` maps blob names to destination
+    paths. A failing file does not stop the others; returns the error per
+    blob name (None if it was downloaded).
+    """
+    backend = backend if backend is not None else get_storage_backend()
+    start = time.perf_counter()
+
+    def _download(name: str) -> Exception | None:
+        try:
+            download_blob(backend, name, downloads[name], retries)
+        except Exception as e:
+            return e
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        errors = dict(zip(downloads, executor.map(_download, downloads)))
+    n_failed = sum(error is not None for error in errors.values())
+    print(f'Downloaded {len(downloads) - n_failed} of {len(downloads)} files in {time.perf_counter() - start:.1f}s')
+    return errors
+
+
+def get_agent_blob_name(agent: dict[str, str]) -> str:
+    team_name, agent_name, version = agent['team_name'], agent['agent_name'], agent['version']
+    return f"{SUBMISSIONS_PREFIX}/{team_name}/{agent_name}/{agent_name}_v{version}.zip"
+
+def get_agent_from_blob_name(blob_name: str) -> dict[str, str]:
+    data = blob_name.split("/")
+    assert len(data) == 4
+    team_name, agent_name = data[1], data[2]
+    version = data[3].split("_")[1].split(".")[0][1:]
+    return {'team_name': team_name, 'agent_name': agent_name, 'version': version}
+
+def list_submissions() -> list[BlobInfo]:
+    return get_storage_backend().list_blobs(prefix=SUBMISSIONS_PREFIX)
 
 def get_submitted_agents() -> list[dict[str, str]]:
-    bucket = get_bucket()
-    agent_blobs = bucket.list_blobs(prefix="submissions")
-    submitted_agents = []
-    for agent_blob in agent_blobs:
-        data = agent_blob.name.split("/")
-        assert len(data) == 4
-        team_name, agent_name = data[1], data[2]
-        version = data[3].split("_")[1].split(".")[0][1:]
-        submitted_agents.append({'team_name': team_name, 'agent_name': agent_name, 'version': version})
-    return submitted_agents
+    return [get_agent_from_blob_name(agent_blob.name) for agent_blob in list_submissions()]
 
 def download_agent(agent: dict[str, str], destination_dir: str) -> None:
-    bucket = get_bucket()
-    team_name, agent_name, version = agent['team_name'], agent['agent_name'], agent['version']
-    filename = f"{agent_name}_v{version}.zip"
-    blob_path = f"submissions/{team_name}/{agent_name}/{filename}"
-    agent_blob = bucket.blob(blob_path)
-    if not os.path.exists(destination_dir):
-        os.makedirs(destination_dir)
-    agent_blob.download_to_filename(os.path.join(destination_dir, filename))
+    blob_name = get_agent_blob_name(agent)
+    download_blob(get_storage_backend(), blob_name, os.path.join(destination_dir, os.path.basename(blob_name)))
+
+def download_agents(agents: list[dict[str, str]], destination_dirs: list[str],
+                    workers: int = DOWNLOAD_WORKERS) -> list[Exception | None]:
+    """Download several agents concurrently, returns the error per agent (None if downloaded)"""
+    blob_names = [get_agent_blob_name(agent) for agent in agents]
+    downloads = {blob_name: os.path.join(destination_dir, os.path.basename(blob_name))
+                 for blob_name, destination_dir in zip(blob_names, destination_dirs)}
+    errors = download_blobs(downloads, workers=workers)
+    return [errors[blob_name] for blob_name in blob_names]
@@ -0,0 +1,244 @@
+'''
+SQLite index over the results of all tournaments.
+
+Tournaments are added once they are complete (from their `TournamentStats`,
+`MatchStats` and `GameStats`), so questions spanning many tournaments - the
+history of an agent or team, head-to-head records, why an agent loses games -
+are answered from indexed tables instead of re-reading `tournament_results`.
+
+Players are stored as `str(TournamentPlayer)` (`<team>_<agent>_v<version>`),
+with the team name in a separate column. Timestamps use `TIMESTAMP_FORMAT`,
+which sorts lexicographically.
+
+Matches reused from an earlier tournament (`reused_from`) count in the
+standings of every tournament that reused them, but their games belong to the
+original match only. Match counts across tournaments therefore skip reused
+matches, and forfeited matches (`forfeited_by`, no games played) are counted
+separately.
+'''
+
+import json
+import sqlite3
+from pathlib import Path
+
+from ..utils import TournamentPlayer
+from .stats import GameStats, MatchStats, TournamentStats, tournament_stats_from_json, match_stats_from_json
+from .ingestion import load_match_games
+
+# Reasons that end a game normally, every other reason is a failure of the losing agent
+REGULAR_REASONS = ('Connect 4', 'Draw')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tournaments (
+    tournament_id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    n_players INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS standings (
+    tournament_id TEXT NOT NULL,
+    player TEXT NOT NULL,
+    team_name TEXT NOT NULL,
+    score REAL NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (tournament_id, player)
+);
+CREATE INDEX IF NOT EXISTS standings_player ON standings (player);
+CREATE INDEX IF NOT EXISTS standings_team ON standings (team_name);
+
+-- One row per player and match
+CREATE TABLE IF NOT EXISTS match_results (
+    match_id TEXT NOT NULL,
+    tournament_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    player TEXT NOT NULL,
+    team_name TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    score REAL NOT NULL,
+    opponent_score REAL NOT NULL,
+    reused_from TEXT,
+    forfeited_by TEXT,
+    PRIMARY KEY (match_id, player)
+);
+CREATE INDEX IF NOT EXISTS match_results_player ON match_results (player, timestamp);
+CREATE INDEX IF NOT EXISTS match_results_team ON match_results (team_name, timestamp);
+CREATE INDEX IF NOT EXISTS match_results_pair ON match_results (player, opponent);
+CREATE INDEX IF NOT EXISTS match_results_tournament ON match_results (tournament_id);
+
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    match_id TEXT NOT NULL,
+    tournament_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    player1 TEXT NOT NULL,
+    player2 TEXT NOT NULL,
+    winner TEXT,
+    loser TEXT,
+    reason TEXT NOT NULL,
+    n_moves INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_match ON games (match_id);
+CREATE INDEX IF NOT EXISTS games_tournament ON games (tournament_id);
+CREATE INDEX IF NOT EXISTS games_loser_reason ON games (loser, reason);
+CREATE INDEX IF NOT EXISTS games_reason ON games (reason, timestamp);
+'''
+# Columns added to existing indexes when they are opened
+_ADDED_COLUMNS = {'match_results': ['reused_from TEXT', 'forfeited_by TEXT']}
+# Matches actually played in their tournament
+_PLAYED_MATCH = 'reused_from IS NULL AND forfeited_by IS NULL'
+
+
+def _player_key(player: TournamentPlayer | str) -> str:
+    return str(player)
+
+
+class ResultsIndex:
+    """Cross-tournament results store, see module docstring"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.executescript(_SCHEMA)
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = [row[1] for row in self.connection.execute(f'PRAGMA table_info({table})')]
+            for column in columns:
+                if column.split()[0] not in existing:
+                    self.connection.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> 'ResultsIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def has_tournament(self, tournament_id: str) -> bool:
+        row = self.connection.execute('SELECT 1 FROM tournaments WHERE tournament_id = ?', (tournament_id,)).fetchone()
+        return row is not None
+
+    def add_tournament(self, tournament_stats: TournamentStats, match_stats: list[MatchStats],
+                       games: list[GameStats]) -> None:
+        """Add (or replace) a complete tournament in a single transaction"""
+        tournament_id = tournament_stats.tournament_id
+        with self.connection:
+            for table in ['tournaments', 'standings', 'match_results', 'games']:
+                self.connection.execute(f'DELETE FROM {table} WHERE tournament_id = ?', (tournament_id,))
+            self.connection.execute('INSERT INTO tournaments VALUES (?, ?, ?)',
+                                    (tournament_id, tournament_stats.timestamp, len(tournament_stats.players)))
+            self.connection.executemany('INSERT INTO standings VALUES (?, ?, ?, ?, ?)', [
+                (tournament_id, _player_key(player), player.team_name, score, rank)
+                for rank, (player, score) in enumerate(tournament_stats.table, start=1)
+            ])
+            self.connection.executemany('INSERT INTO match_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+                (match.match_id, tournament_id, match.timestamp, _player_key(player), player.team_name,
+                 _player_key(opponent), match.result[player], match.result[opponent], match.reused_from,
+                 ','.join(map(_player_key, match.forfeited_by)) if match.forfeited_by is not None else None)
+                for match in match_stats
+                for player, opponent in [(match.players[0], match.players[1]), (match.players[1], match.players[0])]
+            ])
+            self.connection.executemany('INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+                (game.game_id, game.match_id, tournament_id, game.timestamp, _player_key(game.player1),
+                 _player_key(game.player2),
+                 _player_key(game.winner) if game.winner is not None else None,
+                 _player_key(game.player2 if game.winner == game.player1 else game.player1)
+                 if game.winner is not None else None,
+                 game.reason, len(game.moves))
+                for game in games
+            ])
+
+    def add_tournament_dir(self, results_dir: Path) -> bool:
+        """Index a finished tournament from its results directory, False if it has no tournament stats"""
+        results_dir = Path(results_dir)
+        tournament_id = results_dir.name
+        tournament_file = results_dir / f'{tournament_id}.json'
+        if not tournament_file.exists():
+            return False
+        with open(tournament_file, 'r') as f:
+            tournament_stats = tournament_stats_from_json(json.load(f))
+        match_stats = []
+        games = []
+        for match_id in tournament_stats.match_ids:
+            with open(results_dir / match_id / f'{match_id}.json', 'r') as f:
+                match_stats.append(match_stats_from_json(json.load(f)))
+            games += load_match_games(results_dir / match_id)
+        self.add_tournament(tournament_stats, match_stats, games)
+        return True
+
+    # --- Queries ---
+
+    def _query(self, sql: str, params: tuple) -> list[dict]:
+        cursor = self.connection.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def agent_history(self, player: TournamentPlayer | str, since: str | None = None) -> list[dict]:
+        """
+        Score and rank of an agent in every tournament it played (since `since`),
+        oldest first, with the number of matches it actually played there
+        """
+        return self._query(f'''
+            SELECT t.tournament_id, t.timestamp, s.score, s.rank, t.n_players,
+                   (SELECT COUNT(*) FROM match_results m
+                    WHERE m.player = s.player AND m.tournament_id = s.tournament_id AND {_PLAYED_MATCH}) AS played_matches
+            FROM standings s JOIN tournaments t ON t.tournament_id = s.tournament_id
+            WHERE s.player = ? AND t.timestamp >= ?
+            ORDER BY t.timestamp
+        ''', (_player_key(player), since or ''))
+
+    def team_history(self, team_name: str, since: str | None = None) -> list[dict]:
+        """Like `agent_history`, for all agents (and versions) of a team"""
+        return self._query('''
+            SELECT t.tournament_id, t.timestamp, s.player, s.score, s.rank, t.n_players
+            FROM standings s JOIN tournaments t ON t.tournament_id = s.tournament_id
+            WHERE s.team_name = ? AND t.timestamp >= ?
+            ORDER BY t.timestamp, s.rank
+        ''', (team_name, since or ''))
+
+    def head_to_head(self, player: TournamentPlayer | str, opponent: TournamentPlayer | str,
+                     since: str | None = None) -> dict:
+        """
+        Matches and games between two agents, from the point of view of `player`.
+        Every played match counts once (not again in tournaments that reused it),
+        forfeits are counted separately.
+        """
+        player, opponent = _player_key(player), _player_key(opponent)
+        matches = self.connection.execute(f'''
+            SELECT COUNT(*), COALESCE(SUM(score > opponent_score), 0), COALESCE(SUM(score < opponent_score), 0),
+                   COALESCE(SUM(score), 0), COALESCE(SUM(opponent_score), 0)
+            FROM match_results WHERE player = ? AND opponent = ? AND timestamp >= ? AND {_PLAYED_MATCH}
+        ''', (player, opponent, since or '')).fetchone()
+        forfeits = self.connection.execute('''
+            SELECT COUNT(*) FROM match_results
+            WHERE player = ? AND opponent = ? AND timestamp >= ? AND forfeited_by IS NOT NULL
+        ''', (player, opponent, since or '')).fetchone()[0]
+        games = self.connection.execute('''
+            SELECT COUNT(*), COALESCE(SUM(winner = ?), 0), COALESCE(SUM(winner = ?), 0), COALESCE(SUM(winner IS NULL), 0)
+            FROM games
+            WHERE ((player1 = ? AND player2 = ?) OR (player1 = ? AND player2 = ?)) AND timestamp >= ?
+        ''', (player, opponent, player, opponent, opponent, player, since or '')).fetchone()
+        return {
+            'matches': matches[0],
+            'match_wins': matches[1],
+            'match_losses': matches[2],
+            'match_draws': matches[0] - matches[1] - matches[2],
+            'score': matches[3],
+            'opponent_score': matches[4],
+            'games': games[0],
+            'game_wins': games[1],
+            'game_losses': games[2],
+            'game_draws': games[3],
+            'forfeits': forfeits,
+        }
+
+    def failure_reasons(self, player: TournamentPlayer | str | None = None,
+                        since: str | None = None) -> dict[str, int]:
+        """Number of games lost per failure reason (timeouts, crashes, invalid moves), for one agent or all"""
+        sql = 'SELECT reason, COUNT(*) FROM games WHERE reason NOT IN (?, ?) AND timestamp >= ?'
+        params = (*REGULAR_REASONS, since or '')
+        if player is not None:
+            sql += ' AND loser = ?'
+            params += (_player_key(player),)
+        rows = self.connection.execute(sql + ' GROUP BY reason ORDER BY COUNT(*) DESC', params).fetchall()
+        return dict(rows)
@@ -0,0 +1,117 @@
+'''
+Parallel ingestion of match results.
+
+Reading game files is I/O bound (and slow on shared file systems), parsing and
+validating them is CPU bound. Matches are split into chunks handled by a
+process pool; each worker reads its chunk with a thread pool and then runs
+`game_stats_from_json`, `check_games` and match stats generation. Results are returned in the order of the requested match ids, so
+the aggregated output does not depend on the number of workers.
+
+A match is complete once it has all the games its `MatchFormat` asks for
+(a fixed `MINI_MATCH_GAMES` by default, see c4league.sequential).
+'''
+
+import json
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+from ..sequential import MatchFormat
+from .stats import GameStats, MatchStats, game_stats_from_json, generate_match_stats_from_game_stats
+from .records import RECORD_SUFFIX, decode_game_records, read_game_records
+
+
+def get_game_result_files(match_dir: Path) -> list[Path]:
+    """Game files of a match (`<match_id>_g<id>.json`), in a stable order"""
+    return sorted(_file for _file in match_dir.iterdir() if _file.name.endswith('.json') and _file.name[-12:-10] == '_g')
+
+
+def get_match_record_file(match_dir: Path) -> Path:
+    return match_dir / f'{match_dir.name}{RECORD_SUFFIX}'
+
+
+def load_match_games(match_dir: Path) -> list[GameStats]:
+    """Games of a match, from its binary record file if present, else from its JSON files"""
+    if get_match_record_file(match_dir).exists():
+        return read_game_records(get_match_record_file(match_dir))
+    game_stats = []
+    for game_result_file in get_game_result_files(match_dir):
+        with open(game_result_file, 'r') as f:
+            game_stats.append(game_stats_from_json(json.load(f)))
+    return game_stats
+
+
+def read_match_files(match_dir: Path, match_format: MatchFormat | None = None) -> list[str] | bytes | None:
+    """
+    Raw contents of a match's games: the binary record file if present,
+    otherwise the game JSON files. None if the match is incomplete.
+    """
+    match_format = match_format or MatchFormat()
+    if get_match_record_file(match_dir).exists():
+        with open(get_match_record_file(match_dir), 'rb') as f:
+            return f.read()
+    game_result_files = get_game_result_files(match_dir)
+    if not match_format.min_games <= len(game_result_files) <= match_format.max_games:
+        print(f'Not all game result files found for match {match_dir.name}')
+        return None
+    raw_games = []
+    for game_result_file in game_result_files:
+        with open(game_result_file, 'r') as f:
+            raw_games.append(f.read())
+    return raw_games
+
+
+def parse_match(raw_games: list[str] | bytes | None, match_format: MatchFormat | None = None) -> MatchStats | None:
+    """Parse and validate the games of a match, None if incomplete or invalid"""
+    if raw_games is None:
+        return None
+    if isinstance(raw_games, bytes):
+        games = decode_game_records(raw_games)
+    else:
+        games = [game_stats_from_json(json.loads(raw)) for raw in raw_games]
+    if not (match_format or MatchFormat()).is_complete(games):
+        print(f'Not all games found for match {games[0].match_id if games else "?"}')
+        return None
+    try:
+        return generate_match_stats_from_game_stats(games)
+    except ValueError as e:
+        print(f'Could not generate match stats: {e}')
+        return None
+
+
+def _load_match_chunk(match_dirs: list[Path], io_threads: int,
+                      match_format: MatchFormat | None = None) -> list[MatchStats | None]:
+    """Runs in a worker process: read a chunk of matches with threads, then parse them"""
+    with ThreadPoolExecutor(max_workers=io_threads) as io_pool:
+        raw_matches = list(io_pool.map(lambda match_dir: read_match_files(match_dir, match_format), match_dirs))
+    return [parse_match(raw_games, match_format) for raw_games in raw_matches]
+
+
+def load_match_stats(results_dir: Path, match_ids: list[str], workers: int = 1,
+                     io_threads: int = 4, match_format: MatchFormat | None = None) -> list[MatchStats | None]:
+    """
+    Match stats for each match id (None for incomplete/invalid matches), using
+    up to `workers` processes with `io_threads` reader threads each.
+    """
+    match_dirs = [Path(results_dir) / match_id for match_id in match_ids]
+    if workers <= 1 or len(match_ids) <= 1:
+        return [parse_match(read_match_files(match_dir, match_format), match_format) for match_dir in match_dirs]
+
+    # Only the parsed match stats travel between processes, not the raw files
+    chunksize = max(1, -(-len(match_dirs) // (4 * workers)))
+    chunks = [match_dirs[i:i + chunksize] for i in range(0, len(match_dirs), chunksize)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_load_match_chunk, chunks, [io_threads] * len(chunks), [match_format] * len(chunks))
+        return [match_stats for chunk_results in results for match_stats in chunk_results]
+
+
+def write_match_stats(results_dir: Path, match_stats: list[MatchStats], workers: int = 1) -> None:
+    def _write(_match_stats: MatchStats) -> None:
+        with open(Path(results_dir) / _match_stats.match_id / f'{_match_stats.match_id}.json', 'w') as f:
+            json.dump(_match_stats.generate_json(), f, ensure_ascii=False, indent=4)
+
+    if workers <= 1:
+        for _match_stats in match_stats:
+            _write(_match_stats)
+        return
+    with ThreadPoolExecutor(max_workers=4 * workers) as io_pool:
+        list(io_pool.map(_write, match_stats))
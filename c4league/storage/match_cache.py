@@ -0,0 +1,64 @@
+'''
+Cache of match results across tournaments, for incremental tournaments.
+
+A match between two agents is keyed by the identities of both agent
+containers (see `container_utils.get_sif_identity`), so an entry becomes stale
+as soon as either agent is rebuilt. Only matches that were actually played
+are cached; a tournament that reuses an entry records it as a new `MatchStats`
+with `reused_from` pointing to the original match.
+'''
+
+import json
+import os
+from pathlib import Path
+
+from .stats import MatchStats, match_stats_from_json
+
+
+def _pair_key(identity_a: str, identity_b: str) -> str:
+    return '|'.join(sorted([identity_a, identity_b]))
+
+
+def reuse_match_stats(match_stats: MatchStats, match_id: str, tournament_id: str, timestamp: str) -> MatchStats:
+    """A cached match result, recorded as a match of another tournament"""
+    return MatchStats(
+        match_id=match_id,
+        game_ids=match_stats.game_ids,
+        tournament_id=tournament_id,
+        timestamp=timestamp,
+        players=match_stats.players,
+        result=match_stats.result,
+        reused_from=match_stats.match_id
+    )
+
+
+class MatchCache:
+    """Played matches by pair of agent identities, stored in a single JSON file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+
+    def get(self, identity_a: str, identity_b: str) -> MatchStats | None:
+        entry = self.entries.get(_pair_key(identity_a, identity_b))
+        return match_stats_from_json(entry) if entry is not None else None
+
+    def put(self, identity_a: str, identity_b: str, match_stats: MatchStats) -> None:
+        self.entries[_pair_key(identity_a, identity_b)] = match_stats.generate_json()
+
+    def prune(self, identities: set[str]) -> int:
+        """Drop entries involving agents that are no longer current, returns the number dropped"""
+        stale_keys = [key for key in self.entries if not set(key.split('|')) <= identities]
+        for key in stale_keys:
+            del self.entries[key]
+        return len(stale_keys)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
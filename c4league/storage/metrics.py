@@ -0,0 +1,95 @@
+'''
+Aggregates the `GameMetrics` recorded with games (see `run_match.py --metrics`)
+over a tournament:
+
+- per agent: move latency percentiles, container startup times, peak memory
+  and its share of the total think and CPU time,
+- the slowest matches, by time spent in agent startups and moves.
+
+Games without metrics are skipped.
+'''
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .stats import GameStats
+
+PERCENTILES = [50, 95, 99]
+
+
+def _agent_moves(game: GameStats) -> dict[str, list[int]]:
+    """Think times per agent, PLAYER1 makes the even numbered moves"""
+    return {
+        str(game.player1): game.metrics.move_ms[0::2],
+        str(game.player2): game.metrics.move_ms[1::2],
+    }
+
+
+def get_metrics_report(games: list[GameStats], n_slowest: int = 10) -> dict:
+    games = [game for game in games if game.metrics is not None]
+    move_ms: dict[str, list[int]] = {}
+    startup_ms: dict[str, list[int]] = {}
+    peak_rss_kb: dict[str, int] = {}
+    cpu_ms: dict[str, int] = {}
+    match_ms: dict[str, int] = {}
+    for game in games:
+        for agent, times in _agent_moves(game).items():
+            move_ms.setdefault(agent, []).extend(times)
+        for i, agent in enumerate([str(game.player1), str(game.player2)]):
+            if game.metrics.startup_ms[i] is not None:
+                startup_ms.setdefault(agent, []).append(game.metrics.startup_ms[i])
+            if game.metrics.peak_rss_kb[i] is not None:
+                peak_rss_kb[agent] = max(peak_rss_kb.get(agent, 0), game.metrics.peak_rss_kb[i])
+            if game.metrics.cpu_ms[i] is not None:
+                cpu_ms[agent] = cpu_ms.get(agent, 0) + game.metrics.cpu_ms[i]
+        game_ms = sum(game.metrics.move_ms) + sum(ms for ms in game.metrics.startup_ms if ms is not None)
+        match_ms[game.match_id] = match_ms.get(game.match_id, 0) + game_ms
+
+    total_think_ms = sum(sum(times) for times in move_ms.values())
+    total_cpu_ms = sum(cpu_ms.values())
+    agents = []
+    for agent, times in move_ms.items():
+        times = np.array(times, dtype=np.float64)
+        row = {'agent': agent, 'moves': len(times)}
+        for percentile in PERCENTILES:
+            row[f'p{percentile}_move_ms'] = float(np.percentile(times, percentile)) if len(times) > 0 else None
+        row['max_move_ms'] = int(times.max()) if len(times) > 0 else None
+        row['mean_startup_ms'] = float(np.mean(startup_ms[agent])) if agent in startup_ms else None
+        row['peak_rss_kb'] = peak_rss_kb.get(agent)
+        row['think_share'] = float(times.sum() / total_think_ms) if total_think_ms > 0 else None
+        row['cpu_share'] = cpu_ms[agent] / total_cpu_ms if agent in cpu_ms and total_cpu_ms > 0 else None
+        agents.append(row)
+
+    slowest = sorted(match_ms.items(), key=lambda item: item[1], reverse=True)[:n_slowest]
+    return {
+        'games': len(games),
+        'agents': sorted(agents, key=lambda row: row['think_share'] or 0., reverse=True),
+        'slowest_matches': [{'match_id': match_id, 'agent_ms': ms} for match_id, ms in slowest],
+    }
+
+
+def write_metrics_report(path: Path, report: dict) -> None:
+    with open(path, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+
+
+def format_metrics_report(report: dict) -> str:
+    def _fmt(value, digits=0):
+        return '-' if value is None else f'{value:.{digits}f}'
+
+    lines = [f"{report['games']} games with metrics", '',
+             f"{'agent':<40} {'moves':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+             f"{'startup ms':>10} {'peak MB':>8} {'think %':>8} {'cpu %':>6}"]
+    for row in report['agents']:
+        lines.append(
+            f"{row['agent']:<40} {row['moves']:>7} {_fmt(row['p50_move_ms']):>8} {_fmt(row['p95_move_ms']):>8} "
+            f"{_fmt(row['p99_move_ms']):>8} {_fmt(row['max_move_ms']):>8} {_fmt(row['mean_startup_ms']):>10} "
+            f"{_fmt(row['peak_rss_kb'] / 1024 if row['peak_rss_kb'] is not None else None):>8} "
+            f"{_fmt(100 * row['think_share'] if row['think_share'] is not None else None, 1):>8} "
+            f"{_fmt(100 * row['cpu_share'] if row['cpu_share'] is not None else None, 1):>6}")
+    lines += ['', 'Slowest matches (startup + think time):']
+    for row in report['slowest_matches']:
+        lines.append(f"  {row['match_id']:<30} {row['agent_ms'] / 1000:8.1f}s")
+    return '\n'.join(lines)
@@ -0,0 +1,185 @@
+'''
+Bradley-Terry ratings over all matches played so far, across tournaments.
+
+The rating state accumulates a dense results matrix: `points[i, j]` is the
+score of agent i against agent j (1 per win, 0.5 per draw) and
+`games[i, j]` the number of games between them. Strengths are fitted with the
+minorization-maximization algorithm (Hunter, 2004), one vectorized update of
+all agents per iteration, warm-started from the previous fit.
+
+Every agent also gets `prior_games` virtual drawn games against an average
+opponent, which keeps strengths finite for agents that won or lost all their
+games and makes the covariance well defined. Ratings are reported on the Elo
+scale (400 points = 10:1 odds), centered at `ELO_BASE`, with confidence
+intervals from the inverse Fisher information.
+'''
+
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .stats import MatchStats
+
+ELO_BASE = 1500.
+ELO_SCALE = 400. / math.log(10.)
+CONFIDENCE_Z = 1.96
+
+
+class RatingState:
+    """Persistent results matrix and Bradley-Terry fit, see module docstring"""
+
+    def __init__(self, prior_games: float = 1.):
+        self.prior_games = prior_games
+        self.players: list[str] = []
+        self.index: dict[str, int] = {}
+        self.points = np.zeros((0, 0))
+        self.games = np.zeros((0, 0))
+        self.log_strengths = np.zeros(0)
+        self.match_ids: set[str] = set()
+
+    @property
+    def n_players(self) -> int:
+        return len(self.players)
+
+    def _get_indices(self, players: list[str]) -> np.ndarray:
+        """Indices of players, adding new ones to the matrices"""
+        new_players = [player for player in dict.fromkeys(players) if player not in self.index]
+        if len(new_players) > 0:
+            for player in new_players:
+                self.index[player] = len(self.players)
+                self.players.append(player)
+            n_new = len(new_players)
+            self.points = np.pad(self.points, ((0, n_new), (0, n_new)))
+            self.games = np.pad(self.games, ((0, n_new), (0, n_new)))
+            self.log_strengths = np.pad(self.log_strengths, (0, n_new))
+        return np.array([self.index[player] for player in players], dtype=np.int64)
+
+    def add_games(self, players1: list[str], players2: list[str], scores1: np.ndarray,
+                  n_games: np.ndarray | None = None) -> None:
+        """
+        Add results in bulk: `scores1[k]` is the score of `players1[k]` over
+        `n_games[k]` games (default 1) against `players2[k]`.
+        """
+        indices1 = self._get_indices(list(players1))
+        indices2 = self._get_indices(list(players2))
+        scores1 = np.asarray(scores1, dtype=np.float64)
+        n_games = np.ones_like(scores1) if n_games is None else np.asarray(n_games, dtype=np.float64)
+        np.add.at(self.points, (indices1, indices2), scores1)
+        np.add.at(self.points, (indices2, indices1), n_games - scores1)
+        np.add.at(self.games, (indices1, indices2), n_games)
+        np.add.at(self.games, (indices2, indices1), n_games)
+
+    def add_match_stats(self, match_stats: list[MatchStats]) -> int:
+        """
+        Add matches not seen before, returns the number added. Reused results
+        (see `match_cache`) only count if their original match was not added,
+        forfeits (see `c4league.quarantine`) do not count at all.
+        """
+        players1, players2, scores1, n_games = [], [], [], []
+        for _match_stats in match_stats:
+            if _match_stats.match_id in self.match_ids or _match_stats.reused_from in self.match_ids:
+                continue
+            if _match_stats.forfeited_by is not None:
+                continue
+            self.match_ids.add(_match_stats.match_id)
+            if _match_stats.reused_from is not None:
+                self.match_ids.add(_match_stats.reused_from)
+            player1, player2 = _match_stats.players
+            players1.append(str(player1))
+            players2.append(str(player2))
+            # Results are shares of MATCH_POINTS, weighted by the games actually played (see c4league.sequential)
+            points = _match_stats.result[player1] + _match_stats.result[player2]
+            games = len(_match_stats.game_ids) or points
+            scores1.append(_match_stats.result[player1] * games / points)
+            n_games.append(games)
+        if len(players1) > 0:
+            self.add_games(players1, players2, np.array(scores1), np.array(n_games))
+        return len(players1)
+
+    def fit(self, max_iterations: int = 10000, tolerance: float = 1e-7) -> int:
+        """Fit the strengths to all results so far, returns the number of iterations"""
+        if self.n_players == 0:
+            return 0
+        strengths = np.exp(self.log_strengths)
+        wins = self.points.sum(axis=1) + 0.5 * self.prior_games
+        for iteration in range(1, max_iterations + 1):
+            pair_sums = strengths[:, None] + strengths[None, :]
+            denominators = (self.games / pair_sums).sum(axis=1) + self.prior_games / (strengths + 1.)
+            new_strengths = wins / denominators
+            # Only differences are identified, keeping the mean fixed avoids a slowly converging drift
+            new_strengths /= np.exp(np.mean(np.log(new_strengths)))
+            change = np.max(np.abs(np.log(new_strengths) - np.log(strengths)))
+            strengths = new_strengths
+            if change < tolerance:
+                break
+        self.log_strengths = np.log(strengths)
+        return iteration
+
+    def get_covariance(self) -> np.ndarray:
+        """Covariance of the log strengths (inverse Fisher information)"""
+        strengths = np.exp(self.log_strengths)
+        pair_sums = strengths[:, None] + strengths[None, :]
+        information = -self.games * np.outer(strengths, strengths) / pair_sums ** 2
+        np.fill_diagonal(information, 0.)
+        np.fill_diagonal(information, -information.sum(axis=1) + self.prior_games * strengths / (strengths + 1.) ** 2)
+        return np.linalg.inv(information)
+
+    def get_ratings(self) -> list[dict]:
+        """Elo-scale ratings with confidence intervals, best first"""
+        if self.n_players == 0:
+            return []
+        ratings = ELO_BASE + ELO_SCALE * (self.log_strengths - self.log_strengths.mean())
+        # Variances of the centered ratings, the common shift is not identified by the results
+        covariance = self.get_covariance()
+        variances = np.diag(covariance) - 2 * covariance.mean(axis=1) + covariance.mean()
+        errors = CONFIDENCE_Z * ELO_SCALE * np.sqrt(variances)
+        games = self.games.sum(axis=1)
+        table = [{
+            'player': player,
+            'rating': float(ratings[i]),
+            'ci_low': float(ratings[i] - errors[i]),
+            'ci_high': float(ratings[i] + errors[i]),
+            'games': int(games[i]),
+        } for i, player in enumerate(self.players)]
+        return sorted(table, key=lambda row: row['rating'], reverse=True)
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # np.savez appends .npz to names without that suffix
+        tmp_path = path.with_name(f'.{path.stem}.tmp.npz')
+        np.savez_compressed(
+            tmp_path,
+            players=np.array(self.players, dtype=str),
+            points=self.points,
+            games=self.games,
+            log_strengths=self.log_strengths,
+            match_ids=np.array(sorted(self.match_ids), dtype=str),
+            prior_games=self.prior_games
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'RatingState':
+        with np.load(path) as data:
+            state = cls(prior_games=float(data['prior_games']))
+            state.players = [str(player) for player in data['players']]
+            state.index = {player: i for i, player in enumerate(state.players)}
+            state.points = data['points']
+            state.games = data['games']
+            state.log_strengths = data['log_strengths']
+            state.match_ids = set(str(match_id) for match_id in data['match_ids'])
+        return state
+
+
+def load_rating_state(path: Path) -> RatingState:
+    """The saved rating state, or an empty one"""
+    return RatingState.load(path) if Path(path).exists() else RatingState()
+
+
+def write_ratings(path: Path, ratings: list[dict]) -> None:
+    with open(path, 'w') as f:
+        json.dump(ratings, f, ensure_ascii=False, indent=4)
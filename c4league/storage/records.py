@@ -0,0 +1,320 @@
+'''
+Compact binary storage for game records, as an alternative to one indented
+JSON file per game.
+
+Match record files (`<match_id>.c4r`) are append-only. After a 4 byte magic
+they contain a sequence of records, each a 1 byte type, a uint32 payload
+length and the payload:
+
+- `S`: a string (utf-8) added to the file's dictionary. Player names, match
+  and tournament ids and reasons are stored once and referenced by index.
+- `G`: a game: game id and timestamp inline, dictionary indices for the
+  repeated strings, the initial board as 42 int8, moves as uint8 and the
+  traceback (if any) inline. If bit 0 of its flags is set, the game's
+  metrics follow: move times as uint32 milliseconds (one per move) and the
+  per-agent startup time, peak RSS and CPU time (-1 if unavailable).
+
+A trailing record cut short by a crash is ignored when reading.
+
+Tournament archives (`.npz`) store all games of a tournament column by column:
+dictionary-encoded ids, an (n, 42) int8 board array and moves/tracebacks as
+flat arrays with offsets, metrics as optional columns.
+'''
+
+import struct
+from pathlib import Path
+
+import numpy as np
+from c4utils.c4_types import Move, Player
+
+from ..utils import tournament_player_from_str
+from .stats import GameMetrics, GameStats, game_stats_from_json
+
+RECORD_SUFFIX = '.c4r'
+_MAGIC = b'C4R1'
+_RECORD_HEADER = struct.Struct('<cI')
+_GAME_FIELDS = struct.Struct('<IIIIiIB')     # match, tournament, player1, player2, winner, reason, flags
+_NO_STRING = -1
+_NO_TRACEBACK = 0xFFFFFFFF
+_BOARD_CELLS = 42
+_HAS_METRICS = 0x01
+_AGENT_METRICS = struct.Struct('<2i2q2i')     # startup_ms, peak_rss_kb, cpu_ms of both agents
+_NO_VALUE = -1
+
+
+def _encode_optional(values: list[int | None]) -> list[int]:
+    return [_NO_VALUE if value is None else int(value) for value in values]
+
+
+def _decode_optional(values) -> list[int | None]:
+    return [None if value == _NO_VALUE else int(value) for value in values]
+
+
+def _pack_metrics(metrics: GameMetrics) -> bytes:
+    return np.asarray(metrics.move_ms, dtype=np.uint32).tobytes() + _AGENT_METRICS.pack(
+        *_encode_optional(metrics.startup_ms), *_encode_optional(metrics.peak_rss_kb),
+        *_encode_optional(metrics.cpu_ms))
+
+
+def _unpack_metrics(payload: bytes, offset: int, n_moves: int) -> GameMetrics:
+    move_ms = np.frombuffer(payload, dtype=np.uint32, count=n_moves, offset=offset)
+    agent_metrics = _AGENT_METRICS.unpack_from(payload, offset + 4 * n_moves)
+    return GameMetrics(
+        move_ms=move_ms.tolist(),
+        startup_ms=_decode_optional(agent_metrics[0:2]),
+        peak_rss_kb=_decode_optional(agent_metrics[2:4]),
+        cpu_ms=_decode_optional(agent_metrics[4:6])
+    )
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return struct.pack('<H', len(data)) + data
+
+
+def _unpack_str(payload: bytes, offset: int) -> tuple[str, int]:
+    (length,) = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    return payload[offset:offset + length].decode('utf-8'), offset + length
+
+
+class _StringTable:
+    def __init__(self):
+        self.strings: list[str] = []
+        self.index: dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        self.index[value] = len(self.strings)
+        self.strings.append(value)
+        return self.index[value]
+
+
+def encode_game(game: GameStats, strings: _StringTable) -> bytes:
+    """Encode a game, preceded by definitions of strings new to `strings`"""
+    data = b''
+    json_data = game.generate_json()
+    indices = {}
+    for key in ['match_id', 'tournament_id', 'player1', 'player2', 'winner', 'reason']:
+        value = json_data[key]
+        if value is None:
+            indices[key] = _NO_STRING
+            continue
+        if value not in strings.index:
+            encoded = value.encode('utf-8')
+            data += _RECORD_HEADER.pack(b'S', len(encoded)) + encoded
+            strings.add(value)
+        indices[key] = strings.index[value]
+
+    payload = _pack_str(game.game_id) + _pack_str(game.timestamp)
+    payload += _GAME_FIELDS.pack(indices['match_id'], indices['tournament_id'], indices['player1'],
+                                 indices['player2'], indices['winner'], indices['reason'],
+                                 _HAS_METRICS if game.metrics is not None else 0)
+    payload += np.asarray(game.initial_board, dtype=np.int8).reshape(-1).tobytes()
+    payload += struct.pack('<H', len(game.moves)) + np.asarray(game.moves, dtype=np.uint8).tobytes()
+    if game.traceback is None:
+        payload += struct.pack('<I', _NO_TRACEBACK)
+    else:
+        traceback = game.traceback.encode('utf-8')
+        payload += struct.pack('<I', len(traceback)) + traceback
+    if game.metrics is not None:
+        payload += _pack_metrics(game.metrics)
+    return data + _RECORD_HEADER.pack(b'G', len(payload)) + payload
+
+
+def _decode_game(payload: bytes, strings: list[str]) -> GameStats:
+    game_id, offset = _unpack_str(payload, 0)
+    timestamp, offset = _unpack_str(payload, offset)
+    match_idx, tournament_idx, player1_idx, player2_idx, winner_idx, reason_idx, flags = \
+        _GAME_FIELDS.unpack_from(payload, offset)
+    offset += _GAME_FIELDS.size
+    board = np.frombuffer(payload, dtype=np.int8, count=_BOARD_CELLS, offset=offset)
+    offset += _BOARD_CELLS
+    (n_moves,) = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    moves = np.frombuffer(payload, dtype=np.uint8, count=n_moves, offset=offset)
+    offset += n_moves
+    (traceback_length,) = struct.unpack_from('<I', payload, offset)
+    offset += 4
+    traceback = None
+    if traceback_length != _NO_TRACEBACK:
+        traceback = payload[offset:offset + traceback_length].decode('utf-8')
+        offset += traceback_length
+    metrics = _unpack_metrics(payload, offset, n_moves) if flags & _HAS_METRICS else None
+    return GameStats(
+        game_id=game_id,
+        match_id=strings[match_idx],
+        tournament_id=strings[tournament_idx],
+        timestamp=timestamp,
+        player1=tournament_player_from_str(strings[player1_idx]),
+        player2=tournament_player_from_str(strings[player2_idx]),
+        initial_board=board.reshape(6, 7).astype(Player),
+        moves=[Move(move) for move in moves],
+        winner=tournament_player_from_str(strings[winner_idx]) if winner_idx != _NO_STRING else None,
+        reason=strings[reason_idx],
+        traceback=traceback,
+        metrics=metrics
+    )
+
+
+def decode_game_records(data: bytes) -> list[GameStats]:
+    """Decode the contents of a match record file"""
+    if data[:len(_MAGIC)] != _MAGIC:
+        raise ValueError('Not a game record file')
+    strings = []
+    games = []
+    offset = len(_MAGIC)
+    while offset + _RECORD_HEADER.size <= len(data):
+        record_type, length = _RECORD_HEADER.unpack_from(data, offset)
+        offset += _RECORD_HEADER.size
+        if offset + length > len(data):
+            print('Warning: ignoring truncated trailing game record')
+            break
+        payload = data[offset:offset + length]
+        offset += length
+        if record_type == b'S':
+            strings.append(payload.decode('utf-8'))
+        elif record_type == b'G':
+            games.append(_decode_game(payload, strings))
+    return games
+
+
+def read_game_records(path: Path) -> list[GameStats]:
+    with open(path, 'rb') as f:
+        return decode_game_records(f.read())
+
+
+def _read_string_table(data: bytes) -> tuple[_StringTable, int]:
+    """The dictionary of an existing record file, and the length of its intact records"""
+    strings = _StringTable()
+    offset = len(_MAGIC)
+    while offset + _RECORD_HEADER.size <= len(data):
+        record_type, length = _RECORD_HEADER.unpack_from(data, offset)
+        if offset + _RECORD_HEADER.size + length > len(data):
+            break
+        offset += _RECORD_HEADER.size
+        if record_type == b'S':
+            strings.add(data[offset:offset + length].decode('utf-8'))
+        offset += length
+    return strings, offset
+
+
+def append_game_record(path: Path, game: GameStats) -> None:
+    """Append a game to a match record file, creating it if necessary"""
+    path = Path(path)
+    if path.exists():
+        data = path.read_bytes()
+        strings, intact_length = _read_string_table(data)
+        if intact_length < len(data):
+            # Drop a record cut short by a crash, it would hide everything appended after it
+            with open(path, 'r+b') as f:
+                f.truncate(intact_length)
+        prefix = b''
+    else:
+        strings = _StringTable()
+        prefix = _MAGIC
+    with open(path, 'ab') as f:
+        # A single write per game keeps concurrent readers from seeing half a record
+        f.write(prefix + encode_game(game, strings))
+
+
+def game_stats_to_records(games: list[GameStats]) -> bytes:
+    """Encode several games as the contents of a match record file"""
+    strings = _StringTable()
+    return _MAGIC + b''.join(encode_game(game, strings) for game in games)
+
+
+# --- Tournament archives ---
+
+def _encode_column(values: list[str | None], strings: dict[str, int]) -> np.ndarray:
+    indices = []
+    for value in values:
+        if value is None:
+            indices.append(_NO_STRING)
+        else:
+            indices.append(strings.setdefault(value, len(strings)))
+    return np.array(indices, dtype=np.int32)
+
+
+def _encode_blobs(values: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in values])
+    return np.frombuffer(b''.join(values), dtype=np.uint8), offsets
+
+
+def write_tournament_archive(path: Path, games: list[GameStats]) -> None:
+    """Write all games of a tournament to a columnar .npz archive"""
+    json_games = [game.generate_json() for game in games]
+    strings: dict[str, int] = {}
+    columns = {
+        key: _encode_column([game[key] for game in json_games], strings)
+        for key in ['match_id', 'tournament_id', 'player1', 'player2', 'winner', 'reason']
+    }
+    moves, move_offsets = _encode_blobs([np.asarray(game.moves, dtype=np.uint8).tobytes() for game in games])
+    tracebacks, traceback_offsets = _encode_blobs([(game.traceback or '').encode('utf-8') for game in games])
+    has_metrics = np.array([game.metrics is not None for game in games], dtype=bool)
+    # Move times share the move offsets, zero for games without metrics
+    move_ms = np.concatenate([np.zeros(0, dtype=np.uint32)] + [
+        np.asarray(game.metrics.move_ms if game.metrics is not None else [0] * len(game.moves), dtype=np.uint32)
+        for game in games])
+    agent_metrics = np.array([
+        _encode_optional(game.metrics.startup_ms + game.metrics.peak_rss_kb + game.metrics.cpu_ms)
+        if game.metrics is not None else [_NO_VALUE] * 6 for game in games], dtype=np.int64).reshape(len(games), 6)
+    np.savez_compressed(
+        path,
+        strings=np.array(list(strings), dtype=str),
+        game_id=np.array([game.game_id for game in games], dtype=str),
+        timestamp=np.array([game.timestamp for game in games], dtype=str),
+        initial_board=np.array([np.asarray(game.initial_board, dtype=np.int8).reshape(-1) for game in games],
+                               dtype=np.int8).reshape(len(games), _BOARD_CELLS),
+        moves=moves,
+        move_offsets=move_offsets,
+        tracebacks=tracebacks,
+        traceback_offsets=traceback_offsets,
+        has_traceback=np.array([game.traceback is not None for game in games], dtype=bool),
+        has_metrics=has_metrics,
+        move_ms=move_ms,
+        agent_metrics=agent_metrics,
+        **columns
+    )
+
+
+def read_tournament_archive(path: Path) -> list[GameStats]:
+    with np.load(path) as archive:
+        columns = {key: archive[key] for key in archive.files}
+    strings = [str(value) for value in columns['strings']]
+
+    def _lookup(key: str, i: int) -> str | None:
+        index = int(columns[key][i])
+        return strings[index] if index != _NO_STRING else None
+
+    games = []
+    for i in range(len(columns['game_id'])):
+        moves = columns['moves'][columns['move_offsets'][i]:columns['move_offsets'][i + 1]]
+        traceback = None
+        if columns['has_traceback'][i]:
+            start, end = columns['traceback_offsets'][i], columns['traceback_offsets'][i + 1]
+            traceback = columns['tracebacks'][start:end].tobytes().decode('utf-8')
+        metrics = None
+        if 'has_metrics' in columns and columns['has_metrics'][i]:
+            agent_metrics = _decode_optional(columns['agent_metrics'][i])
+            metrics = {
+                'move_ms': columns['move_ms'][columns['move_offsets'][i]:columns['move_offsets'][i + 1]].tolist(),
+                'startup_ms': agent_metrics[0:2],
+                'peak_rss_kb': agent_metrics[2:4],
+                'cpu_ms': agent_metrics[4:6],
+            }
+        games.append(game_stats_from_json({
+            'game_id': str(columns['game_id'][i]),
+            'match_id': _lookup('match_id', i),
+            'tournament_id': _lookup('tournament_id', i),
+            'timestamp': str(columns['timestamp'][i]),
+            'player1': _lookup('player1', i),
+            'player2': _lookup('player2', i),
+            'initial_board': columns['initial_board'][i].reshape(6, 7).tolist(),
+            'moves': moves.tolist(),
+            'winner': _lookup('winner', i),
+            'reason': _lookup('reason', i),
+            'traceback': traceback,
+            'metrics': metrics,
+        }))
+    return games
@@ -8,10 +8,30 @@ import time
 from c4utils.c4_types import Board, Move, Player
 
 from ..utils import TournamentPlayer, tournament_player_from_dict, tournament_player_from_str
-from ..params import MINI_MATCH_GAMES
+from ..params import MATCH_POINTS
 
 TIMESTAMP_FORMAT = '%Y-%m-%d-%H:%M:%S'
 
+@dataclass
+class GameMetrics:
+    """
+    Timing and resources of a game. `move_ms[k]` is the think time of move k;
+    the per-agent lists are ordered [player1, player2], with None where the
+    value is unavailable (e.g. no startup for an already running agent).
+    """
+    move_ms: list[int]
+    startup_ms: list[int | None]
+    peak_rss_kb: list[int | None]
+    cpu_ms: list[int | None]
+
+    def generate_json(self) -> dict:
+        return {
+            'move_ms': self.move_ms,
+            'startup_ms': self.startup_ms,
+            'peak_rss_kb': self.peak_rss_kb,
+            'cpu_ms': self.cpu_ms,
+        }
+
 @dataclass
 class GameStats:
     game_id: str
@@ -25,9 +45,10 @@ class GameStats:
     winner: TournamentPlayer | None
     reason: str
     traceback: str | None
+    metrics: GameMetrics | None = None
 
     def generate_json(self) -> dict:
-        return {
+        json_data = {
             'game_id': self.game_id,
             'match_id': self.match_id,
             'tournament_id': self.tournament_id,
@@ -40,6 +61,9 @@ class GameStats:
             'reason': self.reason,
             'traceback': self.traceback,
         }
+        if self.metrics is not None:
+            json_data['metrics'] = self.metrics.generate_json()
+        return json_data
 
 def game_stats_from_json(json_data: dict) -> 'GameStats':
     raw_data = json_data
@@ -48,6 +72,8 @@ def game_stats_from_json(json_data: dict) -> 'GameStats':
     raw_data['player1'] = tournament_player_from_str(json_data['player1'])
     raw_data['player2'] = tournament_player_from_str(json_data['player2'])
     raw_data['winner'] = tournament_player_from_str(json_data['winner']) if json_data['winner'] is not None else None
+    if json_data.get('metrics') is not None:
+        raw_data['metrics'] = GameMetrics(**json_data['metrics'])
     return GameStats(**raw_data)
 
 @dataclass
@@ -58,9 +84,11 @@ class MatchStats:
     timestamp: str
     players: list[TournamentPlayer]
     result: dict[TournamentPlayer, float]
+    reused_from: str | None = None     # id of the earlier match whose result was reused, games belong to it
+    forfeited_by: list[TournamentPlayer] | None = None    # quarantined players, the match was not (fully) played
 
     def generate_json(self) -> dict:
-        return {
+        json_data = {
             'match_id': self.match_id,
             'game_ids': self.game_ids,
             'tournament_id': self.tournament_id,
@@ -68,11 +96,18 @@ class MatchStats:
             'players': [str(player) for player in self.players],
             'result': {str(player): score for player, score in self.result.items()}
         }
+        if self.reused_from is not None:
+            json_data['reused_from'] = self.reused_from
+        if self.forfeited_by is not None:
+            json_data['forfeited_by'] = [str(player) for player in self.forfeited_by]
+        return json_data
     
 def match_stats_from_json(json_data: dict) -> 'MatchStats':
     raw_data = json_data.copy()
     raw_data['players'] = [tournament_player_from_str(player) for player in json_data['players']]
     raw_data['result'] = {tournament_player_from_str(player): score for player, score in json_data['result'].items()}
+    if json_data.get('forfeited_by') is not None:
+        raw_data['forfeited_by'] = [tournament_player_from_str(player) for player in json_data['forfeited_by']]
     return MatchStats(**raw_data)
 
 @dataclass
@@ -108,10 +143,11 @@ def generate_match_stats_from_game_stats(games: list[GameStats]) -> MatchStats:
     # Get all players in the match
     players = [games[0].player1, games[0].player2]
     
-    # Get the result of the match
+    # Get the result of the match, every match is worth MATCH_POINTS whatever its number of games
     result = {}
     for player in players:
-        result[player] = sum(game.winner == player for game in games if game.winner is not None) + 0.5 * sum(game.winner is None for game in games)
+        points = sum(game.winner == player for game in games if game.winner is not None) + 0.5 * sum(game.winner is None for game in games)
+        result[player] = points * MATCH_POINTS / len(games)
     
     return MatchStats(
         match_id=games[0].match_id,
@@ -125,14 +161,13 @@ def generate_match_stats_from_game_stats(games: list[GameStats]) -> MatchStats:
 def check_games(games: list[GameStats]) -> bool:
     try:
         assert len(games) > 0, "No games provided"
-        assert len(games) == MINI_MATCH_GAMES, f"Expected {MINI_MATCH_GAMES} games per mini-match"
+        assert len(games) % 2 == 0, "Expected an even number of games per match"
         assert np.unique(np.array([game.game_id for game in games])).size == len(games), "Expected unique game ids"
         p1_players = set([game.player1 for game in games])
         p2_players = set([game.player2 for game in games])
         unique_players = list(set(p1_players) | set(p2_players))
         assert len(unique_players) == 2, "Expected two players per match"
-        assert len(p1_players) == 2, "Expected each player to play first twice"
-        assert len(p2_players) == 2, "Expected each player to play second twice"
+        assert sum(game.player1 == games[0].player1 for game in games) == len(games) // 2, "Expected each player to play first in half of the games"
         for game in games:
             assert game.player1 != game.player2, "Player 1 and player 2 are the same"
         assert all(game.match_id == games[0].match_id for game in games), "Expected all games to be in the same match"
@@ -0,0 +1,76 @@
+'''
+Manifest of the agent submissions that have been containerized.
+
+The manifest maps every submission blob name to the generation, md5 hash and
+size it had when it was last built. Comparing a bucket listing with it is a
+dict lookup per blob, so only submissions that were added, re-uploaded with
+different content or deleted since the last sync need any further work. A
+re-upload under the same file name with different content is detected by its
+hash and rebuilt, while a re-upload of identical content is not.
+'''
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from ..utils import TournamentPlayer, tournament_player_from_dict
+from .cloud_storage import BlobInfo, get_agent_from_blob_name
+
+
+@dataclass
+class SubmissionChanges:
+    added: list[BlobInfo] = field(default_factory=list)
+    # Same blob name, different content
+    modified: list[BlobInfo] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.modified) + len(self.removed)
+
+
+def get_player_from_blob_name(blob_name: str) -> TournamentPlayer:
+    return tournament_player_from_dict(get_agent_from_blob_name(blob_name))
+
+
+def _content_key(entry: dict) -> tuple:
+    # Fall back on the size for backends without hashes
+    return (entry['md5_hash'], entry['size']) if entry.get('md5_hash') else (None, entry['size'])
+
+
+class SubmissionManifest:
+    """Submission blobs as of the last sync, stored in a single JSON file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+
+    def diff(self, blobs: list[BlobInfo]) -> SubmissionChanges:
+        changes = SubmissionChanges()
+        for blob in blobs:
+            entry = self.entries.get(blob.name)
+            if entry is None:
+                changes.added.append(blob)
+            elif entry['generation'] != blob.generation and _content_key(entry) != _content_key(vars(blob)):
+                changes.modified.append(blob)
+        listed = set(blob.name for blob in blobs)
+        changes.removed = [name for name in self.entries if name not in listed]
+        return changes
+
+    def update(self, blobs: list[BlobInfo]) -> None:
+        for blob in blobs:
+            self.entries[blob.name] = {'generation': blob.generation, 'md5_hash': blob.md5_hash, 'size': blob.size}
+
+    def remove(self, blob_names: list[str]) -> None:
+        for blob_name in blob_names:
+            self.entries.pop(blob_name, None)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
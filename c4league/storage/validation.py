@@ -0,0 +1,134 @@
+'''
+Replays recorded games to verify their moves and outcome.
+
+All games of a tournament are replayed together on bitboards (see
+`c4league.bitboard`): one vectorized step per move number instead of one
+Python loop per game. A game is flagged if
+
+- its initial board is impossible (unknown cell values, floating stones,
+  stone counts that do not fit PLAYER1 moving first, or already decided),
+- a recorded move is illegal, or moves were recorded after the game ended,
+- its recorded `winner`/`reason` do not match the replay: a `Connect 4` must
+  be completed by the last move and won by its mover, a `Draw` must fill the
+  board, and on any failure reason (timeout, crash, invalid move) the game
+  must still be open and won by the opponent of the agent to move.
+'''
+
+import time
+
+import numpy as np
+from c4utils.c4_types import Player, PLAYER1, PLAYER2, NO_PLAYER
+
+from ..utils import TournamentPlayer
+from ..bitboard import N_ROWS, N_COLS, N_CELLS, HEIGHT, batch_is_win, from_boards
+from .stats import GameStats
+
+
+def _check_initial_boards(boards: np.ndarray, player1_bits: np.ndarray,
+                          player2_bits: np.ndarray) -> list[tuple[np.ndarray, str]]:
+    valid_values = np.isin(boards, [NO_PLAYER, PLAYER1, PLAYER2]).all(axis=(1, 2))
+    occupied = boards != NO_PLAYER
+    floating = np.any(occupied[:, 1:] & ~occupied[:, :-1], axis=(1, 2))
+    stone_difference = np.sum(boards == PLAYER1, axis=(1, 2)) - np.sum(boards == PLAYER2, axis=(1, 2))
+    decided = batch_is_win(player1_bits) | batch_is_win(player2_bits) | occupied.all(axis=(1, 2))
+    return [
+        (~valid_values, 'Impossible initial board: unknown cell values'),
+        (floating, 'Impossible initial board: floating stones'),
+        ((stone_difference < 0) | (stone_difference > 1), 'Impossible initial board: stone counts'),
+        (decided, 'Impossible initial board: game already over'),
+    ]
+
+
+def validate_games(games: list[GameStats]) -> dict[str, list[str]]:
+    """Replay all games at once, returns the problems found per game id (only for invalid games)"""
+    start = time.perf_counter()
+    n_games = len(games)
+    problems: dict[str, list[str]] = {}
+    if n_games == 0:
+        return problems
+
+    boards = np.array([np.asarray(game.initial_board).reshape(N_ROWS, N_COLS) for game in games], dtype=np.int64)
+    bits = np.stack(from_boards(boards))
+    for flags, problem in _check_initial_boards(boards, bits[0], bits[1]):
+        for i in np.flatnonzero(flags):
+            problems.setdefault(games[i].game_id, []).append(problem)
+
+    n_moves = np.array([len(game.moves) for game in games], dtype=np.int64)
+    moves = np.full((n_games, max(n_moves.max(), 1)), -1, dtype=np.int64)
+    for i, game in enumerate(games):
+        moves[i, :n_moves[i]] = [int(move) for move in game.moves]
+
+    heights = (boards != NO_PLAYER).sum(axis=1)
+    # Replay state: still playing, and how the replayed game ended
+    active = (n_moves > 0) & np.array([game.game_id not in problems for game in games])
+    won_by = np.full(n_games, NO_PLAYER, dtype=np.int64)
+    full = np.zeros(n_games, dtype=bool)
+    illegal_at = np.full(n_games, -1, dtype=np.int64)
+    ended_at = np.full(n_games, -1, dtype=np.int64)
+    for k in range(min(moves.shape[1], N_CELLS)):
+        games_k = np.flatnonzero(active & (k < n_moves))
+        if len(games_k) == 0:
+            break
+        cols = moves[games_k, k]
+        legal = (cols >= 0) & (cols < N_COLS)
+        legal[legal] = heights[games_k[legal], cols[legal]] < N_ROWS
+        illegal_at[games_k[~legal]] = k
+        active[games_k[~legal]] = False
+        games_k, cols = games_k[legal], cols[legal]
+
+        player = k % 2
+        bits[player, games_k] |= np.uint64(1) << (HEIGHT * cols + heights[games_k, cols]).astype(np.uint64)
+        heights[games_k, cols] += 1
+        won = batch_is_win(bits[player, games_k])
+        filled = np.all(heights[games_k] >= N_ROWS, axis=1)
+        won_by[games_k[won]] = PLAYER1 if player == 0 else PLAYER2
+        full[games_k[filled & ~won]] = True
+        ended_at[games_k[won | filled]] = k
+        active[games_k[won | filled]] = False
+
+    for i, game in enumerate(games):
+        if game.game_id in problems:
+            continue
+        game_problems = []
+        if illegal_at[i] >= 0:
+            game_problems.append(f'Illegal move {illegal_at[i] + 1}: {moves[i, illegal_at[i]]}')
+        elif 0 <= ended_at[i] < n_moves[i] - 1:
+            game_problems.append(f'{n_moves[i] - ended_at[i] - 1} moves recorded after the end of the game')
+        else:
+            game_problems += _check_outcome(game, Player(won_by[i]), bool(full[i]), int(n_moves[i]))
+        if len(game_problems) > 0:
+            problems[game.game_id] = game_problems
+
+    elapsed = time.perf_counter() - start
+    print(f'Validated {n_games} games in {elapsed:.2f}s ({n_games / max(elapsed, 1e-9):.0f} games/s), '
+          f'{len(problems)} invalid')
+    return problems
+
+
+def _same_player(player1: TournamentPlayer | None, player2: TournamentPlayer | None) -> bool:
+    if player1 is None or player2 is None:
+        return player1 is None and player2 is None
+    return player1 == player2
+
+
+def _check_outcome(game: GameStats, won_by: Player, full: bool, n_moves: int) -> list[str]:
+    players = {PLAYER1: game.player1, PLAYER2: game.player2}
+    to_move = PLAYER1 if n_moves % 2 == 0 else PLAYER2
+    if won_by != NO_PLAYER:
+        expected_reason, expected_winner = 'Connect 4', players[won_by]
+    elif full:
+        expected_reason, expected_winner = 'Draw', None
+    else:
+        # The game did not end on the board, the agent to move must have failed
+        if game.reason in ('Connect 4', 'Draw'):
+            return [f'Reason {game.reason} but the game is not over after {n_moves} moves']
+        expected_reason, expected_winner = game.reason, players[PLAYER2 if to_move == PLAYER1 else PLAYER1]
+        if n_moves == 0 and game.winner in (game.player1, game.player2):
+            # Both agents are started before the first move, either one can fail to start
+            expected_winner = game.winner
+    game_problems = []
+    if game.reason != expected_reason:
+        game_problems.append(f'Reason {game.reason} does not match replay ({expected_reason})')
+    if not _same_player(game.winner, expected_winner):
+        game_problems.append(f'Winner {game.winner} does not match replay ({expected_winner})')
+    return game_problems
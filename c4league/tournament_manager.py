@@ -1,23 +1,36 @@
 import os
+import math
 import string
 import random
-import subprocess
 from pathlib import Path
 import time
 from dotenv import load_dotenv
-import itertools
 import numpy as np
 import json
+import sqlite3
 from c4utils.c4_types import Move, Player, NO_PLAYER
-from c4utils.match import GameState
 
 from c4league.container_utils import get_containerized_agents, TournamentPlayer, \
-    get_sif_file_path_from_tournament_player, get_sif_file_name_from_tournament_player
+    get_sif_file_path_from_tournament_player, get_sif_identity
 from c4league.utils import generate_id
-from c4league.params import TIMEOUT
+from c4league.params import TIMEOUT, MINI_MATCH_GAMES
+from c4league.bitboard import generate_starting_boards
+from c4league.pairing import get_pairing_strategy, played_pairs, Pairing
+from c4league.completion import CompletionTracker, DONE_DIR_NAME, done_marker_shell, write_done_marker
+from c4league.executors import LocalExecutor, get_executor
+from c4league.scheduling import DurationModel, pack_matches, predict_makespan, probe_agent
+from c4league.node_worker import CLAIMS_DIR_NAME, claim_task
+from c4league.quarantine import CircuitBreaker, forfeit_match_stats
+from c4league.sequential import MatchFormat
 from c4league.storage.stats import GameStats, MatchStats, TournamentStats, \
-    game_stats_from_json, match_stats_from_json, tournament_stats_from_json, \
-    generate_match_stats_from_game_stats, generate_tournament_stats_from_match_stats
+    game_stats_from_json, match_stats_from_json, tournament_stats_from_json, TIMESTAMP_FORMAT
+from c4league.storage.aggregation import TournamentAggregator
+from c4league.storage.ingestion import load_match_games, write_match_stats
+from c4league.storage.match_cache import MatchCache, reuse_match_stats
+from c4league.storage.index import ResultsIndex
+from c4league.storage.validation import validate_games
+from c4league.storage.metrics import get_metrics_report, write_metrics_report
+from c4league.storage.ratings import load_rating_state, write_ratings
 
 load_dotenv()
 
@@ -39,12 +52,56 @@ class TournamentManager:
         raise ValueError("C4LEAGUE_ROOT_DIR not set")
     c4league_package_root: Path = Path(root_dir) / 'c4league/'
     move_timeout: float = TIMEOUT
+    matches_per_task: int = int(os.getenv("MATCHES_PER_TASK", "1"))
+    warm_agents: bool = os.getenv("WARM_AGENTS", "0") == "1"
+    game_record_format: str = os.getenv("GAME_RECORD_FORMAT", "json")
+    game_metrics: bool = os.getenv("GAME_METRICS", "0") == "1"
+    stage_agents: bool = os.getenv("STAGE_AGENTS", "0") == "1"
+    match_time_limit_minutes: int = 22        # per match of MINI_MATCH_GAMES games
+    max_task_time_limit_minutes: int = 300     # cpu-5h partition
+    ingest_workers: int = int(os.getenv("INGEST_WORKERS", "1"))
+    completion_poll_interval: float = 5.0
+    scheduler_check_interval: float = 300.0
+    # Incremental tournaments reuse results of pairings whose agents are unchanged
+    incremental: bool = os.getenv("INCREMENTAL_TOURNAMENT", "0") == "1"
+    incremental_resample_fraction: float = float(os.getenv("INCREMENTAL_RESAMPLE_FRACTION", "0.0"))
+    # Matches with games that fail replay validation are only reported unless this is set
+    exclude_invalid_matches: bool = os.getenv("EXCLUDE_INVALID_MATCHES", "0") == "1"
+    pairing: str = os.getenv("PAIRING_STRATEGY", "round_robin")
+    swiss_rounds: int | None = int(os.environ["SWISS_ROUNDS"]) if os.getenv("SWISS_ROUNDS") else None
+    # Incomplete matches are resubmitted up to `match_retries` times, waiting
+    # `retry_backoff_seconds` before the first retry and twice as long before each next one
+    match_retries: int = int(os.getenv("MATCH_RETRIES", "2"))
+    retry_backoff_seconds: float = float(os.getenv("MATCH_RETRY_BACKOFF", "60"))
+    # Pack matches into array tasks by predicted duration, see c4league.scheduling (the duration
+    # model only learns from game metrics, GAME_METRICS="1")
+    duration_aware: bool = os.getenv("DURATION_AWARE_SCHEDULING", "0") == "1"
+    duration_probe: bool = os.getenv("DURATION_PROBE", "0") == "1"
+    # Resources of a single task (its matches run one after the other)
+    match_cpus: int = int(os.getenv("MATCH_CPUS", "3"))
+    match_mem_gb: int = int(os.getenv("MATCH_MEM_GB", "60"))
+    # Node worker mode: allocate this many whole nodes that run the tasks from a shared queue (0: array tasks)
+    node_workers: int = int(os.getenv("NODE_WORKERS", "0"))
+    # Array tasks running at the same time, for the predicted makespan (default: all)
+    array_concurrency: int | None = int(os.environ["ARRAY_CONCURRENCY"]) if os.getenv("ARRAY_CONCURRENCY") else None
+    # Agents losing this many games by failure (at least this fraction of their games) are quarantined
+    # and forfeit their remaining matches, see c4league.quarantine (default 0: never)
+    quarantine_failures: int = int(os.getenv("QUARANTINE_FAILURES", "0"))
+    quarantine_failure_rate: float = float(os.getenv("QUARANTINE_FAILURE_RATE", "0.75"))
+    # Games per match: with more than the minimum, matches stop early once decided, see c4league.sequential
+    match_min_games: int = int(os.getenv("MATCH_MIN_GAMES", str(MINI_MATCH_GAMES)))
+    match_max_games: int = int(os.getenv("MATCH_MAX_GAMES", os.getenv("MATCH_MIN_GAMES", str(MINI_MATCH_GAMES))))
 
     def __init__(self):
         print('Initializing tournament manager...')
         self.agent_dir = Path(os.getenv("AGENT_CONTAINER_DIRECTORY", "/opt"))
         self.gcs_bucket = os.getenv("GCS_BUCKET_NAME")
         self.jobs: dict[str, dict] = {}
+        self.executor = get_executor()
+        if isinstance(self.executor, LocalExecutor):
+            # Task states are known in process, no need to spare the scheduler
+            self.scheduler_check_interval = self.completion_poll_interval
+            self.array_concurrency = self.executor.max_workers
 
         self.tournament_id = f't{generate_id()}'
         print(f'Assigned tournament id: {self.tournament_id}')
@@ -53,6 +110,16 @@ class TournamentManager:
         print(f'Creating results directory: {self.results_dir}')
         self.results_dir.mkdir(parents=True, exist_ok=False)
 
+        self.done_dir = self.results_dir / DONE_DIR_NAME
+        self.done_dir.mkdir()
+        self.claims_dir = self.results_dir / CLAIMS_DIR_NAME
+        self.match_format = MatchFormat(self.match_min_games, self.match_max_games)
+        self.aggregator = TournamentAggregator(self.tournament_id, self.results_dir, self.match_format)
+        self.standings_path = self.results_dir / f'{self.tournament_id}_standings.json'
+        self.results_index_path = Path(os.getenv("RESULTS_INDEX_PATH",
+                                                 self.results_dir.parent / 'results_index.sqlite'))
+        self.ratings_path = Path(os.getenv("RATINGS_PATH", self.results_dir.parent / 'ratings.npz'))
+
         self.logs_dir = Path(os.getenv("TOURNAMENT_LOGS_DIRECTORY")) / f'{self.tournament_id}'
         print(f'Creating logs directory: {self.logs_dir}')
         self.logs_dir.mkdir(parents=True, exist_ok=False)
@@ -64,17 +131,48 @@ class TournamentManager:
         print('Generating random starting board...')
         self.random_starting_board = self._generate_starting_board()
 
-        print('Creating matches...')
-        self.matches = self._create_matches(self.participants)
+        print(f'Creating matches ({self.pairing} pairing)...')
+        self.pairing_strategy = get_pairing_strategy(self.pairing, self.swiss_rounds)
+        self.round_number = 1
+        self.matches = self._create_matches(self.pairing_strategy.next_round(1, self.participants, {}, set()))
         print(f'Created {len(self.matches)} matches')
 
+        self.sif_identities = {player: get_sif_identity(player) for player in self.participants}
+        if self.duration_aware and not self.game_metrics:
+            print('Warning: duration-aware scheduling without GAME_METRICS="1", durations are not learned')
+        self.duration_model = DurationModel(Path(os.getenv("DURATION_MODEL_PATH",
+                                                           self.results_dir.parent / 'agent_durations.json')))
+        if self.duration_probe:
+            self._probe_agents()
+        self.predicted_match_seconds: dict[str, float] = {}
+        self.makespans: list[dict] = []
+        self.match_cache = MatchCache(Path(os.getenv("MATCH_CACHE_PATH",
+                                                     self.results_dir.parent / 'match_cache.json')))
+
         self.tournament_config_path = Path(os.getenv("TOURNAMENT_CONFIG_DIRECTORY", "/opt/match_results")) / f'{self.tournament_id}.txt'
         print(f'Creating tournament config file: {self.tournament_config_path}')
         self.tournament_config_path.parent.mkdir(parents=True, exist_ok=True)
         self.tournament_config_path.touch()
-        self._create_tournament_config_file()
+        # Config file lines (1-based, inclusive) run by each array task
+        self.task_file_path = self.tournament_config_path.with_name(f'{self.tournament_id}_tasks.txt')
+        self.task_file_path.touch()
+        self.task_lines: list[tuple[int, int]] = []
+        self.n_submitted_tasks = 0
+        # Matches still incomplete after all retries
+        self.incomplete_matches: list[str] = []
+        self.circuit_breaker = CircuitBreaker(self.quarantine_failures, self.quarantine_failure_rate) \
+            if self.quarantine_failures > 0 else None
+        # The array job (or node workers) currently running, and its tasks
+        self.running_job_id: str | None = None
+        self.running_task_ids: list[int] = []
+        # Matches that are actually played, the others reuse cached results
+        self.scheduled_matches: MatchData = {}
+        # Match id of every config file line, tasks slice their range out of it
+        self.config_match_ids: list[str] = []
+        self._schedule_matches(self._reuse_cached_matches(self.matches) if self.incremental else self.matches)
 
         self.job_script_path = Path(os.getenv("TOURNAMENT_JOB_SCRIPT_DIRECTORY")) / f'{self.tournament_id}.sh'
+        self.worker_script_path = self.job_script_path.with_name(f'{self.tournament_id}_workers.sh')
   
 
         
@@ -85,11 +183,15 @@ class TournamentManager:
     def run_tournament(self):
         """Run the tournament"""
         
-        # Submit all matches
-        tournament_job_id = self.submit_all_matches()
+        while True:
+            task_ids = list(range(self.n_submitted_tasks + 1, self._get_n_tasks() + 1))
+            if len(task_ids) > 0:
+                # Play the matches of this round, retrying incomplete ones
+                self.run_tasks(task_ids)
 
-        # Wait for all matches to complete
-        self.wait_for_all_jobs(tournament_job_id)
+            # Later rounds (if any) are paired based on the results so far
+            if not self._schedule_next_round():
+                break
 
         # Process results
         print('All matches completed.')
@@ -101,27 +203,11 @@ class TournamentManager:
 
 
     def _generate_starting_board(self) -> np.ndarray:
-        """Generate a random starting board"""
-        while True:
-            game_state = GameState()
-            truncate = False  # Initialize truncate flag
-            while not truncate:
-                move = np.random.choice(np.flatnonzero(game_state.board[-1, :] == NO_PLAYER))
-                game_state.update(Move(move))
-                
-                if game_state.is_game_over:
-                    break
-                    
-                truncate = (
-                    np.random.rand() < self.starting_moves_truncate_prob or 
-                    np.count_nonzero(game_state.board == NO_PLAYER) < game_state.board.size - self.starting_moves_truncate_max
-                )
-            else:
-                return game_state.board
+        """Generate a random, non-terminal starting board"""
+        return generate_starting_boards(1, self.starting_moves_truncate_prob, self.starting_moves_truncate_max)[0]
     
-    def _create_matches(self, participants: list[TournamentPlayer]) -> MatchData:
-        """Create matches from participants"""
-        pairings = list(itertools.combinations(participants, 2))
+    def _create_matches(self, pairings: list[Pairing]) -> MatchData:
+        """Create matches from pairings"""
         match_ids = [f'{self.tournament_id}_m{generate_id()}' 
                      for _ in range(len(pairings))]
         for match_id in match_ids:
@@ -132,51 +218,192 @@ class TournamentManager:
             for pairing, match_id in zip(pairings, match_ids)
         }
 
+    def _reuse_cached_matches(self, matches: MatchData) -> MatchData:
+        """
+        Fill in cached results for pairings of unchanged agents, except for a
+        random `incremental_resample_fraction` of them. Returns the matches
+        that still have to be played.
+        """
+        scheduled_matches = {}
+        reused_match_stats = []
+        timestamp = time.strftime(TIMESTAMP_FORMAT)
+        for match_id, (player1, player2) in matches.items():
+            cached_match_stats = self.match_cache.get(self.sif_identities[player1], self.sif_identities[player2])
+            if cached_match_stats is None or np.random.rand() < self.incremental_resample_fraction:
+                scheduled_matches[match_id] = (player1, player2)
+                continue
+            match_stats = reuse_match_stats(cached_match_stats, match_id, self.tournament_id, timestamp)
+            self.aggregator.add_match_stats(match_stats)
+            reused_match_stats.append(match_stats)
+        write_match_stats(self.results_dir, reused_match_stats)
+        print(f'Reusing {len(reused_match_stats)} cached matches, {len(scheduled_matches)} matches will be played')
+        return scheduled_matches
+
+    def _update_match_cache(self) -> None:
+        """Cache the matches played in this tournament for later incremental tournaments"""
+        for match_id, (player1, player2) in self.scheduled_matches.items():
+            if self.aggregator.has_match(match_id) and self.aggregator.match_stats[match_id].forfeited_by is None:
+                self.match_cache.put(self.sif_identities[player1], self.sif_identities[player2],
+                                     self.aggregator.match_stats[match_id])
+        n_pruned = self.match_cache.prune(set(self.sif_identities.values()))
+        self.match_cache.save()
+        print(f'Match cache updated: {len(self.match_cache.entries)} entries, {n_pruned} stale entries dropped')
+
     def _get_match_path(self, match_id: str) -> Path:
         """Get the path to a match"""
         return self.results_dir / f'{match_id}'
     
-    def _create_tournament_config_file(self):
-        """Create a tournament config file"""
-        with open(self.tournament_config_path, 'w') as f:
-            for match_id, (player1, player2) in self.matches.items():
+    def _probe_agents(self) -> None:
+        """Time a few moves of agents without duration history"""
+        for player in self.participants:
+            if self.duration_model.has_history(player):
+                continue
+            costs = probe_agent(Path(get_sif_file_path_from_tournament_player(player)), move_timeout=self.move_timeout)
+            if costs is not None:
+                self.duration_model.estimates[f'{player.team_name}_{player.agent_name}'] = costs
+        print(f'Probed {len(self.duration_model.estimates)} agents without duration history')
+
+    def _schedule_matches(self, matches: MatchData) -> None:
+        """Append matches to the tournament config file, packed into new array tasks"""
+        for match_id, (player1, player2) in matches.items():
+            # Sequential matches may take up to their maximum number of games
+            self.predicted_match_seconds[match_id] = self.duration_model.predict_match_seconds(
+                player1, player2, self.warm_agents, self.match_format.max_games)
+        first_line = len(self.config_match_ids) + 1
+        if self.duration_aware and len(matches) > 0:
+            # Longest tasks first, each a contiguous range of config lines
+            tasks = pack_matches({match_id: self.predicted_match_seconds[match_id] for match_id in matches},
+                                 math.ceil(len(matches) / self.matches_per_task), self.matches_per_task)
+            matches = {match_id: matches[match_id] for task in tasks for match_id in task}
+            task_ranges = []
+            task_first_line = first_line
+            for task in tasks:
+                task_ranges.append((task_first_line, task_first_line + len(task) - 1))
+                task_first_line += len(task)
+        else:
+            task_ranges = self._split_lines(first_line, first_line + len(matches) - 1)
+        self.scheduled_matches.update(matches)
+        self.config_match_ids += list(matches)
+        with open(self.tournament_config_path, 'a') as f:
+            for match_id, (player1, player2) in matches.items():
                 f.write(f'{match_id} {get_sif_file_path_from_tournament_player(player1)} {get_sif_file_path_from_tournament_player(player2)}\n')
-        print(f'Tournament config file created at {self.tournament_config_path}')
-       
-    def submit_all_matches(self) -> str:
-        """Submit a single match as a Slurm job"""
+        # Tasks never span two rounds, so a round can be submitted on its own
+        self._add_tasks(task_ranges)
+        print(f'Tournament config file {self.tournament_config_path} updated with {len(matches)} matches')
+
+    def _split_lines(self, first_line: int, last_line: int) -> list[tuple[int, int]]:
+        """Config lines first_line to last_line in ranges of `matches_per_task`"""
+        return [(task_first_line, min(task_first_line + self.matches_per_task - 1, last_line))
+                for task_first_line in range(first_line, last_line + 1, self.matches_per_task)]
+
+    def _add_tasks(self, task_ranges: list[tuple[int, int]]) -> list[int]:
+        """Append array tasks running the given ranges of config lines, returns their task ids"""
+        first_task_id = self._get_n_tasks() + 1
+        with open(self.task_file_path, 'a') as f:
+            for task_first_line, task_last_line in task_ranges:
+                self.task_lines.append((task_first_line, task_last_line))
+                f.write(f'{task_first_line} {task_last_line}\n')
+        return list(range(first_task_id, self._get_n_tasks() + 1))
+
+    def _schedule_retries(self, match_ids: list[str]) -> list[int]:
+        """Append array tasks running only the given (already scheduled) matches again, returns their task ids"""
+        line_numbers = {match_id: line for line, match_id in enumerate(self.config_match_ids, start=1)}
+        lines = sorted(line_numbers[match_id] for match_id in match_ids)
+        task_ids = []
+        # Runs of consecutive lines share tasks, like the first attempt
+        run_start = lines[0]
+        for previous_line, line in zip(lines, lines[1:] + [None]):
+            if line != previous_line + 1:
+                task_ids += self._add_tasks(self._split_lines(run_start, previous_line))
+                run_start = line
+        return task_ids
+
+    def _schedule_next_round(self) -> bool:
+        """Pair the next round based on the scores so far, False once the pairing strategy is done"""
+        pairings = self.pairing_strategy.next_round(self.round_number + 1, self.participants, self.aggregator.scores,
+                                                    played_pairs(list(self.matches.values())))
+        if len(pairings) == 0:
+            return False
+        self.round_number += 1
+        print(f'Round {self.round_number}: {len(pairings)} matches')
+        round_matches = self._create_matches(pairings)
+        self.matches.update(round_matches)
+        # Quarantined agents are still paired, so their opponents get the points as in earlier rounds
+        round_matches = self._forfeit_matches(round_matches)
+        self._schedule_matches(self._reuse_cached_matches(round_matches) if self.incremental else round_matches)
+        return True
+
+    def _get_incomplete_matches(self, task_ids: list[int]) -> list[str]:
+        """Matches of the given tasks that could not be ingested (missing, partial or broken results)"""
+        return [match_id for task_id in task_ids for match_id in self._get_task_match_ids(task_id)
+                if not self.aggregator.has_match(match_id)]
+
+    def run_tasks(self, task_ids: list[int]) -> None:
+        """
+        Run array tasks until all their matches are complete or out of retries.
+        Retries only run the incomplete matches, and keep the games those
+        already finished (see `run_match.py`).
+        """
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            tournament_job_id = self.submit_matches(task_ids)
+            self.wait_for_all_jobs(tournament_job_id, task_ids)
+            self._record_makespan(task_ids, attempt, time.monotonic() - start)
+            incomplete_matches = self._get_incomplete_matches(task_ids)
+            if len(incomplete_matches) == 0:
+                return
+            if attempt >= self.match_retries:
+                print(f'{len(incomplete_matches)} matches still incomplete after {attempt} retries, '
+                      f'giving up on them: {incomplete_matches}')
+                self.incomplete_matches += incomplete_matches
+                return
+            backoff = self.retry_backoff_seconds * 2 ** attempt
+            attempt += 1
+            print(f'{len(incomplete_matches)} matches incomplete, retry {attempt}/{self.match_retries} '
+                  f'in {backoff:.0f}s: {incomplete_matches}')
+            time.sleep(backoff)
+            task_ids = self._schedule_retries(incomplete_matches)
+
+    def _record_makespan(self, task_ids: list[int], attempt: int, actual_seconds: float) -> None:
+        """Compare the predicted with the actual makespan (including queueing) of a submitted range of tasks"""
+        task_seconds = [sum(self.predicted_match_seconds[match_id] for match_id in self._get_task_match_ids(task_id))
+                        for task_id in task_ids]
+        predicted_seconds = predict_makespan(task_seconds, self.array_concurrency)
+        self.makespans.append({
+            'round': self.round_number,
+            'attempt': attempt,
+            'tasks': len(task_ids),
+            'predicted_seconds': predicted_seconds,
+            'actual_seconds': actual_seconds,
+            'predicted_max_task_seconds': max(task_seconds),
+        })
+        print(f'Makespan of {len(task_ids)} tasks: predicted {predicted_seconds:.0f}s, actual {actual_seconds:.0f}s')
+
+    def submit_matches(self, task_ids: list[int]) -> str:
+        """
+        Submit a range of array tasks as an array job to the executor (Slurm or
+        local), or in node worker mode an array of node workers running them
+        """
         job_script = self._create_job_script()
         if not self._is_run_match_container_built():
             raise ValueError('Run match container not built')
-        
-        # Submit the job
-        result = subprocess.run(
-            ["sbatch", job_script], 
-            capture_output=True, 
-            text=True,
-            check=True
-        )
-        
-        # Extract job ID from sbatch output
-        job_id = result.stdout.strip().split()[-1]
-        print(f'Submitted tournament job with id {job_id}')
+
+        if self.node_workers > 0:
+            n_workers = min(self.node_workers, len(task_ids))
+            job_id = self.executor.submit(self._create_worker_script(task_ids), list(range(1, n_workers + 1)))
+            print(f'Submitted {n_workers} node workers with job id {job_id} (tasks {task_ids[0]}-{task_ids[-1]})')
+        else:
+            job_id = self.executor.submit(job_script, task_ids)
+            print(f'Submitted tournament job with id {job_id} (tasks {task_ids[0]}-{task_ids[-1]})')
+        self.n_submitted_tasks = task_ids[-1]
+        self.running_job_id = job_id
+        self.running_task_ids = task_ids
         return job_id
     
     def check_job_progress(self, tournament_job_id: str) -> dict[str, int]:
         """Check if all array tasks have completed"""
-        
-        result = subprocess.run(
-            ["sacct", "-j", tournament_job_id, "--format=JobID,State", "--parsable2"],
-            capture_output=True,
-            text=True
-        )
-        
-        # Parse output to check array task status
-        statuses = []
-        for line in result.stdout.splitlines()[1:]:  # Skip header
-            array_id, state = line.split('|')
-            statuses.append(state)
-            
+        statuses = list(self.executor.get_job_states([tournament_job_id]).values())
         progress = {
             "completed": sum(state == "COMPLETED" for state in statuses),
             "failed": sum(state == "FAILED" for state in statuses),
@@ -186,22 +413,107 @@ class TournamentManager:
         }
         return progress
     
-    def wait_for_all_jobs(self, tournament_job_id: str, check_interval: int = 30) -> dict[str, dict]:
-        """Wait for all jobs to complete"""
-        time.sleep(10)
-        while True:
-            progress = self.check_job_progress(tournament_job_id)
-            total_jobs_queued = sum(progress.values())
-            print(f"Progress:")
-            for key, value in progress.items():
-                print(f"{key}: {value}")
-            if progress["running"] + progress["pending"] == 0 and total_jobs_queued > 0:
-                print(f"All matches completed.")
-                break
-            time.sleep(check_interval)
-            
+    def wait_for_all_jobs(self, tournament_job_id: str, task_ids: list[int] | None = None) -> dict[str, dict]:
+        """
+        Wait for all array tasks to complete, driven by the done markers the
+        tasks write. sacct is only consulted as a low-frequency safety net for
+        tasks that died without writing a marker.
+        """
+        tracker = CompletionTracker(
+            self.done_dir,
+            task_ids=task_ids if task_ids is not None else list(range(1, self._get_n_tasks() + 1)),
+            job_id=tournament_job_id,
+            poll_interval=self.completion_poll_interval,
+            scheduler_check_interval=self.scheduler_check_interval,
+            executor=self.executor,
+            worker_job=self.node_workers > 0
+        )
+        self.jobs[tournament_job_id] = tracker.wait(on_tasks_done=self._ingest_finished_tasks)
+        failed_tasks = [task_id for task_id, result in self.jobs[tournament_job_id].items() if result != 0]
+        if len(failed_tasks) > 0:
+            print(f'{len(failed_tasks)} tasks did not finish cleanly: {sorted(failed_tasks)}')
+        print(f"All matches completed.")
         return self.jobs
     
+    def _get_task_match_ids(self, task_id: int) -> list[str]:
+        """Match ids run by an array task (task ids start at 1)"""
+        first_line, last_line = self.task_lines[task_id - 1]
+        return self.config_match_ids[first_line - 1:last_line]
+
+    def _ingest_finished_tasks(self, task_ids: list[int]) -> None:
+        """Fold the matches of finished tasks into the running standings"""
+        match_ids = [match_id for task_id in task_ids for match_id in self._get_task_match_ids(task_id)]
+        self.aggregator.ingest_matches(match_ids, workers=self.ingest_workers)
+        if self.circuit_breaker is not None:
+            # Also the games of matches left incomplete, e.g. by an agent that hangs
+            games = [game for match_id in match_ids for game in load_match_games(self._get_match_path(match_id))]
+            if len(self.circuit_breaker.record(games)) > 0:
+                self._forfeit_matches({match_id: players for match_id, players in self.scheduled_matches.items()
+                                       if not self.aggregator.has_match(match_id)})
+                self._cancel_forfeited_tasks()
+        self.aggregator.write_standings(self.standings_path)
+        print(f'Standings updated with {len(self.aggregator.match_stats)}/{len(self.matches)} matches')
+
+    def _forfeit_matches(self, matches: MatchData) -> MatchData:
+        """
+        Record the matches of quarantined agents as forfeited and add them to
+        the standings, returns the other matches
+        """
+        if self.circuit_breaker is None or len(self.circuit_breaker.quarantined) == 0:
+            return matches
+        remaining_matches = {}
+        forfeited_match_stats = []
+        timestamp = time.strftime(TIMESTAMP_FORMAT)
+        for match_id, (player1, player2) in matches.items():
+            if not (self.circuit_breaker.is_quarantined(player1) or self.circuit_breaker.is_quarantined(player2)):
+                remaining_matches[match_id] = (player1, player2)
+                continue
+            match_stats = forfeit_match_stats(match_id, self.tournament_id, (player1, player2),
+                                              self.circuit_breaker.quarantined, timestamp)
+            self.aggregator.add_match_stats(match_stats)
+            forfeited_match_stats.append(match_stats)
+        # The match stats file also tells run_match.py to skip the match
+        write_match_stats(self.results_dir, forfeited_match_stats)
+        if len(forfeited_match_stats) > 0:
+            print(f'Forfeited {len(forfeited_match_stats)} matches of quarantined agents')
+        return remaining_matches
+
+    def _cancel_forfeited_tasks(self) -> None:
+        """Cancel the unfinished tasks of the running job that only have forfeited matches left"""
+        task_ids = [task_id for task_id in self.running_task_ids
+                    if not (self.done_dir / str(task_id)).exists()
+                    and all(self.aggregator.has_match(match_id) for match_id in self._get_task_match_ids(task_id))]
+        if len(task_ids) == 0:
+            return
+        if self.node_workers > 0:
+            # Claimed here, no worker starts them; running ones skip their forfeited matches
+            task_ids = [task_id for task_id in task_ids if claim_task(self.claims_dir, task_id)]
+        else:
+            try:
+                self.executor.cancel(self.running_job_id, task_ids)
+            except RuntimeError as e:
+                print(f'Warning: {e}')
+                return
+        for task_id in task_ids:
+            write_done_marker(self.done_dir, task_id, 'CANCELLED')
+        print(f'Cancelled {len(task_ids)} tasks with only forfeited matches: {task_ids}')
+
+    def get_standings(self) -> TournamentStats:
+        """Current standings, partial while the tournament is still running"""
+        return self.aggregator.get_tournament_stats(match_order=list(self.matches))
+
+    def _get_n_tasks(self) -> int:
+        """Number of array tasks so far, each running up to `matches_per_task` matches"""
+        return len(self.task_lines)
+
+    def _get_task_minutes(self) -> int:
+        match_minutes = math.ceil(self.match_time_limit_minutes * self.match_format.max_games / MINI_MATCH_GAMES)
+        return min(match_minutes * self.matches_per_task, self.max_task_time_limit_minutes)
+
+    def _get_task_time_limit(self) -> str:
+        minutes = self._get_task_minutes()
+        return f'{minutes // 60}:{minutes % 60:02d}:00'
+
     def _create_job_script(self) -> str:
         """Create a Slurm job script template, to be submitted as an array job"""
         print(f'Creating job script: {self.job_script_path}')
@@ -211,17 +523,19 @@ class TournamentManager:
         # Format starting board as a bracketed list
         board_list = self.random_starting_board.flatten().tolist()
         formatted_starting_board = f"'[{','.join(map(str, board_list))}]'"
+        warm_agents_flag = ' \\\n    --warm-agents' if self.warm_agents else ''
+        metrics_flag = ' \\\n    --metrics' if self.game_metrics else ''
+        stage_agents_flag = ' \\\n    --stage-agents' if self.stage_agents else ''
         
         script_content = f"""#!/bin/bash
 #SBATCH --job-name=tournament_{self.tournament_id}
 #SBATCH --output={self.logs_dir}/{self.tournament_id}_%a.out
 #SBATCH --error={self.logs_dir}/{self.tournament_id}_%a.err
-#SBATCH --array=1-{len(self.matches)}
 #SBATCH --partition=cpu-5h
 #SBATCH --ntasks=1
-#SBATCH --time=0:22:00
-#SBATCH --mem-per-cpu=20G
-#SBATCH --cpus-per-task=3
+#SBATCH --time={self._get_task_time_limit()}
+#SBATCH --mem={self.match_mem_gb}G
+#SBATCH --cpus-per-task={self.match_cpus}
 
 # Debug info
 echo "Debug information:"
@@ -230,29 +544,59 @@ echo "Python version: $(python3 --version)"
 echo "Environment variables:"
 env | sort
 
-# Read match parameters from config file
-match_config=$(sed -n "$SLURM_ARRAY_TASK_ID"p {self.tournament_config_path})
-match_id=$(echo $match_config | cut -d' ' -f1)
-agent1_path=$(echo $match_config | cut -d' ' -f2)
-agent2_path=$(echo $match_config | cut -d' ' -f3)
-agent1_name=$(basename $agent1_path)
-agent2_name=$(basename $agent2_path)
+# Each task runs a contiguous range of lines of the config file, listed in the task file
+read first_line last_line < <(sed -n "${{SLURM_ARRAY_TASK_ID}}p" {self.task_file_path})
 
 echo "Match parameters:"
-echo "Match ID: $match_id"
-echo "Agent 1: $agent1_path -> $agent1_name"
-echo "Agent 2: $agent2_path -> $agent2_name"
+sed -n "${{first_line}},${{last_line}}p" {self.tournament_config_path}
 
-# Run the match directly with Python
+# Run the matches directly with Python
 python3 {self.root_dir}/run_match.py \\
-    --agent-paths "$agent1_path" "$agent2_path" \\
+    --match-config {self.tournament_config_path} \\
+    --lines $first_line $last_line \\
     --starting-board {formatted_starting_board} \\
-    --results-dir "{str(self.results_dir)}/$match_id"
+    --results-root "{str(self.results_dir)}" \\
+    --record-format {self.game_record_format} \\
+    --games {self.match_format.min_games} {self.match_format.max_games}{warm_agents_flag}{metrics_flag}{stage_agents_flag}
+status=$?
+
+# Signal completion to the tournament manager
+{done_marker_shell(self.done_dir)}
+exit $status
 """
         print('Writing job script to', self.job_script_path)
         self.job_script_path.write_text(script_content)
         return str(self.job_script_path)
 
+    def _create_worker_script(self, task_ids: list[int]) -> str:
+        """Create the script of the node workers running a range of tasks, to be submitted as an array job"""
+        # Tasks started later than this would not finish within the allocation
+        stop_claiming_after = 60 * max(self.max_task_time_limit_minutes - self._get_task_minutes(), 0)
+        # The worker keeps staged agents for all its tasks, not just while some task runs
+        stage_agents_flag = ' \\\n    --stage-agents' if self.stage_agents else ''
+        script_content = f"""#!/bin/bash
+#SBATCH --job-name=workers_{self.tournament_id}
+#SBATCH --output={self.logs_dir}/{self.tournament_id}_worker_%A_%a.out
+#SBATCH --error={self.logs_dir}/{self.tournament_id}_worker_%A_%a.err
+#SBATCH --partition=cpu-5h
+#SBATCH --nodes=1
+#SBATCH --exclusive
+#SBATCH --mem=0
+#SBATCH --time={self.max_task_time_limit_minutes // 60}:{self.max_task_time_limit_minutes % 60:02d}:00
+
+# Run the tasks {task_ids[0]}-{task_ids[-1]} from the shared queue, as many at once as the node allows
+python3 {self.root_dir}/node_worker.py \\
+    --job-script {self.job_script_path} \\
+    --claims-dir {self.claims_dir} \\
+    --tasks {task_ids[0]} {task_ids[-1]} \\
+    --cpus-per-match {self.match_cpus} \\
+    --mem-per-match-gb {self.match_mem_gb} \\
+    --stop-claiming-after {stop_claiming_after}{stage_agents_flag}
+"""
+        print('Writing node worker script to', self.worker_script_path)
+        self.worker_script_path.write_text(script_content)
+        return str(self.worker_script_path)
+
     def _is_run_match_container_built(self) -> bool:
         """Check if the run_match container is built"""
         c4league_root_dir = os.getenv("C4LEAGUE_ROOT_DIR")
@@ -262,29 +606,134 @@ python3 {self.root_dir}/run_match.py \\
 
     def process_results(self):
         """Process the results of the tournament"""
-        match_stats = []
-        for match_id, (player1, player2) in self.matches.items():
-            match_results_dir = self._get_match_path(match_id)
-            print(f'Processing results for match {match_id} between {player1} and {player2}')
-            
-            game_result_files = [_file for _file in match_results_dir.iterdir() if _file.name.endswith('.json') and _file.name[-12:-10] == '_g']
-            if len(game_result_files) != 4:
-                print(f'Not all game result files found for match {match_id}')
-                continue
-            else:
-                print(f'Found all {len(game_result_files)} game result files for match {match_id}')
-                print(f'Processing game result files...')
-                game_stats = []
-                for game_result_file in game_result_files:
-                    with open(game_result_file, 'r') as f:
-                        game_stats.append(game_stats_from_json(json.load(f)))
-                print('Generating match stats...')
-                _match_stats = generate_match_stats_from_game_stats(game_stats)
-                with open(match_results_dir / f'{match_id}.json', 'w') as f:
-                    json.dump(_match_stats.generate_json(), f, ensure_ascii=False, indent=4)
-                match_stats.append(_match_stats)
+        # Matches of finished tasks have already been ingested while waiting,
+        # only matches that were not complete at that point are left.
+        remaining_match_ids = [match_id for match_id in self.matches if not self.aggregator.has_match(match_id)]
+        print(f'{len(self.aggregator.match_stats)} matches already processed, {len(remaining_match_ids)} remaining')
+        self.aggregator.ingest_matches(remaining_match_ids, workers=self.ingest_workers)
+        if len(self.incomplete_matches) > 0:
+            with open(self.results_dir / f'{self.tournament_id}_incomplete.json', 'w') as f:
+                json.dump(self.incomplete_matches, f, ensure_ascii=False, indent=4)
+            print(f'{len(self.incomplete_matches)} matches are missing from the results, '
+                  f'see {self.results_dir / f"{self.tournament_id}_incomplete.json"}')
+        if self.circuit_breaker is not None and len(self.circuit_breaker.failures) > 0:
+            self.write_quarantine_report()
+        print('Validating games...')
+        games = self.validate_results(self._load_played_games())
+        if self.match_format.is_sequential:
+            self._report_match_lengths()
         print('Generating tournament stats...')
-        tournament_stats = generate_tournament_stats_from_match_stats(match_stats)
+        tournament_stats = self.get_standings()
         with open(self.results_dir / f'{self.tournament_id}.json', 'w') as f:
             json.dump(tournament_stats.generate_json(), f, ensure_ascii=False, indent=4)
+        self.aggregator.write_standings(self.standings_path)
         print('Generating stats completed.')
+        self._update_match_cache()
+        self.update_ratings(tournament_stats)
+        self.index_results(tournament_stats, games)
+        self.update_durations(games)
+        if self.game_metrics:
+            metrics_path = self.results_dir / f'{self.tournament_id}_metrics.json'
+            write_metrics_report(metrics_path, get_metrics_report(games))
+            print(f'Game metrics report written to {metrics_path}')
+
+    def _report_match_lengths(self) -> None:
+        """Games played per match, and how many matches stopped before their maximum"""
+        n_games = [len(match_stats.game_ids) for match_id, match_stats in self.aggregator.match_stats.items()
+                   if match_id in self.scheduled_matches and match_stats.forfeited_by is None]
+        if len(n_games) == 0:
+            return
+        n_early = sum(games < self.match_format.max_games for games in n_games)
+        print(f'Sequential matches: {sum(n_games)} games in {len(n_games)} matches ({np.mean(n_games):.1f} per match), '
+              f'{n_early} decided before {self.match_format.max_games} games')
+
+    def write_quarantine_report(self) -> None:
+        """Failures per agent, the quarantined agents and the matches they forfeited"""
+        report = {
+            'quarantined': [str(player) for player in self.circuit_breaker.quarantined],
+            'forfeited_matches': [match_id for match_id, match_stats in self.aggregator.match_stats.items()
+                                  if match_stats.forfeited_by is not None],
+            'failures': self.circuit_breaker.get_report(),
+        }
+        quarantine_path = self.results_dir / f'{self.tournament_id}_quarantine.json'
+        with open(quarantine_path, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f'{len(report["quarantined"])} agents quarantined, {len(report["forfeited_matches"])} matches '
+              f'forfeited, see {quarantine_path}')
+
+    def _load_played_games(self) -> list[GameStats]:
+        """Games of all matches played (not reused or forfeited) in this tournament"""
+        return [game for match_id in self.matches
+                if self.aggregator.has_match(match_id) and self.aggregator.match_stats[match_id].reused_from is None
+                and self.aggregator.match_stats[match_id].forfeited_by is None
+                for game in load_match_games(self.results_dir / match_id)]
+
+    def validate_results(self, games: list[GameStats]) -> list[GameStats]:
+        """
+        Replay all games and report the invalid ones. If enabled, matches with
+        invalid games are taken out of the standings. Returns the games of the
+        matches that remain.
+        """
+        problems = validate_games(games)
+        if len(problems) == 0:
+            return games
+        with open(self.results_dir / f'{self.tournament_id}_validation.json', 'w') as f:
+            json.dump(problems, f, ensure_ascii=False, indent=4)
+        invalid_match_ids = sorted(set(game.match_id for game in games if game.game_id in problems))
+        print(f'{len(problems)} invalid games in {len(invalid_match_ids)} matches, '
+              f'see {self.results_dir / f"{self.tournament_id}_validation.json"}')
+        if not self.exclude_invalid_matches:
+            return games
+        for match_id in invalid_match_ids:
+            self.aggregator.remove_match(match_id)
+        print(f'Excluded {len(invalid_match_ids)} matches with invalid games from the standings')
+        return [game for game in games if game.match_id not in invalid_match_ids]
+
+    def update_ratings(self, tournament_stats: TournamentStats) -> None:
+        """Add the tournament's matches to the persistent ratings and write the current rating table"""
+        rating_state = load_rating_state(self.ratings_path)
+        n_added = rating_state.add_match_stats(
+            [self.aggregator.match_stats[match_id] for match_id in tournament_stats.match_ids])
+        n_iterations = rating_state.fit()
+        rating_state.save(self.ratings_path)
+        write_ratings(self.results_dir / f'{self.tournament_id}_ratings.json', rating_state.get_ratings())
+        print(f'Ratings updated with {n_added} matches ({n_iterations} iterations), '
+              f'{rating_state.n_players} rated agents')
+
+    def update_durations(self, games: list[GameStats]) -> None:
+        """
+        Write predicted vs. actual makespans, and vs. measured match durations
+        where games have metrics, then learn agent durations from those metrics.
+        """
+        measured_seconds: dict[str, float] = {}
+        for game in games:
+            if game.metrics is not None:
+                game_ms = sum(game.metrics.move_ms) + sum(ms for ms in game.metrics.startup_ms if ms is not None)
+                measured_seconds[game.match_id] = measured_seconds.get(game.match_id, 0.) + game_ms / 1000
+        errors = [abs(self.predicted_match_seconds[match_id] - seconds) / seconds
+                  for match_id, seconds in measured_seconds.items()
+                  if seconds > 0 and match_id in self.predicted_match_seconds]
+        report = {
+            'makespans': self.makespans,
+            'measured_matches': len(errors),
+            'median_match_error': float(np.median(errors)) if len(errors) > 0 else None,
+        }
+        makespan_path = self.results_dir / f'{self.tournament_id}_makespan.json'
+        with open(makespan_path, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f'Makespan report written to {makespan_path}')
+        n_updated = self.duration_model.update(games)
+        if n_updated > 0:
+            self.duration_model.save()
+            print(f'Duration history updated for {n_updated} agents')
+
+    def index_results(self, tournament_stats: TournamentStats, games: list[GameStats]) -> None:
+        """Add the finished tournament to the cross-tournament results index"""
+        print(f'Adding tournament to results index {self.results_index_path}...')
+        match_stats = [self.aggregator.match_stats[match_id] for match_id in tournament_stats.match_ids]
+        try:
+            with ResultsIndex(self.results_index_path) as results_index:
+                results_index.add_tournament(tournament_stats, match_stats, games)
+        except sqlite3.Error as e:
+            # The tournament results themselves are complete, the index can be rebuilt from them
+            print(f'Warning: could not update results index: {e}')
@@ -41,18 +41,18 @@ def generate_id() -> str:
     return ''.join(random.choices(string.ascii_lowercase + string.digits, k=ID_DIGITS))
 
 def _get_diff_agents(submitted_agents: list[TournamentPlayer], containerized_agents: list[TournamentPlayer]) -> list[tuple[TournamentPlayer, str]]:
+    containerized = set(containerized_agents)
+    containerized_teams = set(agent.team_name for agent in containerized_agents)
+    containerized_names = set((agent.team_name, agent.agent_name) for agent in containerized_agents)
     diff_agents = []
     for submitted_agent in submitted_agents:
-        if submitted_agent not in containerized_agents:
-            team_agents = [agent for agent in containerized_agents if agent.team_name == submitted_agent.team_name]
-            if len(team_agents) == 0:
+        if submitted_agent not in containerized:
+            if submitted_agent.team_name not in containerized_teams:
                 diff_agents.append((submitted_agent, 'team_name'))
+            elif (submitted_agent.team_name, submitted_agent.agent_name) not in containerized_names:
+                diff_agents.append((submitted_agent, 'agent_name'))
             else:
-                previous_agent = [agent for agent in team_agents if agent.agent_name == submitted_agent.agent_name]
-                if len(previous_agent) == 0:
-                    diff_agents.append((submitted_agent, 'agent_name'))
-                else:
-                    diff_agents.append((submitted_agent, 'version'))
+                diff_agents.append((submitted_agent, 'version'))
     return diff_agents
 
 def get_updated_agents(submitted_agents: list[TournamentPlayer], containerized_agents: list[TournamentPlayer]) -> list[TournamentPlayer]:
@@ -64,6 +64,13 @@ def get_new_agents(submitted_agents: list[TournamentPlayer], containerized_agent
     diff_agents = _get_diff_agents(submitted_agents, containerized_agents)
     return [agent[0] for agent in diff_agents if agent[1] != 'version']
 
+def get_superseded_agents(submitted_agents: list[TournamentPlayer], containerized_agents: list[TournamentPlayer]) -> list[TournamentPlayer]:
+    """Containerized agents of which another version was submitted"""
+    submitted = set(submitted_agents)
+    submitted_names = set((agent.team_name, agent.agent_name) for agent in submitted_agents)
+    return [agent for agent in containerized_agents
+            if agent not in submitted and (agent.team_name, agent.agent_name) in submitted_names]
+
 def get_tournament_player_from_sif(file: str) -> TournamentPlayer:
     team_name, agent_name, version = file.rstrip(".sif").split("_")
     return TournamentPlayer(team_name, agent_name, version)
@@ -0,0 +1,51 @@
+"""
+Converts the results of a finished tournament from one JSON file per game to
+the compact binary formats of `c4league.storage.records`:
+
+- one `<match_id>.c4r` record file per match directory
+- a columnar `<tournament_id>_games.npz` archive with all games of the tournament
+
+Usage: python convert_results.py <tournament results dir> [--remove-json]
+"""
+import argparse
+import os
+from pathlib import Path
+
+from c4league.storage.ingestion import get_game_result_files, get_match_record_file, load_match_games
+from c4league.storage.records import game_stats_to_records, read_game_records, write_tournament_archive
+
+
+def convert_tournament_results(results_dir: Path, remove_json: bool = False) -> Path:
+    """Convert all match directories of a tournament, returns the path of the archive"""
+    tournament_id = results_dir.name
+    all_games = []
+    for match_dir in sorted(_dir for _dir in results_dir.iterdir() if _dir.is_dir() and not _dir.name.startswith('.')):
+        json_files = get_game_result_files(match_dir)
+        games = load_match_games(match_dir)
+        if len(games) == 0:
+            continue
+        if len(json_files) > 0:
+            record_file = get_match_record_file(match_dir)
+            tmp_path = record_file.with_name(f'.{record_file.name}.tmp')
+            tmp_path.write_bytes(game_stats_to_records(games))
+            os.replace(tmp_path, record_file)
+            # Only drop the JSON files once the record file reads back identically
+            if remove_json and [game.generate_json() for game in read_game_records(record_file)] == \
+                    [game.generate_json() for game in games]:
+                for json_file in json_files:
+                    json_file.unlink()
+        all_games += games
+
+    archive_path = results_dir / f'{tournament_id}_games.npz'
+    write_tournament_archive(archive_path, all_games)
+    print(f'Converted {len(all_games)} games, archive written to {archive_path}')
+    return archive_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert tournament results to binary game records')
+    parser.add_argument('results_dir', type=str)
+    parser.add_argument('--remove-json', action='store_true',
+                        help='Remove the per-game JSON files after a successful conversion')
+    args = parser.parse_args()
+    convert_tournament_results(Path(args.results_dir), args.remove_json)
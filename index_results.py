@@ -0,0 +1,36 @@
+"""
+Adds finished tournaments from the results directory to the results index
+(see c4league.storage.index), e.g. to backfill tournaments that ran before the
+index existed. Tournaments that are already indexed are skipped unless
+--reindex is given.
+
+Usage: python index_results.py [--results-dir DIR] [--index-path PATH] [--reindex]
+"""
+import argparse
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+from c4league.storage.index import ResultsIndex
+
+load_dotenv()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index tournament results')
+    parser.add_argument('--results-dir', type=str, default=os.getenv("TOURNAMENT_RESULTS_DIRECTORY"))
+    parser.add_argument('--index-path', type=str, default=os.getenv("RESULTS_INDEX_PATH"))
+    parser.add_argument('--reindex', action='store_true', help='Re-index tournaments that are already indexed')
+    args = parser.parse_args()
+    results_dir = Path(args.results_dir)
+    index_path = Path(args.index_path) if args.index_path else results_dir / 'results_index.sqlite'
+
+    with ResultsIndex(index_path) as results_index:
+        n_indexed = 0
+        for tournament_dir in sorted(_dir for _dir in results_dir.iterdir() if _dir.is_dir()):
+            if not args.reindex and results_index.has_tournament(tournament_dir.name):
+                continue
+            if results_index.add_tournament_dir(tournament_dir):
+                print(f'Indexed tournament {tournament_dir.name}')
+                n_indexed += 1
+        print(f'Indexed {n_indexed} tournaments into {index_path}')
@@ -0,0 +1,29 @@
+"""
+Prints move latency and resource usage per agent and the slowest matches of a
+tournament played with game metrics (GAME_METRICS="1", see
+c4league.storage.metrics).
+
+Usage: python metrics_report.py tournament_results/<tournament_id> [--slowest N] [--output report.json]
+"""
+import argparse
+from pathlib import Path
+
+from c4league.storage.ingestion import load_match_games
+from c4league.storage.metrics import get_metrics_report, format_metrics_report, write_metrics_report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report game metrics of a tournament')
+    parser.add_argument('results_dir', type=str, help='Results directory of the tournament')
+    parser.add_argument('--slowest', type=int, default=10, help='Number of slowest matches to list')
+    parser.add_argument('--output', type=str, help='Also write the report as JSON')
+    args = parser.parse_args()
+
+    results_dir = Path(args.results_dir)
+    games = [game for match_dir in sorted(_dir for _dir in results_dir.iterdir() if _dir.is_dir()
+                                          and not _dir.name.startswith('.'))
+             for game in load_match_games(match_dir)]
+    report = get_metrics_report(games, args.slowest)
+    print(format_metrics_report(report))
+    if args.output is not None:
+        write_metrics_report(Path(args.output), report)
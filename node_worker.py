@@ -0,0 +1,35 @@
+"""
+Runs the tasks of a tournament on one allocated node, as part of the node
+worker mode (NODE_WORKERS, see c4league.node_worker). Started by the worker
+job script the tournament manager submits.
+
+Usage: python node_worker.py --job-script <array job script> --claims-dir <dir> --tasks FIRST LAST
+           [--cpus-per-match 3] [--mem-per-match-gb 60] [--stop-claiming-after SECONDS] [--stage-agents]
+"""
+import argparse
+import contextlib
+from pathlib import Path
+
+from c4league.node_worker import NodeWorker, get_slots
+from c4league.staging import AgentStage, get_stage_dir
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run tournament tasks from a shared queue on this node')
+    parser.add_argument('--job-script', type=str, required=True, help='Array job script running one task')
+    parser.add_argument('--claims-dir', type=str, required=True, help='Shared directory of task claims')
+    parser.add_argument('--tasks', type=int, nargs=2, metavar=('FIRST', 'LAST'), required=True,
+                        help='Range of task ids (inclusive) in the queue')
+    parser.add_argument('--cpus-per-match', type=int, default=3)
+    parser.add_argument('--mem-per-match-gb', type=float, default=None)
+    parser.add_argument('--stop-claiming-after', type=float, default=None,
+                        help='Do not start new tasks after this many seconds')
+    parser.add_argument('--stage-agents', action='store_true',
+                        help='Keep agents staged to node-local storage (see c4league.staging) until the worker ends')
+    args = parser.parse_args()
+
+    mem_per_match_mb = int(args.mem_per_match_gb * 1024) if args.mem_per_match_gb else None
+    worker = NodeWorker(Path(args.job_script), Path(args.claims_dir), list(range(args.tasks[0], args.tasks[1] + 1)),
+                        get_slots(args.cpus_per_match, mem_per_match_mb), args.stop_claiming_after)
+    with AgentStage(get_stage_dir()) if args.stage_agents else contextlib.nullcontext():
+        worker.run()
@@ -1,5 +1,6 @@
 """
-This script runs a single match between two agents inside a container.
+This script runs a single match between two agents inside a container, or a
+batch of matches read from a range of lines of the tournament config file.
 
 (Tentative) Container directory structure:
 - /opt/
@@ -18,9 +19,30 @@ This script runs a single match between two agents inside a container.
     - run_match.py
 
 Arguments passed to the script:
-- --match-id: Match id
+- --agent-paths: Paths to the two agent containers (single match)
+- --results-dir: Directory to store match results (single match)
+- --match-config: Tournament config file, one `<match_id> <agent1> <agent2>` per line (batch)
+- --lines: First and last (1-based, inclusive) config line to run (batch)
+- --results-root: Tournament results directory containing one directory per match (batch)
 - --starting-board: Initial board state as a flattened list of 42 integers
-- --results-dir: Directory to store match results
+- --record-format: `json` (one file per game, default) or `binary` (one append-only
+  `<match_id>.c4r` record file per match, see c4league.storage.records)
+- --warm-agents: Start each agent container once and keep it running for all games
+  (and, in batch mode, for later matches of the same agent)
+- --stage-agents: Copy the agent containers to node-local storage first and start
+  them from there (see c4league.staging)
+- --games: Minimum and maximum number of games per match (default 4 4). With a
+  higher maximum, games are played in pairs until a sequential test decides the
+  match (see c4league.sequential)
+- --metrics: Record per-move think times, container startup times and peak RSS/CPU
+  time of both agents with every game. Without --warm-agents, every game then runs
+  on freshly started agent sessions (see c4league.agent_session) instead of
+  `c4utils.match.play_match`, which cannot be instrumented
+
+Games already recorded in a match's results directory (by an earlier attempt
+that was interrupted, see `TournamentManager.run_tasks`) are kept and only the
+missing games are played. In batch mode, matches that already have match stats
+(forfeited by a quarantined agent, see c4league.quarantine) are skipped.
 
 Important:
 - Get agent names from .sif files
@@ -28,18 +50,26 @@ Important:
 - Mount results directory 
 """
 import argparse
+import contextlib
 import numpy as np
 from pathlib import Path
+import os
 import time
 import json
+import sys
 import traceback
 
 from c4utils.match import play_match
 from c4utils.c4_types import Player, PLAYER1, PLAYER2, BOARD_SIZE
 
 from c4league.utils import get_tournament_player_from_sif, generate_id
-from c4league.storage.stats import GameStats, TIMESTAMP_FORMAT
-from c4league.params import TIMEOUT
+from c4league.storage.stats import GameMetrics, GameStats, TIMESTAMP_FORMAT
+from c4league.storage.records import RECORD_SUFFIX, append_game_record
+from c4league.storage.ingestion import load_match_games, get_game_result_files, get_match_record_file
+from c4league.params import TIMEOUT, MINI_MATCH_GAMES
+from c4league.sequential import MatchFormat, get_extra_starting_boards
+from c4league.agent_session import AgentPool, AgentSession, play_game
+from c4league.staging import AgentStage, get_stage_dir
 
 EMPTY_BOARD = np.zeros(BOARD_SIZE, dtype=Player)
 
@@ -51,13 +81,92 @@ def parse_board(value):
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--agent-paths', type=str, nargs=2, required=True,
+    parser.add_argument('--agent-paths', type=str, nargs=2,
                        help='Paths to two agent containers')
+    parser.add_argument('--results-dir', type=str)
+    parser.add_argument('--match-config', type=str,
+                       help='Tournament config file to read a batch of matches from')
+    parser.add_argument('--lines', type=int, nargs=2, metavar=('FIRST', 'LAST'),
+                       help='Range of config lines (1-based, inclusive) to run')
+    parser.add_argument('--results-root', type=str)
     parser.add_argument('--starting-board', type=parse_board, required=True)
-    parser.add_argument('--results-dir', type=str, required=True)
-    return parser.parse_args()
+    parser.add_argument('--record-format', choices=['json', 'binary'], default='json')
+    parser.add_argument('--warm-agents', action='store_true',
+                       help='Keep agent containers running between games')
+    parser.add_argument('--games', type=int, nargs=2, metavar=('MIN', 'MAX'),
+                       default=[MINI_MATCH_GAMES, MINI_MATCH_GAMES],
+                       help='Minimum and maximum number of games per match')
+    parser.add_argument('--metrics', action='store_true',
+                       help='Record move times and agent resource usage with every game')
+    parser.add_argument('--stage-agents', action='store_true',
+                       help='Run agent containers from node-local copies')
+    args = parser.parse_args()
+    if args.match_config is None and (args.agent_paths is None or args.results_dir is None):
+        parser.error('either --agent-paths and --results-dir or --match-config, --lines and --results-root are required')
+    if args.match_config is not None and (args.lines is None or args.results_root is None):
+        parser.error('--match-config requires --lines and --results-root')
+    return args
+
+def read_match_config(config_path: Path, first_line: int, last_line: int) -> list[tuple[str, list[Path]]]:
+    """Read matches from lines first_line to last_line (1-based, inclusive) of a tournament config file"""
+    matches = []
+    with open(config_path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if line_number < first_line or not line.strip():
+                continue
+            if line_number > last_line:
+                break
+            match_id, agent1_path, agent2_path = line.split()
+            matches.append((match_id, [Path(agent1_path), Path(agent2_path)]))
+    return matches
+
+def get_game_order(starting_board: np.ndarray, players: list,
+                   n_games: int = MINI_MATCH_GAMES) -> list[tuple[np.ndarray, list]]:
+    """
+    Starting board and (first, second) players of each of up to `n_games`
+    games of a match, in the order they are played: pairs of games on the
+    empty board, the starting board and then further boards
+    """
+    n_boards = n_games // 2
+    boards = [EMPTY_BOARD, starting_board] + get_extra_starting_boards(starting_board, n_boards - 2)
+    return [(_starting_board, players[::play_first])
+            for _starting_board in boards[:n_boards] for play_first in [1, -1]]
 
-def run_match(agent_paths: list[Path], starting_board: np.ndarray, results_dir: Path):
+def get_finished_games(results_dir: Path, game_order: list[tuple[np.ndarray, list]]) -> dict[int, GameStats]:
+    """
+    Games an earlier attempt of the match already recorded, by their position in
+    `game_order`. Recorded games that cannot be read or do not fit the match
+    are removed, and the match is then played from scratch.
+    """
+    if not results_dir.exists():
+        return {}
+    try:
+        games = load_match_games(results_dir)
+    except Exception as e:
+        print(f'Could not read recorded games of {results_dir.name}: {e}')
+        games = None
+    finished_games = {}
+    for game in games or []:
+        for i, (_starting_board, _players) in enumerate(game_order):
+            if i not in finished_games and np.array_equal(np.asarray(game.initial_board), _starting_board) \
+                    and [game.player1, game.player2] == list(_players):
+                finished_games[i] = game
+                break
+        else:
+            print(f'Recorded game {game.game_id} does not fit match {results_dir.name}')
+            games = None
+            break
+    if games is None:
+        print(f'Removing recorded games of {results_dir.name}, the match is played again')
+        get_match_record_file(results_dir).unlink(missing_ok=True)
+        for game_result_file in get_game_result_files(results_dir):
+            game_result_file.unlink()
+        return {}
+    return finished_games
+
+def run_match(agent_paths: list[Path], starting_board: np.ndarray, results_dir: Path,
+              agent_pool: AgentPool | None = None, record_format: str = 'json', collect_metrics: bool = False,
+              match_format: MatchFormat | None = None):
     agent_names = [str(file_path.name) for file_path in agent_paths]
     players = [get_tournament_player_from_sif(agent_name) for agent_name in agent_names]
 
@@ -66,58 +175,150 @@ def run_match(agent_paths: list[Path], starting_board: np.ndarray, results_dir:
     print(f'Setting up match {match_id}...')
     tournament_id = match_id.split('_')[0]
 
-    # Run two normal games
-    for _starting_board in [EMPTY_BOARD, starting_board]:
+    # Games on the empty board, the starting board (and further boards), each agent playing first once
+    match_format = match_format or MatchFormat()
+    game_order = get_game_order(starting_board, players, match_format.max_games)
+    finished_games = get_finished_games(results_dir, game_order)
+    if match_format.is_complete(list(finished_games.values())):
+        print(f'Match {match_id} already completed.')
+        return
+    if len(finished_games) > 0:
+        print(f'Resuming match {match_id}, {len(finished_games)} games already recorded')
+
+    sessions = agent_pool.get_sessions(agent_paths) if agent_pool is not None else None
+
+    for i, (_starting_board, _players) in enumerate(game_order):
+        if match_format.should_stop([finished_games[j] for j in range(i)], players):
+            print(f'Match {match_id} decided after {i} games')
+            break
+        if i in finished_games:
+            continue
+        play_first = 1 if _players[0] == players[0] else -1
+        _agent_paths = agent_paths[::play_first]
         print(f'Running match with starting board:\n {_starting_board}')
-        for play_first in [1, -1]:
-            _agent_paths = agent_paths[::play_first]
-            _players = players[::play_first]
-            print(f'Playing first: {_players[0]}')
+        print(f'Playing first: {_players[0]}')
+        game_metrics: list[GameMetrics] | None = [] if collect_metrics else None
+        if sessions is not None:
+            _sessions = sessions[::play_first]
+            winner, moves, error = play_game(_sessions[0], _sessions[1], move_timeout=TIMEOUT,
+                                             initial_board=_starting_board, metrics=game_metrics)
+        elif collect_metrics:
+            # Cold start as with play_match, but through instrumented sessions
+            _sessions = [AgentSession(agent_path) for agent_path in _agent_paths]
+            try:
+                winner, moves, error = play_game(_sessions[0], _sessions[1], move_timeout=TIMEOUT,
+                                                 initial_board=_starting_board, metrics=game_metrics)
+            finally:
+                for session in _sessions:
+                    session.stop()
+        else:
             winner, moves, error = play_match(_agent_paths[0], _agent_paths[1], move_timeout=TIMEOUT, initial_board=_starting_board)
 
-            print(f'Winner: {winner}, Moves: {[int(move) for move in moves]}, Error: {error}')
-            
-            game_id = f'{match_id}_g{generate_id()}'
+        print(f'Winner: {winner}, Moves: {[int(move) for move in moves]}, Error: {error}')
+        
+        game_id = f'{match_id}_g{generate_id()}'
 
-            if winner == PLAYER1:
-                winning_player = _players[0]
-            elif winner == PLAYER2:
-                winning_player = _players[1]
-            else:
-                winning_player = None
-            
-            if error is None:
-                reason = 'Connect 4' if winning_player is not None else 'Draw'
-                _traceback = None
+        if winner == PLAYER1:
+            winning_player = _players[0]
+        elif winner == PLAYER2:
+            winning_player = _players[1]
+        else:
+            winning_player = None
+        
+        if error is None:
+            reason = 'Connect 4' if winning_player is not None else 'Draw'
+            _traceback = None
+        else:
+            _traceback = ''.join(traceback.format_exception(error))
+            if 'MoveTimeoutError' in _traceback:
+                reason = 'MoveTimeoutError'
+            elif 'AgentRuntimeError' in _traceback:
+                reason = 'AgentRuntimeError'
+            elif 'Invalid move:' in _traceback:
+                reason = 'Invalid move'
             else:
-                _traceback = ''.join(traceback.format_exception(error))
-                if 'MoveTimeoutError' in _traceback:
-                    reason = 'MoveTimeoutError'
-                elif 'AgentRuntimeError' in _traceback:
-                    reason = 'AgentRuntimeError'
-                elif 'Invalid move:' in _traceback:
-                    reason = 'Invalid move'
-                else:
-                    reason = 'Unknown Error'
+                reason = 'Unknown Error'
+        game_stats = GameStats(
+            game_id=game_id,
+            match_id=match_id,
+            tournament_id=tournament_id,
+            timestamp=time.strftime(TIMESTAMP_FORMAT),
+            player1=_players[0],
+            player2=_players[1],
+            initial_board=_starting_board,
+            moves=moves,
+            winner=winning_player,
+            reason=reason,
+            traceback=_traceback,
+            metrics=game_metrics[0] if game_metrics else None
+        )
+        if record_format == 'binary':
+            print(f'Appending results to {results_dir}/{match_id}{RECORD_SUFFIX}')
+            append_game_record(results_dir / f'{match_id}{RECORD_SUFFIX}', game_stats)
+        else:
             print(f'Writing results to {results_dir}/{game_id}.json')
-            game_stats = GameStats(
-                game_id=game_id,
-                match_id=match_id,
-                tournament_id=tournament_id,
-                timestamp=time.strftime(TIMESTAMP_FORMAT),
-                player1=_players[0],
-                player2=_players[1],
-                initial_board=_starting_board,
-                moves=moves,
-                winner=winning_player,
-                reason=reason,
-                traceback=_traceback
-            )
-            with open(f'{str(results_dir)}/{game_id}.json', 'w', encoding='utf-8') as f:
+            # Write and rename, a game file cut short by a crash would spoil a later resume
+            tmp_path = results_dir / f'.{game_id}.json.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(game_stats.generate_json(), f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, results_dir / f'{game_id}.json')
+        finished_games[i] = game_stats
     print(f'Match {match_id} completed.')
 
+def run_matches(matches: list[tuple[str, list[Path]]], starting_board: np.ndarray, results_root: Path,
+                warm_agents: bool = False, record_format: str = 'json', collect_metrics: bool = False,
+                match_format: MatchFormat | None = None) -> list[str]:
+    """
+    Run several matches back to back, returns the ids of matches that failed.
+
+    With `warm_agents`, started agent containers are kept in a pool and reused
+    by later matches of the batch involving the same agent.
+    """
+    agent_pool = AgentPool() if warm_agents else None
+    failed_matches = []
+    try:
+        for i, (match_id, agent_paths) in enumerate(matches):
+            print(f'Running match {i + 1}/{len(matches)}: {match_id}')
+            results_dir = results_root / match_id
+            results_dir.mkdir(parents=True, exist_ok=True)
+            if (results_dir / f'{match_id}.json').exists():
+                print(f'Match {match_id} already has a result (forfeited), skipping')
+                continue
+            try:
+                run_match(agent_paths, starting_board, results_dir, agent_pool, record_format, collect_metrics,
+                          match_format)
+            except Exception:
+                # Keep going, the remaining matches of the batch are unaffected
+                print(f'Match {match_id} failed:')
+                traceback.print_exc()
+                failed_matches.append(match_id)
+    finally:
+        if agent_pool is not None:
+            agent_pool.close()
+    return failed_matches
+
 if __name__ == '__main__':
     args = parse_args()
-    agent_paths = [Path(agent_path) for agent_path in args.agent_paths]
-    run_match(agent_paths, args.starting_board, Path(args.results_dir))
+    match_format = MatchFormat(*args.games)
+    with AgentStage(get_stage_dir()) if args.stage_agents else contextlib.nullcontext() as stage:
+        if args.match_config is not None:
+            matches = read_match_config(Path(args.match_config), *args.lines)
+            if stage is not None:
+                matches = [(match_id, [stage.stage(agent_path) for agent_path in agent_paths])
+                           for match_id, agent_paths in matches]
+            failed_matches = run_matches(matches, args.starting_board, Path(args.results_root), args.warm_agents,
+                                         args.record_format, args.metrics, match_format)
+            if len(failed_matches) > 0:
+                print(f'{len(failed_matches)} of {len(matches)} matches failed: {failed_matches}')
+                sys.exit(1)
+        else:
+            agent_paths = [Path(agent_path) for agent_path in args.agent_paths]
+            if stage is not None:
+                agent_paths = [stage.stage(agent_path) for agent_path in agent_paths]
+            agent_pool = AgentPool() if args.warm_agents else None
+            try:
+                run_match(agent_paths, args.starting_board, Path(args.results_dir), agent_pool, args.record_format,
+                          args.metrics, match_format)
+            finally:
+                if agent_pool is not None:
+                    agent_pool.close()
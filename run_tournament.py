@@ -1,10 +1,12 @@
 """
 This script is used to run a tournament.
 """
+import os
 from pathlib import Path
 from c4league.tournament_manager import TournamentManager
-from c4league.storage.cloud_storage import get_submitted_agents
-from c4league.utils import TournamentPlayer, get_new_agents, get_updated_agents
+from c4league.storage.cloud_storage import list_submissions
+from c4league.storage.submissions import SubmissionManifest, get_player_from_blob_name
+from c4league.utils import get_new_agents, get_updated_agents, get_superseded_agents
 from c4league.container_utils import containerize_agents, get_containerized_agents, remove_old_agents
 
 
@@ -32,28 +34,53 @@ def run_tournament():
     print('Gathering tournament participants...')
 
     print('Getting submitted agents from cloud storage...')
-    submitted_agents = [TournamentPlayer(**agent) for agent in get_submitted_agents()]
-    print('Checking for new agents...')
-    new_agents = get_new_agents(submitted_agents, get_containerized_agents())
-    print('Checking for updated agents...')
-    updated_agents = get_updated_agents(submitted_agents, get_containerized_agents())
-    print(f'Found {len(new_agents)} new agents and {len(updated_agents)} updated agents.')
+    submission_blobs = list_submissions()
+    manifest = SubmissionManifest(os.getenv("SUBMISSION_MANIFEST_PATH",
+                                            os.path.join(os.getenv("AGENT_CONTAINER_DIRECTORY"), ".submission_manifest.json")))
+    changes = manifest.diff(submission_blobs)
+    print(f'{len(submission_blobs)} submissions, {len(changes.added)} added, {len(changes.modified)} modified and '
+          f'{len(changes.removed)} removed since the last sync.')
+    submitted_agents = [get_player_from_blob_name(blob.name) for blob in submission_blobs]
+    containerized_agents = get_containerized_agents()
+    print('Checking for new and updated agents...')
+    new_agents = get_new_agents(submitted_agents, containerized_agents)
+    updated_agents = get_updated_agents(submitted_agents, containerized_agents)
+    # Re-uploaded under the same version with different content
+    containerized = set(containerized_agents)
+    modified_agents = [agent for agent in map(get_player_from_blob_name, (blob.name for blob in changes.modified))
+                       if agent in containerized]
+    print(f'Found {len(new_agents)} new agents, {len(updated_agents)} updated agents and '
+          f'{len(modified_agents)} modified agents.')
 
     # Build new/updated agents
-    if len(new_agents) > 0 or len(updated_agents) > 0:
-        if len(updated_agents) > 0:
-            print('Removing old agents...')
-            remove_old_agents(updated_agents)
+    failed_agents = []
+    if len(new_agents) > 0 or len(updated_agents) > 0 or len(modified_agents) > 0:
         print('Building new/updated agents...')
-        try:
-            containerize_agents(new_agents + updated_agents)
-        except Exception as e:
-            print(f'Error building agents: {e}')
-            exit(1)
-        
+        # Modified agents are rebuilt in place: a build only replaces the image once it succeeded
+        build_results = containerize_agents(new_agents + updated_agents + modified_agents)
+        failed_agents = [agent for agent, built in build_results.items() if not built]
+        if len(failed_agents) > 0:
+            print(f'Failed to build {len(failed_agents)} agents, their previous image (if any) takes part in '
+                  f'this tournament instead:')
+            for agent in failed_agents:
+                print(f'  {agent}')
+        # Old versions are only removed once the new version is built
+        built_names = set((agent.team_name, agent.agent_name) for agent, built in build_results.items() if built)
+        old_agents = [agent for agent in get_superseded_agents(submitted_agents, containerized_agents)
+                      if (agent.team_name, agent.agent_name) in built_names]
+        if len(old_agents) > 0:
+            print('Removing old agents...')
+            remove_old_agents(old_agents)
+
     else:
         print('No new or updated agents to build.')
 
+    # Failed builds stay out of the manifest, so they are retried on the next run
+    failed = set(failed_agents)
+    manifest.update([blob for blob in submission_blobs if get_player_from_blob_name(blob.name) not in failed])
+    manifest.remove(changes.removed)
+    manifest.save()
+
     # Set up tournament manager
     # Needs to:
     # - Initialize tournament (get new id, localize results dir, ..)
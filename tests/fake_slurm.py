@@ -0,0 +1,271 @@
+"""
+A local stand-in for the Slurm command line tools (sbatch, sacct, scancel).
+
+Jobs are executed on the local machine by a background dispatcher process, and
+their states are kept in plain files below a state directory, so sacct can be
+answered without a daemon. Used by the tests and benchmarks to drive the
+orchestration code without a cluster:
+
+    with FakeSlurm(queue_delay=0.1) as slurm:
+        slurm.add_command('apptainer', '#!/bin/bash\\ntouch "$2"\\n')
+        job_id = submit_job('build.sh')
+
+The same file doubles as the implementation of the shims it installs:
+
+    python fake_slurm.py sbatch|sacct|scancel|dispatch ...
+"""
+import fcntl
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+STATE_DIR_VAR = 'FAKE_SLURM_DIR'
+QUEUE_DELAY_VAR = 'FAKE_SLURM_QUEUE_DELAY'
+MAX_RUNNING_VAR = 'FAKE_SLURM_MAX_RUNNING'
+NO_ARRAY = '-'
+
+
+class FakeSlurm:
+    """Installs sbatch/sacct/scancel shims on PATH for the duration of a with block"""
+
+    def __init__(self, queue_delay: float = 0.0, max_running: int = 64):
+        self.queue_delay = queue_delay
+        self.max_running = max_running
+        self.root: Path | None = None
+        self._saved_env: dict[str, str | None] = {}
+
+    @property
+    def bin_dir(self) -> Path:
+        return self.root / 'bin'
+
+    @property
+    def state_dir(self) -> Path:
+        return self.root / 'state'
+
+    def __enter__(self) -> 'FakeSlurm':
+        self.root = Path(tempfile.mkdtemp(prefix='fake_slurm_'))
+        self.bin_dir.mkdir()
+        self.state_dir.mkdir()
+        for command in ['sbatch', 'sacct', 'scancel']:
+            self.add_command(command, f'#!/bin/sh\nexec "{sys.executable}" "{Path(__file__).resolve()}" {command} "$@"\n')
+        env = {
+            'PATH': f'{self.bin_dir}{os.pathsep}{os.environ.get("PATH", "")}',
+            STATE_DIR_VAR: str(self.state_dir),
+            QUEUE_DELAY_VAR: str(self.queue_delay),
+            MAX_RUNNING_VAR: str(self.max_running),
+        }
+        for key, value in env.items():
+            self._saved_env[key] = os.environ.get(key)
+            os.environ[key] = value
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.cancel_all()
+        for key, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def add_command(self, name: str, script: str) -> Path:
+        """Install an additional executable (e.g. a fake apptainer) on PATH"""
+        path = self.bin_dir / name
+        path.write_text(script)
+        path.chmod(0o755)
+        return path
+
+    def task_states(self, job_id: str) -> dict[str, str]:
+        return {task: state for task, state in _read_states(self.state_dir, job_id)}
+
+    def wait(self, job_id: str, timeout: float = 60.0) -> dict[str, str]:
+        """Block until every task of a job has finished"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            states = self.task_states(job_id)
+            if states and all(state not in ('PENDING', 'RUNNING') for state in states.values()):
+                return states
+            time.sleep(0.05)
+        raise TimeoutError(f'Fake Slurm job {job_id} did not finish within {timeout}s')
+
+    def cancel_all(self) -> None:
+        for job_dir in self.state_dir.glob('jobs/*'):
+            _cancel(self.state_dir, job_dir.name, None)
+
+
+# --- Shim implementations ---------------------------------------------------
+
+def _parse_array(spec: str) -> list[int]:
+    spec = spec.split('%')[0]
+    task_ids = []
+    for part in spec.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            task_ids.extend(range(int(start), int(end) + 1))
+        elif part:
+            task_ids.append(int(part))
+    return task_ids
+
+
+def _parse_sbatch_options(args: list[str]) -> dict[str, str]:
+    options = {}
+    for arg in args:
+        match = re.match(r'--([\w-]+)(?:=(.*))?', arg)
+        if match:
+            options[match.group(1)] = match.group(2) or ''
+    return options
+
+
+def _next_job_id(state_dir: Path) -> str:
+    counter = state_dir / 'next_id'
+    with open(state_dir / 'lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        job_id = int(counter.read_text()) if counter.exists() else 1000
+        counter.write_text(str(job_id + 1))
+    return str(job_id)
+
+
+def _write_state(path: Path, state: str) -> None:
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(state)
+    os.replace(tmp_path, path)
+
+
+def _read_states(state_dir: Path, job_id: str) -> list[tuple[str, str]]:
+    job_dir = state_dir / 'jobs' / job_id
+    if not job_dir.exists():
+        return []
+    states = []
+    for state_file in job_dir.glob('*.state'):
+        task = state_file.stem
+        name = job_id if task == NO_ARRAY else f'{job_id}_{task}'
+        states.append((name, state_file.read_text().strip()))
+    return sorted(states, key=lambda item: [int(x) for x in item[0].split('_')])
+
+
+def sbatch(args: list[str]) -> int:
+    state_dir = Path(os.environ[STATE_DIR_VAR])
+    script_path = Path(args[-1]).resolve()
+    directives = [line[len('#SBATCH'):].strip() for line in script_path.read_text().splitlines()
+                  if line.startswith('#SBATCH')]
+    options = _parse_sbatch_options(directives)
+    options.update(_parse_sbatch_options(args[:-1]))
+
+    job_id = _next_job_id(state_dir)
+    job_dir = state_dir / 'jobs' / job_id
+    job_dir.mkdir(parents=True)
+    tasks = [str(task) for task in _parse_array(options['array'])] if 'array' in options else [NO_ARRAY]
+    for task in tasks:
+        _write_state(job_dir / f'{task}.state', 'PENDING')
+    (job_dir / 'script').write_text(str(script_path))
+    (job_dir / 'cwd').write_text(os.getcwd())
+    (job_dir / 'output').write_text(options.get('output', 'slurm-%j.out'))
+    (job_dir / 'error').write_text(options.get('error', options.get('output', 'slurm-%j.out')))
+
+    subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), 'dispatch', job_id],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    print(f'Submitted batch job {job_id}')
+    return 0
+
+
+def _expand_log_path(pattern: str, job_id: str, task: str, cwd: str) -> str:
+    path = pattern.replace('%A', job_id).replace('%a', '0' if task == NO_ARRAY else task)
+    path = path.replace('%j', job_id if task == NO_ARRAY else f'{job_id}_{task}')
+    return os.path.join(cwd, path)
+
+
+def _run_task(state_dir: Path, job_id: str, task: str, queue_delay: float) -> None:
+    job_dir = state_dir / 'jobs' / job_id
+    state_path = job_dir / f'{task}.state'
+    time.sleep(queue_delay)
+    if state_path.read_text().strip() != 'PENDING':
+        return
+    _write_state(state_path, 'RUNNING')
+
+    cwd = (job_dir / 'cwd').read_text()
+    env = dict(os.environ)
+    env['SLURM_JOB_ID'] = job_id
+    if task != NO_ARRAY:
+        env['SLURM_ARRAY_JOB_ID'] = job_id
+        env['SLURM_ARRAY_TASK_ID'] = task
+    output_path = _expand_log_path((job_dir / 'output').read_text(), job_id, task, cwd)
+    error_path = _expand_log_path((job_dir / 'error').read_text(), job_id, task, cwd)
+    with open(output_path, 'a') as stdout, open(error_path, 'a') as stderr:
+        process = subprocess.Popen(['bash', (job_dir / 'script').read_text()], cwd=cwd, env=env,
+                                   stdout=stdout, stderr=stderr, start_new_session=True)
+        (job_dir / f'{task}.pid').write_text(str(process.pid))
+        returncode = process.wait()
+    if state_path.read_text().strip() == 'RUNNING':
+        _write_state(state_path, 'COMPLETED' if returncode == 0 else 'FAILED')
+
+
+def dispatch(args: list[str]) -> int:
+    state_dir = Path(os.environ[STATE_DIR_VAR])
+    job_id = args[0]
+    queue_delay = float(os.environ.get(QUEUE_DELAY_VAR, '0'))
+    max_running = int(os.environ.get(MAX_RUNNING_VAR, '64'))
+    tasks = [task for task, _ in _read_states(state_dir, job_id)]
+    tasks = [NO_ARRAY if '_' not in task else task.split('_')[1] for task in tasks]
+    with ThreadPoolExecutor(max_workers=max_running) as pool:
+        for task in tasks:
+            pool.submit(_run_task, state_dir, job_id, task, queue_delay)
+    return 0
+
+
+def sacct(args: list[str]) -> int:
+    state_dir = Path(os.environ[STATE_DIR_VAR])
+    job_ids = args[args.index('-j') + 1].split(',')
+    if '--noheader' not in args:
+        print('JobID|State')
+    for job_id in job_ids:
+        base_id, _, task = job_id.partition('_')
+        for name, state in _read_states(state_dir, base_id):
+            if not task or name == job_id:
+                print(f'{name}|{state}')
+    return 0
+
+
+def _cancel(state_dir: Path, job_id: str, task: str | None) -> None:
+    job_dir = state_dir / 'jobs' / job_id
+    for state_file in job_dir.glob('*.state'):
+        if task is not None and state_file.stem != task:
+            continue
+        state = state_file.read_text().strip()
+        if state not in ('PENDING', 'RUNNING'):
+            continue
+        _write_state(state_file, 'CANCELLED')
+        pid_file = state_file.with_suffix('.pid')
+        if state == 'RUNNING' and pid_file.exists():
+            try:
+                os.killpg(int(pid_file.read_text()), signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+
+def scancel(args: list[str]) -> int:
+    state_dir = Path(os.environ[STATE_DIR_VAR])
+    for arg in args:
+        if arg.startswith('-'):
+            continue
+        job_id, _, task = arg.partition('_')
+        if task.startswith('['):
+            for task_id in _parse_array(task.strip('[]')):
+                _cancel(state_dir, job_id, str(task_id))
+        else:
+            _cancel(state_dir, job_id, task or None)
+    return 0
+
+
+if __name__ == '__main__':
+    commands = {'sbatch': sbatch, 'sacct': sacct, 'scancel': scancel, 'dispatch': dispatch}
+    sys.exit(commands[sys.argv[1]](sys.argv[2:]))
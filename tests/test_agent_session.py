@@ -0,0 +1,168 @@
+import sys
+import numpy as np
+import pytest
+from c4utils.c4_types import PLAYER1, PLAYER2
+
+from c4league.agent_session import (
+    AgentPool, AgentRuntimeError, AgentSession, InvalidMoveError, MoveTimeoutError, play_game
+)
+from c4league.storage.stats import GameStats
+from c4league.storage.validation import validate_games
+from c4league.utils import TournamentPlayer
+from tests.fake_slurm import FakeSlurm
+
+# apptainer exec [--options] <image> <command...>: run the command inside the image directory
+FAKE_APPTAINER = '''#!/bin/bash
+shift
+while [[ "$1" == --* ]]; do shift; done
+cd "$1" || exit 255
+shift
+exec "$@"
+'''
+
+FIRST_FREE_COLUMN = '''import numpy as np
+
+def generate_move(board, player, saved_state):
+    return int(np.flatnonzero(board[-1] == 0)[0]), saved_state
+'''
+
+SAME_COLUMN = '''def generate_move(board, player, saved_state):
+    return 6, saved_state
+'''
+
+SLOW = '''import time
+
+def generate_move(board, player, saved_state):
+    time.sleep(5)
+    return 0, saved_state
+'''
+
+CRASHING = '''import os
+
+def generate_move(board, player, saved_state):
+    os._exit(1)
+'''
+
+BROKEN_IMPORT = '''import missing_dependency
+'''
+
+CHATTY = '''import os
+
+def generate_move(board, player, saved_state):
+    os.write(1, b'thinking...\\n')
+    return 0, saved_state
+'''
+
+
+@pytest.fixture
+def agents(tmp_path):
+    with FakeSlurm() as slurm:
+        slurm.add_command('apptainer', FAKE_APPTAINER)
+        slurm.add_command('python3', f'#!/bin/sh\nexec "{sys.executable}" "$@"\n')
+
+        def make_agent(name: str, source: str):
+            sif_path = tmp_path / f'{name}.sif'
+            sif_path.mkdir()
+            (sif_path / 'agent.py').write_text(source)
+            return sif_path
+        yield make_agent
+
+
+def test_play_game(agents):
+    session1 = AgentSession(agents('first_free', FIRST_FREE_COLUMN))
+    session2 = AgentSession(agents('same_column', SAME_COLUMN))
+    try:
+        winner, moves, error = play_game(session1, session2, 5, np.zeros((6, 7), dtype=np.int8))
+        # PLAYER1 fills column 0 from the bottom, PLAYER2 column 6
+        assert (winner, error) == (PLAYER1, None)
+        assert [int(move) for move in moves] == [0, 6, 0, 6, 0, 6, 0]
+
+        # The sessions keep running between games, the loser plays into a full column
+        pid = session1.process.pid
+        board = np.zeros((6, 7), dtype=np.int8)
+        board[:, 6] = [PLAYER1, PLAYER2] * 3
+        winner, moves, error = play_game(session2, session1, 5, board)
+        assert winner == PLAYER2 and isinstance(error, InvalidMoveError) and moves == []
+        assert session1.process.pid == pid
+    finally:
+        session1.stop()
+        session2.stop()
+
+
+def test_timeout_restarts_agent(agents):
+    slow = AgentSession(agents('slow', SLOW))
+    other = AgentSession(agents('first_free', FIRST_FREE_COLUMN))
+    try:
+        winner, moves, error = play_game(slow, other, 0.1, np.zeros((6, 7), dtype=np.int8))
+        assert winner == PLAYER2 and isinstance(error, MoveTimeoutError) and moves == []
+        assert not slow.is_running
+        slow.ensure_started()
+        assert slow.is_running
+    finally:
+        slow.stop()
+        other.stop()
+
+
+def test_crashed_agent_loses_and_restarts(agents):
+    crashing = AgentSession(agents('crashing', CRASHING))
+    other = AgentSession(agents('first_free', FIRST_FREE_COLUMN))
+    try:
+        winner, moves, error = play_game(other, crashing, 5, np.zeros((6, 7), dtype=np.int8))
+        assert winner == PLAYER1 and isinstance(error, AgentRuntimeError) and len(moves) == 1
+        assert crashing.process is None
+        # Started again for the next game
+        winner, moves, error = play_game(crashing, other, 5, np.zeros((6, 7), dtype=np.int8))
+        assert winner == PLAYER2 and isinstance(error, AgentRuntimeError) and moves == []
+    finally:
+        crashing.stop()
+        other.stop()
+
+
+def test_second_player_startup_failure_is_a_valid_forfeit(agents):
+    other = AgentSession(agents('first_free', FIRST_FREE_COLUMN))
+    broken = AgentSession(agents('broken_import', BROKEN_IMPORT))
+    try:
+        winner, moves, error = play_game(other, broken, 5, np.zeros((6, 7), dtype=np.int8))
+        assert winner == PLAYER1 and isinstance(error, AgentRuntimeError) and moves == []
+    finally:
+        other.stop()
+        broken.stop()
+    players = TournamentPlayer('team1', 'first_free', '1'), TournamentPlayer('team2', 'broken_import', '1')
+    game = GameStats(game_id='t_m1_g0', match_id='t_m1', tournament_id='t', timestamp='2024-01-01-12:00:00',
+                     player1=players[0], player2=players[1], initial_board=np.zeros((6, 7), dtype=np.int8),
+                     moves=moves, winner=players[0], reason='AgentRuntimeError', traceback=None)
+    assert validate_games([game]) == {}
+
+
+def test_invalid_reply_loses_the_game(agents):
+    chatty = AgentSession(agents('chatty', CHATTY))
+    other = AgentSession(agents('first_free', FIRST_FREE_COLUMN))
+    try:
+        winner, moves, error = play_game(chatty, other, 5, np.zeros((6, 7), dtype=np.int8))
+        assert winner == PLAYER2 and isinstance(error, AgentRuntimeError)
+        assert 'invalid reply' in str(error)
+    finally:
+        chatty.stop()
+        other.stop()
+
+
+def test_pool_reuses_least_recently_used_sessions(agents):
+    paths = [agents(f'agent_{i}', FIRST_FREE_COLUMN) for i in range(3)]
+    pool = AgentPool(max_sessions=3)
+    try:
+        session_a, session_b = pool.get_sessions([paths[0], paths[1]])
+        play_game(session_a, session_b, 5, np.zeros((6, 7), dtype=np.int8))
+        assert pool.get_sessions([paths[1], paths[0]]) == [session_b, session_a]
+        # An agent playing itself gets two sessions
+        session_c, session_d = pool.get_sessions([paths[1], paths[1]])
+        assert session_c is session_b and session_d is not session_b
+
+        # paths[0] was least recently used and is stopped when a new agent comes in
+        assert session_a.is_running
+        session_e, = pool.get_sessions([paths[2]])
+        assert not session_a.is_running and session_b.is_running
+        assert pool.get_sessions([paths[0]])[0] is not session_a
+        assert session_e.sif_path == paths[2]
+    finally:
+        pool.close()
+    assert not session_b.is_running
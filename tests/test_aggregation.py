@@ -0,0 +1,95 @@
+import json
+import numpy as np
+import pytest
+from c4league.utils import TournamentPlayer
+from c4league.storage.stats import GameStats, generate_match_stats_from_game_stats, \
+    generate_tournament_stats_from_match_stats
+from c4league.storage.aggregation import TournamentAggregator
+from c4league.storage.ingestion import load_match_games
+from c4utils.c4_types import Move, Player
+
+TOURNAMENT_ID = 'tabcde'
+
+@pytest.fixture
+def players():
+    return [TournamentPlayer('team1', 'agent1', '1'), TournamentPlayer('team2', 'agent2', '1'),
+            TournamentPlayer('team3', 'agent3', '2')]
+
+def _write_match(results_dir, match_id, player_a, player_b, winners):
+    match_dir = results_dir / match_id
+    match_dir.mkdir(parents=True)
+    for i, winner in enumerate(winners):
+        player1, player2 = (player_a, player_b) if i % 2 == 0 else (player_b, player_a)
+        game = GameStats(
+            game_id=f'{match_id}_g{i:05d}',
+            match_id=match_id,
+            tournament_id=TOURNAMENT_ID,
+            timestamp=f'2024-01-01-12:00:0{i}',
+            player1=player1,
+            player2=player2,
+            initial_board=np.zeros((6, 7), dtype=Player),
+            moves=[Move(0), Move(1)],
+            winner=winner,
+            reason='Connect 4' if winner is not None else 'Draw',
+            traceback=None
+        )
+        with open(match_dir / f'{game.game_id}.json', 'w') as f:
+            json.dump(game.generate_json(), f)
+
+def test_partial_and_final_standings_match_batch_processing(tmp_path, players):
+    a, b, c = players
+    _write_match(tmp_path, f'{TOURNAMENT_ID}_m00001', a, b, [a, a, b, None])
+    _write_match(tmp_path, f'{TOURNAMENT_ID}_m00002', a, c, [c, c, c, a])
+    _write_match(tmp_path, f'{TOURNAMENT_ID}_m00003', b, c, [None, None, b, b])
+    match_ids = [f'{TOURNAMENT_ID}_m0000{i}' for i in range(1, 4)]
+
+    aggregator = TournamentAggregator(TOURNAMENT_ID, tmp_path)
+    aggregator.ingest_match(match_ids[0])
+    partial = aggregator.get_tournament_stats()
+    assert partial.match_ids == match_ids[:1]
+    assert dict(partial.table) == {a: 2.5, b: 1.5}
+
+    for match_id in match_ids[1:]:
+        aggregator.ingest_match(match_id)
+    final = aggregator.get_tournament_stats(match_order=match_ids)
+
+    expected = generate_tournament_stats_from_match_stats(
+        [generate_match_stats_from_game_stats(load_match_games(tmp_path / match_id)) for match_id in match_ids])
+    assert final.match_ids == expected.match_ids
+    assert final.timestamp == expected.timestamp
+    assert dict(final.table) == dict(expected.table)
+    assert [score for _, score in final.table] == [score for _, score in expected.table]
+
+def test_incomplete_match_is_skipped_until_complete(tmp_path, players):
+    a, b, _ = players
+    match_id = f'{TOURNAMENT_ID}_m00001'
+    _write_match(tmp_path, match_id, a, b, [a, b, a])
+    aggregator = TournamentAggregator(TOURNAMENT_ID, tmp_path)
+    assert aggregator.ingest_match(match_id) is None
+    assert not aggregator.has_match(match_id)
+
+def test_parallel_ingestion_gives_identical_output(tmp_path, players):
+    a, b, c = players
+    pairings = [(a, b), (a, c), (b, c)] * 4
+    match_ids = []
+    for i, (player_a, player_b) in enumerate(pairings):
+        match_ids.append(f'{TOURNAMENT_ID}_m{i:05d}')
+        _write_match(tmp_path, match_ids[-1], player_a, player_b, [player_a, None, player_b, player_b if i % 3 else None])
+
+    outputs = []
+    for workers in [1, 3]:
+        aggregator = TournamentAggregator(TOURNAMENT_ID, tmp_path)
+        aggregator.ingest_matches(match_ids, workers=workers)
+        outputs.append(json.dumps(aggregator.get_tournament_stats(match_order=match_ids).generate_json()))
+    assert outputs[0] == outputs[1]
+
+def test_removed_match_leaves_table(tmp_path, players):
+    a, b, c = players
+    _write_match(tmp_path, f'{TOURNAMENT_ID}_m00001', a, b, [a, a, b, None])
+    _write_match(tmp_path, f'{TOURNAMENT_ID}_m00002', a, c, [c, c, c, a])
+    aggregator = TournamentAggregator(TOURNAMENT_ID, tmp_path)
+    aggregator.ingest_matches([f'{TOURNAMENT_ID}_m00001', f'{TOURNAMENT_ID}_m00002'])
+    aggregator.remove_match(f'{TOURNAMENT_ID}_m00002')
+    stats = aggregator.get_tournament_stats()
+    assert stats.match_ids == [f'{TOURNAMENT_ID}_m00001']
+    assert dict(stats.table) == {a: 2.5, b: 1.5, c: 0.}
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from c4league.bitboard import from_board, from_boards, to_board, is_win, apply_move, legal_moves, replay_moves, \
+    generate_starting_boards, batch_is_win
+from c4utils.c4_types import Move, Player, PLAYER1, PLAYER2, NO_PLAYER
+
+def _has_four(board, player):
+    cells = board == player
+    n_rows, n_cols = cells.shape
+    for row in range(n_rows):
+        for col in range(n_cols):
+            for d_row, d_col in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                if all(0 <= row + k * d_row < n_rows and 0 <= col + k * d_col < n_cols
+                       and cells[row + k * d_row, col + k * d_col] for k in range(4)):
+                    return True
+    return False
+
+def _random_board(rng, n_moves):
+    board = np.zeros((6, 7), dtype=Player)
+    for k in range(n_moves):
+        col = rng.choice(np.flatnonzero(board[-1, :] == NO_PLAYER))
+        board[np.flatnonzero(board[:, col] == NO_PLAYER)[0], col] = PLAYER1 if k % 2 == 0 else PLAYER2
+    return board
+
+def test_win_check_matches_brute_force():
+    rng = np.random.default_rng(0)
+    boards = [_random_board(rng, rng.integers(0, 43)) for _ in range(300)]
+    player1_bits = np.array([from_board(board)[0] for board in boards], dtype=np.uint64)
+    assert [is_win(int(bits)) for bits in player1_bits] == [_has_four(board, PLAYER1) for board in boards]
+    assert batch_is_win(player1_bits).tolist() == [_has_four(board, PLAYER1) for board in boards]
+    for board in boards:
+        assert np.array_equal(to_board(*from_board(board)), board)
+    player1_bits, player2_bits = from_boards(np.array(boards))
+    assert [(int(bits1), int(bits2)) for bits1, bits2 in zip(player1_bits, player2_bits)] == \
+        [from_board(board) for board in boards]
+
+def test_moves_fill_columns_bottom_up():
+    player_bits, occupied = 0, 0
+    for _ in range(6):
+        assert Move(3) in legal_moves(occupied)
+        player_bits, occupied = apply_move(player_bits, occupied, 3)
+    assert Move(3) not in legal_moves(occupied)
+    assert is_win(player_bits)
+    with pytest.raises(ValueError, match='Invalid move: 3'):
+        apply_move(player_bits, occupied, 3)
+
+def test_replay_moves():
+    board = np.zeros((6, 7), dtype=Player)
+    board[0, 0] = PLAYER1
+    # PLAYER1 completes the bottom row first
+    assert replay_moves(board, [Move(6), Move(1), Move(6), Move(2), Move(6), Move(3), Move(5)],
+                        first_player=PLAYER2) == (PLAYER1, 6)
+    assert replay_moves(board, [Move(1), Move(6), Move(2), Move(6), Move(3)]) == (PLAYER1, 5)
+    assert replay_moves(board, [Move(6)]) == (None, 1)
+
+def test_starting_boards_are_distinct_and_not_terminal():
+    boards = generate_starting_boards(200, truncate_prob=0.2, truncate_max=10, rng=np.random.default_rng(0))
+    assert boards.shape == (200, 6, 7)
+    assert len(set(board.tobytes() for board in boards)) == 200
+    for board in boards:
+        n_player1, n_player2 = np.sum(board == PLAYER1), np.sum(board == PLAYER2)
+        assert 1 <= n_player1 + n_player2 <= 11
+        assert n_player1 - n_player2 in (0, 1)
+        assert not _has_four(board, PLAYER1) and not _has_four(board, PLAYER2)
+        # No floating stones
+        occupied = board != NO_PLAYER
+        assert np.all(occupied[1:] <= occupied[:-1])
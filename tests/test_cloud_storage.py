@@ -0,0 +1,71 @@
+import pytest
+from unittest.mock import MagicMock, call
+from c4league.storage import cloud_storage
+from c4league.storage.cloud_storage import GCSBackend, LocalBackend, download_blob, download_blobs
+
+
+class FlakyBackend(LocalBackend):
+    """Breaks off every read after `chunk` bytes"""
+
+    def __init__(self, root, chunk):
+        super().__init__(root)
+        self.chunk = chunk
+        self.starts = []
+
+    def read_into(self, name, file_obj, start=0):
+        self.starts.append(start)
+        with open(self.root / name, 'rb') as f:
+            f.seek(start)
+            file_obj.write(f.read(self.chunk))
+        if start + self.chunk < self.get_blob(name).size:
+            raise ConnectionError('connection reset')
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    for team, agent, version in [('team1', 'agent1', '1'), ('team1', 'agent2', '3'), ('team2', 'agent1', '2')]:
+        path = tmp_path / 'bucket' / 'submissions' / team / agent / f'{agent}_v{version}.zip'
+        path.parent.mkdir(parents=True)
+        path.write_bytes(f'{team}{agent}{version}'.encode() * 100)
+    return tmp_path / 'bucket'
+
+def test_submitted_agents_from_local_backend(bucket, monkeypatch):
+    monkeypatch.setattr(cloud_storage, 'get_storage_backend', lambda: LocalBackend(bucket))
+    assert cloud_storage.get_submitted_agents() == [
+        {'team_name': 'team1', 'agent_name': 'agent1', 'version': '1'},
+        {'team_name': 'team1', 'agent_name': 'agent2', 'version': '3'},
+        {'team_name': 'team2', 'agent_name': 'agent1', 'version': '2'},
+    ]
+
+def test_concurrent_downloads_report_errors_per_file(bucket, tmp_path):
+    backend = LocalBackend(bucket)
+    names = [blob.name for blob in backend.list_blobs('submissions')] + ['submissions/team3/agent/agent_v1.zip']
+    downloads = {name: tmp_path / 'out' / name for name in names}
+    errors = download_blobs(downloads, backend=backend, workers=4, retries=0)
+    assert [error is None for error in errors.values()] == [True, True, True, False]
+    for name in names[:3]:
+        assert downloads[name].read_bytes() == (bucket / name).read_bytes()
+
+def test_download_resumes_after_failures(bucket, tmp_path, monkeypatch):
+    monkeypatch.setattr(cloud_storage, 'RETRY_BACKOFF', 0.)
+    name = 'submissions/team1/agent1/agent1_v1.zip'
+    backend = FlakyBackend(bucket, chunk=500)
+    download_blob(backend, name, tmp_path / 'agent.zip', retries=3)
+    assert backend.starts == [0, 500, 1000]
+    assert (tmp_path / 'agent.zip').read_bytes() == (bucket / name).read_bytes()
+    assert not (tmp_path / 'agent.zip.partial').exists()
+
+    with pytest.raises(ConnectionError):
+        download_blob(FlakyBackend(bucket, chunk=100), name, tmp_path / 'other.zip', retries=2)
+    assert not (tmp_path / 'other.zip').exists()
+
+def test_gcs_backend_checksums_only_full_downloads():
+    backend = GCSBackend.__new__(GCSBackend)
+    backend.bucket = MagicMock()
+    blob = backend.bucket.blob.return_value
+    file_obj = object()
+    backend.read_into('submissions/team1/agent1/agent1_v1.zip', file_obj)
+    backend.read_into('submissions/team1/agent1/agent1_v1.zip', file_obj, start=500)
+    # google-resumable-media 2.x (with google-cloud-storage 2.10) only accepts 'md5', 'crc32c' or None
+    assert blob.download_to_file.call_args_list == [call(file_obj, start=None, checksum='md5'),
+                                                    call(file_obj, start=500, checksum=None)]
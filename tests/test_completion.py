@@ -0,0 +1,41 @@
+import pytest
+from c4league.completion import CompletionTracker, done_marker_shell
+from c4league.slurm import submit_job
+from tests.fake_slurm import FakeSlurm
+
+
+def _write_job_script(tmp_path, n_tasks, body):
+    done_dir = tmp_path / 'done'
+    script = tmp_path / 'job.sh'
+    script.write_text(f"""#!/bin/bash
+#SBATCH --array=1-{n_tasks}
+#SBATCH --output={tmp_path}/%a.out
+{body}
+status=$?
+{done_marker_shell(done_dir)}
+exit $status
+""")
+    return script, done_dir
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_tracker_collects_markers_of_all_tasks(tmp_path, use_inotify):
+    script, done_dir = _write_job_script(tmp_path, 5, 'sleep 0.1; [ "$SLURM_ARRAY_TASK_ID" != 3 ]')
+    with FakeSlurm():
+        tracker = CompletionTracker(done_dir, list(range(1, 6)), job_id='', poll_interval=0.05,
+                                    use_inotify=use_inotify)
+        tracker.job_id = submit_job(str(script))
+        batches = []
+        results = tracker.wait(on_tasks_done=batches.append)
+    assert results == {1: 0, 2: 0, 3: 1, 4: 0, 5: 0}
+    assert sorted(task for batch in batches for task in batch) == [1, 2, 3, 4, 5]
+
+def test_tracker_falls_back_to_scheduler_for_tasks_without_marker(tmp_path):
+    # Task 2 is killed before it can write its marker
+    script, done_dir = _write_job_script(tmp_path, 3, 'if [ "$SLURM_ARRAY_TASK_ID" == 2 ]; then kill -9 $$; fi')
+    with FakeSlurm():
+        tracker = CompletionTracker(done_dir, [1, 2, 3], job_id='', poll_interval=0.05,
+                                    scheduler_check_interval=0.2)
+        tracker.job_id = submit_job(str(script))
+        results = tracker.wait()
+    assert results[1] == 0 and results[3] == 0
+    assert results[2] == 'FAILED'
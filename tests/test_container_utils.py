@@ -0,0 +1,120 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+from c4league import container_utils
+from c4league.container_utils import get_dependency_hash, get_base_image_path, evict_build_cache, containerize_agents
+from c4league.executors import SlurmExecutor
+from c4league.utils import TournamentPlayer
+from tests import fake_slurm
+from tests.fake_slurm import FakeSlurm
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# apptainer build <image> <def file>: agent layers fail for agents whose code says so
+FAKE_APPTAINER = '''#!/bin/bash
+if [ "$3" = build_agent_layer.def ] && grep -rq "build fails" agent; then
+    echo "FATAL: While performing build: agent code does not build" >&2
+    exit 255
+fi
+cp "$3" "$2"
+'''
+
+def _make_dependency_set(root, requirements):
+    root.mkdir()
+    (root / 'requirements.txt').write_text(requirements)
+    (root / 'c4utils').mkdir()
+    (root / 'c4utils' / 'match.py').write_text('def play_match(): pass\n')
+    (root / 'build_agent_base.def').write_text('Bootstrap: docker\n')
+    return get_dependency_hash(str(root / 'requirements.txt'), str(root / 'c4utils'), str(root / 'build_agent_base.def'))
+
+def test_dependency_hash_ignores_order_comments_and_whitespace(tmp_path):
+    hash1 = _make_dependency_set(tmp_path / 'a', 'numpy==1.26\ntorch  # model\n')
+    hash2 = _make_dependency_set(tmp_path / 'b', '\ntorch\nnumpy==1.26\n')
+    assert hash1 == hash2
+
+def test_dependency_hash_changes_with_requirements(tmp_path):
+    hash1 = _make_dependency_set(tmp_path / 'a', 'numpy==1.26\n')
+    hash2 = _make_dependency_set(tmp_path / 'b', 'numpy==2.0\n')
+    assert hash1 != hash2
+
+def test_eviction_removes_least_recently_used_first(tmp_path, monkeypatch):
+    monkeypatch.setenv('AGENT_BUILD_CACHE_DIRECTORY', str(tmp_path))
+    paths = [get_base_image_path(f'hash{i}') for i in range(3)]
+    for i, path in enumerate(paths):
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+
+    evicted = evict_build_cache(max_bytes=150)
+    assert evicted == paths[:2]
+    assert os.path.exists(paths[2])
+
+def test_eviction_keeps_images_in_use(tmp_path, monkeypatch):
+    monkeypatch.setenv('AGENT_BUILD_CACHE_DIRECTORY', str(tmp_path))
+    paths = [get_base_image_path(f'hash{i}') for i in range(2)]
+    for i, path in enumerate(paths):
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+
+    evicted = evict_build_cache(max_bytes=100, keep={paths[0]})
+    assert evicted == [paths[1]]
+
+def _setup_build(tmp_path, monkeypatch, agent_code):
+    """League directories and a fake download of one zipped agent per entry of `agent_code`"""
+    root = tmp_path / 'league'
+    root.mkdir()
+    for def_file in ['build_agent.def', 'build_agent_base.def', 'build_agent_layer.def']:
+        shutil.copy(REPO_ROOT / def_file, root)
+    (tmp_path / 'c4utils').mkdir()
+    (tmp_path / 'c4utils' / 'match.py').write_text('def play_match(): pass\n')
+    (tmp_path / 'containers').mkdir()
+    monkeypatch.setenv('C4LEAGUE_ROOT_DIR', str(root))
+    monkeypatch.setenv('C4UTILS_DIR', str(tmp_path / 'c4utils'))
+    monkeypatch.setenv('AGENT_CONTAINER_DIRECTORY', str(tmp_path / 'containers'))
+    monkeypatch.delenv('AGENT_BUILD_CACHE_DIRECTORY', raising=False)
+    monkeypatch.chdir(tmp_path)
+
+    archives = {}
+    for agent, code in agent_code.items():
+        source = tmp_path / 'sources' / str(agent)
+        (source / 'agent').mkdir(parents=True)
+        (source / 'agent' / 'agent.py').write_text(code)
+        (source / 'requirements.txt').write_text('numpy\n')
+        archives[agent.team_name] = shutil.make_archive(str(source), 'zip', source)
+
+    def download_agents(agents, destination_dirs):
+        for agent, destination_dir in zip(agents, destination_dirs):
+            shutil.copy(archives[agent['team_name']], destination_dir)
+        return [None] * len(agents)
+    monkeypatch.setattr(container_utils, 'download_agents', download_agents)
+
+def test_containerize_agents_reports_failures_per_agent(tmp_path, monkeypatch, capsys):
+    good = TournamentPlayer('team1', 'agent', '1')
+    broken = TournamentPlayer('team2', 'agent', '1')
+    _setup_build(tmp_path, monkeypatch, {good: 'def generate_move(): pass\n', broken: '# build fails\n'})
+    with FakeSlurm(queue_delay=0.2) as slurm:
+        slurm.add_command('apptainer', FAKE_APPTAINER)
+        # Log the job ids of every sacct call before answering it
+        slurm.add_command('sacct', f'#!/bin/sh\necho "$2" >> "{tmp_path}/sacct.log"\n'
+                                   f'exec "{sys.executable}" "{fake_slurm.__file__}" sacct "$@"\n')
+        results = containerize_agents([good, broken], poll_interval=0.05, executor=SlurmExecutor())
+
+    assert results == {good: True, broken: False}
+    assert os.listdir(tmp_path / 'containers' / '.build_cache') != []
+    assert sorted(os.listdir(tmp_path / 'containers')) == ['.build_cache', 'team1_agent_1.sif']
+    # Both agents share one base image build, then both layer builds are polled with a single sacct call
+    polls = (tmp_path / 'sacct.log').read_text().split()
+    base_job = polls[0]
+    n_base_polls = polls.index(next(poll for poll in polls if poll != base_job))
+    layer_jobs = polls[n_base_polls].split(',')
+    assert set(polls[:n_base_polls]) == {base_job} and len(layer_jobs) == 2
+    assert all(set(poll.split(',')) <= set(layer_jobs) for poll in polls[n_base_polls:])
+
+    output = capsys.readouterr().out
+    assert 'Build job for team2 agent failed with status: FAILED' in output
+    assert 'agent code does not build' in output
+    assert 'Built 1 of 2 agent containers.' in output
+    # Temp directories are cleaned up
+    assert [path.name for path in (tmp_path / 'league').iterdir() if path.is_dir()] == []
@@ -0,0 +1,59 @@
+import time
+from c4league.completion import CompletionTracker, done_marker_shell
+from c4league.executors import LocalExecutor
+
+
+def _write_job_script(tmp_path, body):
+    done_dir = tmp_path / 'done'
+    done_dir.mkdir()
+    script = tmp_path / 'job.sh'
+    script.write_text(f"""#!/bin/bash
+#SBATCH --output={tmp_path}/logs_%A_%a.out
+#SBATCH --error={tmp_path}/logs_%A_%a.err
+{body}
+status=$?
+{done_marker_shell(done_dir)}
+exit $status
+""")
+    return script, done_dir
+
+def test_local_array_job_sets_task_ids_and_logs(tmp_path):
+    script, _ = _write_job_script(tmp_path, 'echo "task $SLURM_ARRAY_TASK_ID of $SLURM_ARRAY_TASK_MAX"; '
+                                            'echo oops >&2; [ "$SLURM_ARRAY_TASK_ID" != 4 ]')
+    executor = LocalExecutor(max_workers=2)
+    job_id = executor.submit(str(script), [3, 4, 5])
+    executor.shutdown()
+    assert executor.get_job_states([job_id]) == {f'{job_id}_3': 'COMPLETED', f'{job_id}_4': 'FAILED',
+                                                 f'{job_id}_5': 'COMPLETED'}
+    assert (tmp_path / f'logs_{job_id}_3.out').read_text() == 'task 3 of 5\n'
+    assert (tmp_path / f'logs_{job_id}_3.err').read_text() == 'oops\n'
+
+def test_local_executor_limits_concurrency(tmp_path):
+    script, _ = _write_job_script(tmp_path, 'sleep 0.3')
+    executor = LocalExecutor(max_workers=2)
+    job_id = executor.submit(str(script), [1, 2, 3, 4])
+    time.sleep(0.15)
+    states = executor.get_job_states([job_id])
+    executor.shutdown()
+    assert sorted(states.values()) == ['PENDING', 'PENDING', 'RUNNING', 'RUNNING']
+
+def test_tracker_with_local_executor(tmp_path):
+    # Task 2 is killed before it can write its marker
+    script, done_dir = _write_job_script(tmp_path, 'if [ "$SLURM_ARRAY_TASK_ID" == 2 ]; then kill -9 $$; fi')
+    executor = LocalExecutor(max_workers=4)
+    tracker = CompletionTracker(done_dir, [1, 2, 3], job_id=executor.submit(str(script), [1, 2, 3]),
+                                poll_interval=0.05, scheduler_check_interval=0.05, executor=executor)
+    results = tracker.wait()
+    executor.shutdown()
+    assert results == {1: 0, 2: 'FAILED', 3: 0}
+
+def test_local_executor_cancels_pending_tasks(tmp_path):
+    script, _ = _write_job_script(tmp_path, 'sleep 0.3')
+    executor = LocalExecutor(max_workers=1)
+    job_id = executor.submit(str(script), [1, 2, 3])
+    time.sleep(0.1)
+    executor.cancel(job_id, [1, 3])
+    executor.shutdown()
+    assert executor.get_job_states([job_id]) == {f'{job_id}_1': 'COMPLETED', f'{job_id}_2': 'COMPLETED',
+                                                 f'{job_id}_3': 'CANCELLED'}
+    assert not (tmp_path / f'logs_{job_id}_3.out').exists()
@@ -0,0 +1,115 @@
+import json
+import sqlite3
+import numpy as np
+import pytest
+from c4league.utils import TournamentPlayer
+from c4league.storage.stats import GameStats, generate_match_stats_from_game_stats, \
+    generate_tournament_stats_from_match_stats
+from c4league.storage.index import ResultsIndex
+from c4league.storage.match_cache import reuse_match_stats
+from c4league.quarantine import forfeit_match_stats
+from c4utils.c4_types import Move, Player
+
+@pytest.fixture
+def players():
+    return [TournamentPlayer('team1', 'agent1', '1'), TournamentPlayer('team2', 'agent2', '1'),
+            TournamentPlayer('team3', 'agent3', '2')]
+
+def _make_match(tournament_id, match_id, timestamp, player_a, player_b, results):
+    games = []
+    for i, (winner, reason) in enumerate(results):
+        player1, player2 = (player_a, player_b) if i % 2 == 0 else (player_b, player_a)
+        games.append(GameStats(
+            game_id=f'{match_id}_g{i:05d}',
+            match_id=match_id,
+            tournament_id=tournament_id,
+            timestamp=timestamp,
+            player1=player1,
+            player2=player2,
+            initial_board=np.zeros((6, 7), dtype=Player),
+            moves=[Move(0), Move(1)],
+            winner=winner,
+            reason=reason,
+            traceback=None
+        ))
+    return generate_match_stats_from_game_stats(games), games
+
+def _add_tournament(results_index, tournament_id, timestamp, matches):
+    match_stats, games = [], []
+    for i, (player_a, player_b, results) in enumerate(matches):
+        _match_stats, _games = _make_match(tournament_id, f'{tournament_id}_m{i:05d}', timestamp,
+                                           player_a, player_b, results)
+        match_stats.append(_match_stats)
+        games += _games
+    results_index.add_tournament(generate_tournament_stats_from_match_stats(match_stats), match_stats, games)
+    return match_stats, games
+
+@pytest.fixture
+def results_index(tmp_path, players):
+    a, b, c = players
+    results_index = ResultsIndex(tmp_path / 'index.sqlite')
+    _add_tournament(results_index, 'taaaaa', '2024-01-01-00:00:00', [
+        (a, b, [(a, 'Connect 4'), (a, 'MoveTimeoutError'), (b, 'Connect 4'), (None, 'Draw')]),
+        (a, c, [(c, 'Invalid move'), (c, 'Connect 4'), (c, 'Connect 4'), (c, 'Connect 4')]),
+    ])
+    _add_tournament(results_index, 'tbbbbb', '2024-01-02-00:00:00', [
+        (a, b, [(b, 'AgentRuntimeError'), (b, 'Connect 4'), (b, 'Connect 4'), (b, 'Connect 4')]),
+    ])
+    yield results_index
+    results_index.close()
+
+def test_agent_and_team_history(results_index, players):
+    a, b, c = players
+    history = results_index.agent_history(a)
+    assert [(row['tournament_id'], row['score'], row['rank']) for row in history] == \
+        [('taaaaa', 2.5, 2), ('tbbbbb', 0.0, 2)]
+    assert [row['tournament_id'] for row in results_index.agent_history(a, since='2024-01-02')] == ['tbbbbb']
+    assert [row['player'] for row in results_index.team_history('team3')] == [str(c)]
+
+def test_head_to_head(results_index, players):
+    a, b, _ = players
+    record = results_index.head_to_head(a, b)
+    assert record['matches'] == 2
+    assert (record['match_wins'], record['match_losses'], record['match_draws']) == (1, 1, 0)
+    assert (record['score'], record['opponent_score']) == (2.5, 5.5)
+    assert (record['games'], record['game_wins'], record['game_losses'], record['game_draws']) == (8, 2, 5, 1)
+
+def test_failure_reasons(results_index, players):
+    a, b, c = players
+    assert results_index.failure_reasons() == {'MoveTimeoutError': 1, 'Invalid move': 1, 'AgentRuntimeError': 1}
+    assert results_index.failure_reasons(b) == {'MoveTimeoutError': 1}
+    assert results_index.failure_reasons(c) == {}
+
+def test_reindexing_replaces_tournament(results_index, players):
+    a, b, _ = players
+    _add_tournament(results_index, 'tbbbbb', '2024-01-02-00:00:00', [
+        (a, b, [(a, 'Connect 4'), (a, 'Connect 4'), (a, 'Connect 4'), (a, 'Connect 4')]),
+    ])
+    assert [row['score'] for row in results_index.agent_history(a)] == [2.5, 4.0]
+    assert results_index.failure_reasons(a) == {'Invalid move': 1}
+
+def test_reused_and_forfeited_matches_count_once(results_index, players):
+    a, b, c = players
+    before = results_index.head_to_head(a, b)
+    played, _ = _make_match('tbbbbb', 'tbbbbb_m00000', '2024-01-02-00:00:00', a, b,
+                            [(b, 'AgentRuntimeError'), (b, 'Connect 4'), (b, 'Connect 4'), (b, 'Connect 4')])
+    # An incremental tournament reuses the a-b match and forfeits a-c
+    match_stats = [reuse_match_stats(played, 'tccccc_m00000', 'tccccc', '2024-01-03-00:00:00'),
+                   forfeit_match_stats('tccccc_m00001', 'tccccc', (a, c), [c], '2024-01-03-00:00:00')]
+    results_index.add_tournament(generate_tournament_stats_from_match_stats(match_stats), match_stats, [])
+
+    record = results_index.head_to_head(a, b)
+    assert {key: value for key, value in record.items() if key != 'forfeits'} == \
+        {key: value for key, value in before.items() if key != 'forfeits'}
+    assert record['matches'] == 2 and record['games'] == 8 and record['forfeits'] == 0
+    assert results_index.head_to_head(a, c)['matches'] == 1 and results_index.head_to_head(a, c)['forfeits'] == 1
+    assert [row['played_matches'] for row in results_index.agent_history(a)] == [2, 1, 0]
+
+def test_old_index_gets_new_columns(tmp_path):
+    connection = sqlite3.connect(tmp_path / 'index.sqlite')
+    connection.execute('CREATE TABLE match_results (match_id TEXT, tournament_id TEXT, timestamp TEXT, player TEXT, '
+                       'team_name TEXT, opponent TEXT, score REAL, opponent_score REAL)')
+    connection.close()
+    with ResultsIndex(tmp_path / 'index.sqlite') as results_index:
+        columns = [row[1] for row in results_index.connection.execute('PRAGMA table_info(match_results)')]
+    assert columns[-2:] == ['reused_from', 'forfeited_by']
@@ -0,0 +1,33 @@
+from c4league.utils import TournamentPlayer
+from c4league.storage.stats import MatchStats, match_stats_from_json
+from c4league.storage.match_cache import MatchCache, reuse_match_stats
+
+def _match_stats(match_id, tournament_id):
+    a, b = TournamentPlayer('team1', 'agent1', '1'), TournamentPlayer('team2', 'agent2', '1')
+    return MatchStats(match_id=match_id, game_ids=[f'{match_id}_g{i}' for i in range(4)], tournament_id=tournament_id,
+                      timestamp='2024-01-01-12:00:00', players=[a, b], result={a: 3.0, b: 1.0})
+
+def test_cache_is_keyed_by_unordered_pair_and_persisted(tmp_path):
+    cache = MatchCache(tmp_path / 'match_cache.json')
+    cache.put('a.sif:1:1', 'b.sif:1:1', _match_stats('taaaaa_m00001', 'taaaaa'))
+    cache.save()
+
+    cache = MatchCache(tmp_path / 'match_cache.json')
+    assert cache.get('b.sif:1:1', 'a.sif:1:1') == _match_stats('taaaaa_m00001', 'taaaaa')
+    # A rebuilt agent has a new identity
+    assert cache.get('a.sif:1:2', 'b.sif:1:1') is None
+
+def test_prune_drops_entries_of_replaced_agents(tmp_path):
+    cache = MatchCache(tmp_path / 'match_cache.json')
+    cache.put('a.sif:1:1', 'b.sif:1:1', _match_stats('taaaaa_m00001', 'taaaaa'))
+    cache.put('a.sif:1:1', 'c.sif:1:1', _match_stats('taaaaa_m00002', 'taaaaa'))
+    assert cache.prune({'a.sif:1:1', 'b.sif:1:1', 'c.sif:2:2'}) == 1
+    assert list(cache.entries) == ['a.sif:1:1|b.sif:1:1']
+
+def test_reused_match_stats_point_to_original_match():
+    reused = reuse_match_stats(_match_stats('taaaaa_m00001', 'taaaaa'), 'tbbbbb_m00007', 'tbbbbb',
+                               '2024-01-02-12:00:00')
+    assert (reused.match_id, reused.tournament_id, reused.reused_from) == ('tbbbbb_m00007', 'tbbbbb', 'taaaaa_m00001')
+    assert reused.game_ids == _match_stats('taaaaa_m00001', 'taaaaa').game_ids
+    assert match_stats_from_json(reused.generate_json()) == reused
+    assert 'reused_from' not in _match_stats('taaaaa_m00001', 'taaaaa').generate_json()
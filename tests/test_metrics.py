@@ -0,0 +1,77 @@
+import sys
+import numpy as np
+import pytest
+from c4league.utils import TournamentPlayer
+from c4league.agent_session import AgentSession, AGENT_SERVER_SOURCE, play_game
+from c4league.storage.stats import GameMetrics, GameStats, game_stats_from_json
+from c4league.storage.records import game_stats_to_records, decode_game_records, write_tournament_archive, \
+    read_tournament_archive
+from c4league.storage.metrics import get_metrics_report
+from c4utils.c4_types import Move, Player, PLAYER1
+
+A, B = TournamentPlayer('team1', 'agent1', '1'), TournamentPlayer('team2', 'agent2', '1')
+
+
+class LocalSession(AgentSession):
+    """Runs the agent server with the current interpreter instead of in a container"""
+
+    def _command(self):
+        return [sys.executable, '-u', '-c', AGENT_SERVER_SOURCE]
+
+
+def _game(i, metrics):
+    return GameStats(game_id=f't_m{i // 2}_g{i}', match_id=f't_m{i // 2}', tournament_id='t',
+                     timestamp='2024-01-01-12:00:00', player1=A if i % 2 == 0 else B, player2=B if i % 2 == 0 else A,
+                     initial_board=np.zeros((6, 7), dtype=Player), moves=[Move(3), Move(4), Move(3)], winner=None,
+                     reason='Draw', traceback=None, metrics=metrics)
+
+def test_metrics_round_trip():
+    games = [_game(0, GameMetrics([12, 250, 7], [900, None], [51200, 80000], [310, None])), _game(1, None)]
+    expected = [game.generate_json() for game in games]
+    assert 'metrics' not in expected[1]
+    assert [game.generate_json() for game in decode_game_records(game_stats_to_records(games))] == expected
+    assert game_stats_from_json(games[0].generate_json()).metrics == games[0].metrics
+
+def test_metrics_in_tournament_archive(tmp_path):
+    games = [_game(0, GameMetrics([12, 250, 7], [900, None], [51200, 80000], [310, None])), _game(1, None)]
+    write_tournament_archive(tmp_path / 'archive.npz', games)
+    assert [game.generate_json() for game in read_tournament_archive(tmp_path / 'archive.npz')] == \
+        [game.generate_json() for game in games]
+
+def test_report_splits_moves_by_agent():
+    games = [_game(0, GameMetrics([10, 100, 20], [1000, 2000], [100, 300], [30, 90])),
+             _game(1, GameMetrics([200, 30, 400], [None, None], [200, 100], [270, 10])),
+             _game(2, None)]
+    report = get_metrics_report(games)
+    assert report['games'] == 2
+    rows = {row['agent']: row for row in report['agents']}
+    # A moved first in game 0 and second in game 1
+    assert rows[str(A)]['moves'] == 3 and rows[str(A)]['max_move_ms'] == 30
+    assert rows[str(B)]['p50_move_ms'] == 200
+    assert rows[str(B)]['think_share'] == pytest.approx(700 / 760)
+    assert rows[str(A)]['cpu_share'] == pytest.approx(40 / 400)
+    assert rows[str(A)]['peak_rss_kb'] == 100 and rows[str(A)]['mean_startup_ms'] == 1000
+    assert report['slowest_matches'] == [{'match_id': 't_m0', 'agent_ms': 3130 + 630}]
+
+def test_play_game_records_metrics(tmp_path, monkeypatch):
+    agent_dir = tmp_path / 'agent'
+    agent_dir.mkdir()
+    (agent_dir / '__init__.py').write_text('def generate_move(board, player, saved_state):\n'
+                                           '    return (0 if player == 1 else 1), saved_state\n')
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    sessions = [LocalSession(tmp_path / 'a.sif'), LocalSession(tmp_path / 'b.sif')]
+    try:
+        for game in range(2):
+            metrics = []
+            winner, moves, error = play_game(sessions[0], sessions[1], move_timeout=5.,
+                                             initial_board=np.zeros((6, 7), dtype=Player), metrics=metrics)
+            assert error is None and winner == PLAYER1
+            [game_metrics] = metrics
+            assert len(game_metrics.move_ms) == len(moves) == 7
+            # Started in the first game, kept running for the second
+            assert all((ms is not None) == (game == 0) for ms in game_metrics.startup_ms)
+            assert all(rss is not None and rss > 0 for rss in game_metrics.peak_rss_kb)
+            assert all(ms is not None and ms >= 0 for ms in game_metrics.cpu_ms)
+    finally:
+        for session in sessions:
+            session.stop()
@@ -0,0 +1,61 @@
+import os
+import threading
+import pytest
+from c4league.completion import CompletionTracker, done_marker_shell, write_done_marker
+from c4league.executors import Executor
+from c4league.node_worker import NodeWorker, claim_task, get_slots
+
+
+def _write_job_script(tmp_path):
+    done_dir = tmp_path / 'done'
+    done_dir.mkdir()
+    script = tmp_path / 'job.sh'
+    script.write_text(f"""#!/bin/bash
+#SBATCH --output={tmp_path}/task_%a.out
+python3 -c "import os; print(sorted(os.sched_getaffinity(0)))"
+status=$?
+{done_marker_shell(done_dir)}
+exit $status
+""")
+    return script, done_dir
+
+def test_workers_share_the_queue(tmp_path):
+    script, done_dir = _write_job_script(tmp_path)
+    cpus = sorted(os.sched_getaffinity(0))
+    slots = [[cpu] for cpu in cpus[:2]]
+    workers = [NodeWorker(script, tmp_path / 'claims', list(range(1, 9)), slots) for _ in range(2)]
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Every task ran exactly once, pinned to the cores of its slot
+    assert sorted(list(workers[0].completed) + list(workers[1].completed)) == list(range(1, 9))
+    assert sorted(int(marker.name) for marker in done_dir.iterdir()) == list(range(1, 9))
+    for task_id in range(1, 9):
+        assert (tmp_path / f'task_{task_id}.out').read_text().strip() in [str(slot) for slot in slots]
+    assert not claim_task(tmp_path / 'claims', 3)
+
+def test_slots_limited_by_cores_and_memory(monkeypatch):
+    n_cpus = len(os.sched_getaffinity(0))
+    assert len(get_slots(1)) == n_cpus
+    assert get_slots(n_cpus + 1) == [sorted(os.sched_getaffinity(0))]
+    monkeypatch.setenv('SLURM_MEM_PER_NODE', '2048')
+    assert len(get_slots(1, mem_per_match_mb=1024)) == min(n_cpus, 2)
+
+def test_tracker_waits_for_workers(tmp_path):
+    class WorkerStates(Executor):
+        states = {'7_1': 'RUNNING', '7_2': 'COMPLETED'}
+
+        def get_job_states(self, job_ids):
+            return self.states
+
+    executor = WorkerStates()
+    tracker = CompletionTracker(tmp_path, [1, 2, 3], job_id='7', executor=executor, worker_job=True)
+    write_done_marker(tmp_path, 1, 0)
+    tracker.scan()
+    assert tracker.check_scheduler() == []
+    executor.states = {'7_1': 'COMPLETED', '7_2': 'COMPLETED'}
+    assert sorted(tracker.check_scheduler()) == [2, 3]
+    assert tracker.results == {1: 0, 2: 'WORKERS_ENDED', 3: 'WORKERS_ENDED'}
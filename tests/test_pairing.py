@@ -0,0 +1,40 @@
+import pytest
+from c4league.utils import TournamentPlayer
+from c4league.pairing import RoundRobinPairing, SwissPairing, get_pairing_strategy, played_pairs
+
+@pytest.fixture
+def players():
+    return [TournamentPlayer(f'team{i}', 'agent', '1') for i in range(7)]
+
+def test_round_robin_plays_all_pairs_in_one_round(players):
+    strategy = RoundRobinPairing()
+    pairings = strategy.next_round(1, players, {}, set())
+    assert len(played_pairs(pairings)) == len(players) * (len(players) - 1) // 2
+    assert strategy.next_round(2, players, {}, played_pairs(pairings)) == []
+
+def test_swiss_pairs_by_score_without_rematches(players):
+    strategy = SwissPairing(n_rounds=3, seed=0)
+    scores = {player: float(i) for i, player in enumerate(players)}
+    played = set()
+    byes = []
+    for round_number in range(1, 4):
+        pairings = strategy.next_round(round_number, players, scores, played)
+        assert len(pairings) == len(players) // 2
+        paired = [player for pairing in pairings for player in pairing]
+        assert len(set(map(str, paired))) == len(paired)
+        assert played_pairs(pairings).isdisjoint(played)
+        byes += [player for player in players if player not in paired]
+        played |= played_pairs(pairings)
+    # The lowest ranked agents sit out, each at most once
+    assert byes == [players[0], players[1], players[2]]
+    assert strategy.next_round(4, players, scores, played) == []
+
+def test_swiss_first_round_pairs_close_scores(players):
+    scores = {player: float(i) for i, player in enumerate(players[:6])}
+    pairings = SwissPairing(seed=0).next_round(1, players[:6], scores, set())
+    assert played_pairs(pairings) == played_pairs([(players[5], players[4]), (players[3], players[2]),
+                                                   (players[1], players[0])])
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        get_pairing_strategy('knockout')
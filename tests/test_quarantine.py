@@ -0,0 +1,43 @@
+import numpy as np
+from c4league.utils import TournamentPlayer
+from c4league.quarantine import CircuitBreaker, forfeit_match_stats
+from c4league.storage.stats import GameStats, match_stats_from_json
+from c4league.storage.ratings import RatingState
+from c4utils.c4_types import Move, Player
+
+HANGING = TournamentPlayer('team1', 'hanging', '1')
+FLAKY = TournamentPlayer('team2', 'flaky', '1')
+SOLID = TournamentPlayer('team3', 'solid', '2')
+
+
+def _game(game_id, player1, player2, winner, reason):
+    return GameStats(game_id=game_id, match_id=game_id.rpartition('_')[0], tournament_id='t',
+                     timestamp='2024-01-01-12:00:00', player1=player1, player2=player2,
+                     initial_board=np.zeros((6, 7), dtype=Player), moves=[Move(3)], winner=winner, reason=reason,
+                     traceback=None)
+
+def test_circuit_breaker_quarantines_failing_agents():
+    breaker = CircuitBreaker(max_failures=4, min_failure_rate=0.75)
+    games = [_game(f't_m1_g{i}', HANGING, SOLID, SOLID, 'MoveTimeoutError') for i in range(3)]
+    games += [_game(f't_m2_g{i}', FLAKY, SOLID, SOLID, 'AgentRuntimeError' if i % 2 else 'Connect 4')
+              for i in range(8)]
+    assert breaker.record(games) == []
+    # Games seen again (e.g. partial games of a retried match) are not counted twice
+    assert breaker.record(games[:3]) == []
+
+    assert breaker.record([_game('t_m3_g0', SOLID, HANGING, SOLID, 'Invalid move')]) == [HANGING]
+    assert breaker.is_quarantined(HANGING) and not breaker.is_quarantined(FLAKY)
+    report = breaker.get_report()
+    assert report[str(HANGING)] == {'games': 4, 'failures': {'MoveTimeoutError': 3, 'Invalid move': 1},
+                                    'quarantined': True}
+    # Failed in half of its games only
+    assert report[str(FLAKY)]['quarantined'] is False
+
+def test_forfeits_count_in_standings_but_not_ratings():
+    match_stats = forfeit_match_stats('t_m4', 't', (SOLID, HANGING), [HANGING], '2024-01-01-12:00:00')
+    assert match_stats.result == {SOLID: 4., HANGING: 0.} and match_stats.forfeited_by == [HANGING]
+    assert match_stats_from_json(match_stats.generate_json()) == match_stats
+    both = forfeit_match_stats('t_m5', 't', (FLAKY, HANGING), [FLAKY, HANGING], '2024-01-01-12:00:00')
+    assert both.result == {FLAKY: 0., HANGING: 0.}
+
+    assert RatingState().add_match_stats([match_stats, both]) == 0
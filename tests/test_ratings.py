@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from c4league.utils import TournamentPlayer
+from c4league.storage.stats import MatchStats
+from c4league.storage.match_cache import reuse_match_stats
+from c4league.storage.ratings import RatingState, load_rating_state, ELO_BASE
+
+@pytest.fixture
+def players():
+    return [TournamentPlayer(f'team{i}', 'agent', '1') for i in range(3)]
+
+def _match(match_id, player_a, player_b, score_a):
+    return MatchStats(match_id=match_id, game_ids=[], tournament_id=match_id.split('_')[0],
+                      timestamp='2024-01-01-12:00:00', players=[player_a, player_b],
+                      result={player_a: score_a, player_b: 4. - score_a})
+
+def test_fit_orders_agents_and_centers_ratings(players):
+    a, b, c = players
+    state = RatingState()
+    state.add_match_stats([_match('t1_m1', a, b, 3.), _match('t1_m2', b, c, 3.), _match('t1_m3', a, c, 3.5)])
+    state.fit()
+    ratings = state.get_ratings()
+    assert [row['player'] for row in ratings] == [str(a), str(b), str(c)]
+    assert np.mean([row['rating'] for row in ratings]) == pytest.approx(ELO_BASE)
+    assert all(row['ci_low'] < row['rating'] < row['ci_high'] for row in ratings)
+
+def test_incremental_updates_match_batch_fit(players, tmp_path):
+    a, b, c = players
+    matches = [_match('t1_m1', a, b, 3.), _match('t1_m2', b, c, 2.5), _match('t2_m1', a, c, 1.)]
+    batch = RatingState()
+    batch.add_match_stats(matches)
+    batch.fit()
+
+    state = RatingState()
+    state.add_match_stats(matches[:2])
+    state.fit()
+    state.save(tmp_path / 'ratings.npz')
+    state = load_rating_state(tmp_path / 'ratings.npz')
+    state.add_match_stats(matches[2:])
+    state.fit()
+    assert [row['player'] for row in state.get_ratings()] == [row['player'] for row in batch.get_ratings()]
+    assert [row['rating'] for row in state.get_ratings()] == pytest.approx([row['rating'] for row in batch.get_ratings()])
+
+def test_matches_are_counted_once(players):
+    a, b, _ = players
+    original = _match('t1_m1', a, b, 3.)
+    state = RatingState()
+    assert state.add_match_stats([original]) == 1
+    assert state.add_match_stats([original, reuse_match_stats(original, 't2_m1', 't2', '2024-01-02-12:00:00')]) == 0
+    assert state.games.sum() == 8
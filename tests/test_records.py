@@ -0,0 +1,64 @@
+import json
+import numpy as np
+import pytest
+from c4league.utils import TournamentPlayer
+from c4league.storage.stats import GameStats, generate_match_stats_from_game_stats
+from c4league.storage.records import append_game_record, read_game_records, decode_game_records, \
+    write_tournament_archive, read_tournament_archive
+from c4league.storage.ingestion import load_match_stats
+from c4utils.c4_types import Move, Player
+
+TOURNAMENT_ID = 'tabcde'
+MATCH_ID = f'{TOURNAMENT_ID}_m00001'
+
+@pytest.fixture
+def games():
+    a, b = TournamentPlayer('team1', 'agent1', '1'), TournamentPlayer('team2', 'agent2', '3')
+    initial_board = np.zeros((6, 7), dtype=Player)
+    initial_board[0, 3] = 1
+    winners = [a, b, None, a]
+    return [GameStats(
+        game_id=f'{MATCH_ID}_g{i:05d}',
+        match_id=MATCH_ID,
+        tournament_id=TOURNAMENT_ID,
+        timestamp=f'2024-01-01-12:00:0{i}',
+        player1=a if i % 2 == 0 else b,
+        player2=b if i % 2 == 0 else a,
+        initial_board=initial_board,
+        moves=[Move(3), Move(4), Move(3)],
+        winner=winner,
+        reason='Connect 4' if winner is not None else 'Draw',
+        traceback='Traceback: ü' if i == 1 else None
+    ) for i, winner in enumerate(winners)]
+
+def test_record_file_round_trip(tmp_path, games):
+    record_file = tmp_path / f'{MATCH_ID}.c4r'
+    for game in games:
+        append_game_record(record_file, game)
+    assert [game.generate_json() for game in read_game_records(record_file)] == \
+        [game.generate_json() for game in games]
+    assert record_file.stat().st_size < sum(len(json.dumps(game.generate_json())) for game in games)
+
+def test_truncated_record_is_ignored_and_overwritten(tmp_path, games):
+    record_file = tmp_path / f'{MATCH_ID}.c4r'
+    for game in games[:3]:
+        append_game_record(record_file, game)
+    record_file.write_bytes(record_file.read_bytes()[:-5])
+    assert len(decode_game_records(record_file.read_bytes())) == 2
+
+    append_game_record(record_file, games[3])
+    assert [game.game_id for game in read_game_records(record_file)] == [games[0].game_id, games[1].game_id,
+                                                                         games[3].game_id]
+
+def test_binary_matches_are_ingested_like_json(tmp_path, games):
+    match_dir = tmp_path / MATCH_ID
+    match_dir.mkdir()
+    for game in games:
+        append_game_record(match_dir / f'{MATCH_ID}.c4r', game)
+    [match_stats] = load_match_stats(tmp_path, [MATCH_ID])
+    assert match_stats.generate_json() == generate_match_stats_from_game_stats(games).generate_json()
+
+def test_tournament_archive_round_trip(tmp_path, games):
+    write_tournament_archive(tmp_path / 'games.npz', games)
+    assert [game.generate_json() for game in read_tournament_archive(tmp_path / 'games.npz')] == \
+        [game.generate_json() for game in games]
@@ -0,0 +1,118 @@
+import json
+import subprocess
+import sys
+import numpy as np
+from pathlib import Path
+import run_match
+from c4league.sequential import MatchFormat
+from c4league.scheduling import DurationModel
+from c4league.utils import TournamentPlayer
+from c4league.storage.ingestion import load_match_games, get_game_result_files
+from c4league.storage.stats import generate_match_stats_from_game_stats
+from c4utils.c4_types import Move, PLAYER1
+
+AGENT_PATHS = [Path('/opt/team1_agent1_1.sif'), Path('/opt/team2_agent2_1.sif')]
+STARTING_BOARD = np.zeros((6, 7), dtype=int)
+STARTING_BOARD[0, 3] = PLAYER1
+
+
+def _play_match(calls):
+    def play_match(agent1_path, agent2_path, move_timeout, initial_board):
+        calls.append((agent1_path.name, int(initial_board.sum())))
+        return PLAYER1, [Move(0), Move(1), Move(0), Move(1), Move(0), Move(1), Move(0)], None
+    return play_match
+
+def test_resume_plays_only_missing_games(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(run_match, 'play_match', _play_match(calls))
+    results_dir = tmp_path / 't1_m1'
+    results_dir.mkdir()
+    run_match.run_match(AGENT_PATHS, STARTING_BOARD, results_dir)
+    assert len(calls) == 4
+
+    # An interrupted attempt: the game on the starting board with agent2 first is missing
+    missing = [game for game in load_match_games(results_dir)
+               if game.player1.team_name == 'team2' and game.initial_board.any()]
+    (results_dir / f'{missing[0].game_id}.json').unlink()
+    calls.clear()
+    run_match.run_match(AGENT_PATHS, STARTING_BOARD, results_dir)
+    assert calls == [('team2_agent2_1.sif', PLAYER1)]
+    assert generate_match_stats_from_game_stats(load_match_games(results_dir)).players is not None
+
+    calls.clear()
+    run_match.run_match(AGENT_PATHS, STARTING_BOARD, results_dir)
+    assert calls == []
+
+def test_resume_replays_unreadable_match(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(run_match, 'play_match', _play_match(calls))
+    results_dir = tmp_path / 't1_m1'
+    results_dir.mkdir()
+    run_match.run_match(AGENT_PATHS, STARTING_BOARD, results_dir)
+    game_file = get_game_result_files(results_dir)[0]
+    game_file.write_text(game_file.read_text()[:100])
+    calls.clear()
+    run_match.run_match(AGENT_PATHS, STARTING_BOARD, results_dir)
+    assert len(calls) == 4
+    assert len(get_game_result_files(results_dir)) == 4
+    assert not game_file.exists()
+
+def test_batch_skips_forfeited_matches(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(run_match, 'play_match', _play_match(calls))
+    (tmp_path / 't1_m2').mkdir()
+    (tmp_path / 't1_m2' / 't1_m2.json').write_text('{}')
+    failed = run_match.run_matches([('t1_m1', AGENT_PATHS), ('t1_m2', AGENT_PATHS)], STARTING_BOARD, tmp_path)
+    assert failed == [] and len(calls) == 4
+    assert get_game_result_files(tmp_path / 't1_m2') == []
+
+def test_task_line_ranges_select_their_matches(tmp_path, monkeypatch):
+    monkeypatch.setenv('C4LEAGUE_ROOT_DIR', str(Path(run_match.__file__).parent))
+    monkeypatch.setenv('AGENT_CONTAINER_DIRECTORY', '/opt')
+    from c4league.tournament_manager import TournamentManager
+
+    manager = TournamentManager.__new__(TournamentManager)
+    manager.tournament_id = 't1'
+    manager.matches_per_task = 3
+    manager.duration_aware = False
+    manager.duration_model = DurationModel(tmp_path / 'durations.json')
+    manager.predicted_match_seconds = {}
+    manager.match_format = MatchFormat()
+    manager.scheduled_matches = {}
+    manager.config_match_ids = []
+    manager.task_lines = []
+    manager.tournament_config_path = tmp_path / 't1.txt'
+    manager.task_file_path = tmp_path / 't1_tasks.txt'
+    manager.tournament_config_path.touch()
+    manager.task_file_path.touch()
+    players = [TournamentPlayer(f'team{i}', 'agent', '1') for i in range(4)]
+    matches = {f't1_m{i}': (players[i % 4], players[(i + 1) % 4]) for i in range(1, 10)}
+    # Two rounds of 7 and 2 matches: the last task of each round is partial
+    manager._schedule_matches(dict(list(matches.items())[:7]))
+    manager._schedule_matches(dict(list(matches.items())[7:]))
+
+    # The job script hands the task's line range to run_match.py, stood in for by a script printing its arguments
+    manager.root_dir = tmp_path / 'root'
+    manager.root_dir.mkdir()
+    (manager.root_dir / 'run_match.py').write_text('import json, sys\nprint("ARGS", json.dumps(sys.argv[1:]))\n')
+    manager.job_script_path = tmp_path / 't1.sh'
+    manager.logs_dir = tmp_path / 'logs'
+    manager.results_dir = tmp_path / 'results'
+    manager.done_dir = tmp_path / 'done'
+    manager.done_dir.mkdir()
+    manager.random_starting_board = STARTING_BOARD
+    script_path = manager._create_job_script()
+
+    task_match_ids = []
+    for task_id in range(1, manager._get_n_tasks() + 1):
+        output = subprocess.run(['bash', script_path], env={'PATH': f'{Path(sys.executable).parent}:/usr/bin:/bin',
+                                                            'SLURM_ARRAY_TASK_ID': str(task_id)},
+                                capture_output=True, text=True, check=True).stdout
+        argv = json.loads(next(line for line in output.splitlines() if line.startswith('ARGS '))[5:])
+        monkeypatch.setattr(sys, 'argv', ['run_match.py'] + argv)
+        args = run_match.parse_args()
+        task_match_ids.append([match_id for match_id, _ in
+                               run_match.read_match_config(Path(args.match_config), *args.lines)])
+    assert task_match_ids == [['t1_m1', 't1_m2', 't1_m3'], ['t1_m4', 't1_m5', 't1_m6'], ['t1_m7'],
+                              ['t1_m8', 't1_m9']]
+    assert (manager.done_dir / '4').read_text().strip() == '0'
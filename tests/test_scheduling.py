@@ -0,0 +1,41 @@
+import numpy as np
+from c4league.utils import TournamentPlayer
+from c4league.scheduling import DurationModel, DEFAULT_COSTS, pack_matches, predict_makespan
+from c4league.storage.stats import GameMetrics, GameStats
+from c4utils.c4_types import Move, Player
+
+SLOW, FAST = TournamentPlayer('team1', 'slow', '1'), TournamentPlayer('team2', 'fast', '3')
+
+
+def test_pack_matches_balances_tasks():
+    match_seconds = {'m1': 10., 'm2': 9., 'm3': 1., 'm4': 1.}
+    tasks = pack_matches(match_seconds, n_tasks=2, max_matches_per_task=2)
+    assert tasks == [['m1', 'm4'], ['m2', 'm3']]
+    task_seconds = [sum(match_seconds[match_id] for match_id in task) for task in tasks]
+    # Contiguous chunks in the original order would take 19s and 2s
+    assert predict_makespan(task_seconds) == 11.
+    assert predict_makespan(task_seconds, slots=1) == 21.
+    assert predict_makespan([5., 4., 3.], slots=2) == 7.
+
+def test_pack_matches_respects_task_size():
+    tasks = pack_matches({'m1': 100., 'm2': 1., 'm3': 1., 'm4': 1.}, n_tasks=2, max_matches_per_task=2)
+    assert sorted(len(task) for task in tasks) == [2, 2]
+
+def test_duration_model_learns_from_metrics(tmp_path):
+    model = DurationModel(tmp_path / 'durations.json')
+    assert model.get_costs(SLOW) == DEFAULT_COSTS
+    game = GameStats(game_id='t_m1_g1', match_id='t_m1', tournament_id='t', timestamp='2024-01-01-12:00:00',
+                     player1=SLOW, player2=FAST, initial_board=np.zeros((6, 7), dtype=Player),
+                     moves=[Move(3), Move(4), Move(3)], winner=None, reason='Draw', traceback=None,
+                     metrics=GameMetrics([2000, 10, 4000], [1000, None], [None, None], [None, None]))
+    assert model.update([game]) == 2
+    model.save()
+
+    model = DurationModel(tmp_path / 'durations.json')
+    assert model.get_costs(SLOW) == {'move_seconds': 3., 'moves_per_game': 2., 'startup_seconds': 1.}
+    # New versions keep the history, no startup time measured: the estimate at that point
+    assert model.get_costs(TournamentPlayer('team2', 'fast', '4'))['move_seconds'] == 0.01
+    assert model.get_costs(TournamentPlayer('team2', 'fast', '4'))['startup_seconds'] == 1.
+    # Unknown agents get the median of the known ones
+    assert model.get_costs(TournamentPlayer('team3', 'new', '1'))['move_seconds'] == np.median([3., 0.01])
+    assert model.predict_match_seconds(SLOW, FAST, warm_agents=True) > model.predict_match_seconds(FAST, FAST, True)
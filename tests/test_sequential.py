@@ -0,0 +1,55 @@
+import numpy as np
+from pathlib import Path
+import pytest
+import run_match
+from c4league.sequential import MatchFormat
+from c4league.storage.ingestion import load_match_games, load_match_stats
+from c4utils.c4_types import Move, PLAYER1, PLAYER2
+
+AGENT_PATHS = [Path('/opt/team1_strong_1.sif'), Path('/opt/team2_weak_1.sif')]
+STARTING_BOARD = np.zeros((6, 7), dtype=int)
+STARTING_BOARD[0, 3] = PLAYER1
+MOVES = [Move(0), Move(1), Move(0), Move(1), Move(0), Move(1), Move(0)]
+
+
+def _always_wins(name):
+    def play_match(agent1_path, agent2_path, move_timeout, initial_board):
+        return (PLAYER1 if agent1_path.name == name else PLAYER2), MOVES, None
+    return play_match
+
+def test_match_format():
+    with pytest.raises(ValueError):
+        MatchFormat(4, 7)
+    fixed = MatchFormat()
+    assert not fixed.is_sequential and fixed.min_games == fixed.max_games == 4
+    # log(19) / log(3): a lead of 3 points decides
+    assert 2 < MatchFormat(4, 12).decisive_lead < 3
+
+def test_lopsided_match_stops_early(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_match, 'play_match', _always_wins(AGENT_PATHS[0].name))
+    match_format = MatchFormat(4, 12)
+    (tmp_path / 't1_m1').mkdir()
+    run_match.run_match(AGENT_PATHS, STARTING_BOARD, tmp_path / 't1_m1', match_format=match_format)
+    [match_stats] = load_match_stats(tmp_path, ['t1_m1'], match_format=match_format)
+    assert len(match_stats.game_ids) == 4
+    assert sorted(match_stats.result.values()) == [0., 4.]
+    # Incomplete for a fixed format of more games
+    assert load_match_stats(tmp_path, ['t1_m1'], match_format=MatchFormat(6, 6)) == [None]
+
+def test_close_match_plays_all_games_on_distinct_boards(tmp_path, monkeypatch):
+    # The agent playing first always wins: even after every pair
+    monkeypatch.setattr(run_match, 'play_match', lambda *args, **kwargs: (PLAYER1, MOVES, None))
+    match_format = MatchFormat(4, 10)
+    (tmp_path / 't1_m1').mkdir()
+    run_match.run_match(AGENT_PATHS, STARTING_BOARD, tmp_path / 't1_m1', match_format=match_format)
+    games = load_match_games(tmp_path / 't1_m1')
+    assert len(games) == 10
+    boards = {np.asarray(game.initial_board).tobytes() for game in games}
+    assert len(boards) == 5
+    [match_stats] = load_match_stats(tmp_path, ['t1_m1'], match_format=match_format)
+    assert list(match_stats.result.values()) == [2., 2.]
+
+    # The same boards for every match and attempt
+    order = run_match.get_game_order(STARTING_BOARD, ['a', 'b'], 10)
+    assert [board.tobytes() for board, _ in order] == \
+        [board.tobytes() for board, _ in run_match.get_game_order(STARTING_BOARD, ['c', 'd'], 10)]
@@ -0,0 +1,50 @@
+import os
+import pytest
+from c4league.staging import AgentStage
+
+
+@pytest.fixture
+def agent(tmp_path):
+    sif_path = tmp_path / 'shared' / 'team1_agent_1.sif'
+    sif_path.parent.mkdir()
+    sif_path.write_bytes(os.urandom(100_000))
+    return sif_path
+
+def test_stage_copies_once_and_cleans_up(tmp_path, agent):
+    stage_dir = tmp_path / 'stage'
+    with AgentStage(stage_dir) as stage:
+        staged = stage.stage(agent)
+        assert staged.name == agent.name and staged.parent.parent == stage_dir
+        assert staged.read_bytes() == agent.read_bytes()
+        mtime_ns = staged.stat().st_mtime_ns
+        # Another process on the node reuses the copy
+        other = AgentStage(stage_dir)
+        assert other.stage(agent) == staged
+        assert staged.stat().st_mtime_ns == mtime_ns
+        assert stage.uses == 1 and other.uses == 1
+
+        # A rebuilt agent is staged again
+        agent.write_bytes(os.urandom(200_000))
+        rebuilt = stage.stage(agent)
+        assert rebuilt != staged and rebuilt.read_bytes() == agent.read_bytes()
+        # Still used by another (live) process when this one leaves
+        (stage_dir / '.users' / str(os.getppid())).touch()
+    assert rebuilt.exists()
+
+    (stage_dir / '.users' / str(os.getppid())).unlink()
+    # Users that died without leaving do not keep the stage
+    (stage_dir / '.users' / '999999999').touch()
+    with AgentStage(stage_dir):
+        pass
+    assert not rebuilt.exists() and not staged.exists()
+    assert [entry.name for entry in stage_dir.iterdir()] == ['.lock']
+
+def test_stage_falls_back_to_shared_copy(tmp_path, agent, monkeypatch):
+    with AgentStage(tmp_path / 'stage') as stage:
+        missing = agent.with_name('team2_agent_1.sif')
+        assert stage.stage(missing) == missing
+
+        # A copy that does not match the source is never used
+        monkeypatch.setattr('c4league.staging._hash_file', lambda path: 'corrupted')
+        assert stage.stage(agent) == agent
+        assert stage.uses == 0
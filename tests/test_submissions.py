@@ -0,0 +1,33 @@
+from c4league.storage.cloud_storage import BlobInfo
+from c4league.storage.submissions import SubmissionManifest, get_player_from_blob_name
+from c4league.utils import TournamentPlayer, get_superseded_agents
+
+
+def _blob(agent, version, generation, md5_hash, size=100):
+    return BlobInfo(f'submissions/team1/{agent}/{agent}_v{version}.zip', size, generation, md5_hash)
+
+def test_manifest_detects_changes_by_content(tmp_path):
+    manifest = SubmissionManifest(tmp_path / 'manifest.json')
+    blobs = [_blob('a', 1, '1', 'hash-a'), _blob('b', 1, '2', 'hash-b'), _blob('c', 2, '3', 'hash-c')]
+    assert len(manifest.diff(blobs).added) == 3
+    manifest.update(blobs)
+    manifest.save()
+
+    manifest = SubmissionManifest(tmp_path / 'manifest.json')
+    # a re-uploaded with identical content, b with different content, c deleted, d new
+    listing = [_blob('a', 1, '4', 'hash-a'), _blob('b', 1, '5', 'hash-b2'), _blob('d', 1, '6', 'hash-d')]
+    changes = manifest.diff(listing)
+    assert [blob.name for blob in changes.added] == ['submissions/team1/d/d_v1.zip']
+    assert [blob.name for blob in changes.modified] == ['submissions/team1/b/b_v1.zip']
+    assert changes.removed == ['submissions/team1/c/c_v2.zip']
+
+    manifest.update(listing)
+    manifest.remove(changes.removed)
+    assert len(manifest.diff(listing)) == 0
+
+def test_player_from_blob_name_and_superseded_agents():
+    assert get_player_from_blob_name('submissions/team1/agent1/agent1_v12.zip') == TournamentPlayer('team1', 'agent1', '12')
+    submitted = [TournamentPlayer('team1', 'agent1', '2'), TournamentPlayer('team2', 'agent1', '1')]
+    containerized = [TournamentPlayer('team1', 'agent1', '1'), TournamentPlayer('team2', 'agent1', '1'),
+                     TournamentPlayer('team3', 'agent1', '1')]
+    assert get_superseded_agents(submitted, containerized) == [TournamentPlayer('team1', 'agent1', '1')]
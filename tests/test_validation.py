@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from c4league.utils import TournamentPlayer
+from c4league.bitboard import replay_moves, generate_starting_boards
+from c4league.storage.stats import GameStats
+from c4league.storage.validation import validate_games
+from c4utils.c4_types import Move, Player, PLAYER1, PLAYER2, NO_PLAYER
+
+A, B = TournamentPlayer('team1', 'agent1', '1'), TournamentPlayer('team2', 'agent2', '1')
+
+def _random_game(rng, game_id, initial_board, fail_after=None):
+    """A consistent game record: random moves until the game ends, or a timeout after `fail_after` moves"""
+    board = initial_board.copy()
+    moves = []
+    while fail_after is None or len(moves) < fail_after:
+        player = PLAYER1 if len(moves) % 2 == 0 else PLAYER2
+        col = int(rng.choice(np.flatnonzero(board[-1, :] == NO_PLAYER)))
+        board[np.flatnonzero(board[:, col] == NO_PLAYER)[0], col] = player
+        moves.append(Move(col))
+        winner, _ = replay_moves(initial_board, moves)
+        if winner is not None or np.all(board != NO_PLAYER):
+            break
+    winner, _ = replay_moves(initial_board, moves)
+    if fail_after is not None and len(moves) == fail_after and winner is None:
+        reason = 'MoveTimeoutError'
+        winner_player = B if len(moves) % 2 == 0 else A
+    else:
+        reason = 'Connect 4' if winner is not None else 'Draw'
+        winner_player = {PLAYER1: A, PLAYER2: B}.get(winner)
+    return GameStats(game_id=game_id, match_id='t_m1', tournament_id='t', timestamp='2024-01-01-12:00:00',
+                     player1=A, player2=B, initial_board=initial_board, moves=moves, winner=winner_player,
+                     reason=reason, traceback=None)
+
+@pytest.fixture
+def games():
+    rng = np.random.default_rng(0)
+    boards = generate_starting_boards(100, rng=rng)
+    return [_random_game(rng, f'g{i}', boards[i], fail_after=3 if i % 10 == 0 else None) for i in range(100)]
+
+def test_consistent_games_are_valid(games):
+    assert validate_games(games) == {}
+
+def test_corrupted_games_are_flagged(games):
+    games[1].moves = games[1].moves + [Move(0)]
+    games[2].winner = B if games[2].winner == A else A
+    games[3].reason = 'Draw'
+    games[4].initial_board = games[4].initial_board.copy()
+    games[4].initial_board[-1, 0] = PLAYER1
+    full_column = int(np.flatnonzero(np.sum(games[5].initial_board != NO_PLAYER, axis=0) == 0)[0])
+    games[5].moves = [Move(full_column)] * 7
+    games[10].winner = A if games[10].winner == B else B    # a timeout, the agent to move must lose
+
+    problems = validate_games(games)
+    assert set(problems) == {'g1', 'g2', 'g3', 'g4', 'g5', 'g10'}
+    assert problems['g1'] == ['1 moves recorded after the end of the game'] or \
+        problems['g1'][0].startswith('Illegal move')
+    assert any('Winner' in problem for problem in problems['g2'])
+    assert any('Reason Draw' in problem for problem in problems['g3'])
+    assert problems['g4'] == ['Impossible initial board: floating stones']
+    assert problems['g5'][0].startswith('Illegal move')
+    assert any('Winner' in problem for problem in problems['g10'])
+
+def test_startup_failure_of_either_agent_is_valid():
+    board = np.zeros((6, 7), dtype=Player)
+    games = [GameStats(game_id=f'g{i}', match_id='t_m1', tournament_id='t', timestamp='2024-01-01-12:00:00',
+                       player1=A, player2=B, initial_board=board, moves=[], winner=winner,
+                       reason='AgentRuntimeError', traceback=None)
+             for i, winner in enumerate([A, B])]
+    assert validate_games(games) == {}
+    games[0].reason = 'Connect 4'
+    assert list(validate_games(games)) == ['g0']